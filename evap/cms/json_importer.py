@@ -1,16 +1,18 @@
 import json
 import logging
 import re
-from collections.abc import Collection, Iterable
-from dataclasses import dataclass, field
+from collections import defaultdict
+from collections.abc import Callable, Collection, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
 from datetime import date, datetime, timedelta
 from datetime import time as datetime_time
-from typing import Any, NotRequired
+from itertools import batched
+from typing import Any, NotRequired, TextIO
 
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.db import transaction
-from django.db.models import Min
 from django.utils.timezone import now
 from pydantic import TypeAdapter
 from typing_extensions import TypedDict
@@ -31,7 +33,7 @@ from evap.evaluation.models import (
     UserProfile,
 )
 from evap.evaluation.tools import clean_email
-from evap.staff.tools import update_or_create_with_changes, update_with_changes
+from evap.staff.tools import update_with_changes
 
 logger = logging.getLogger(__name__)
 
@@ -95,6 +97,116 @@ class ImportDict(TypedDict):
 
 
 import_dict_adapter = TypeAdapter(ImportDict)
+import_students_adapter = TypeAdapter(list[ImportStudent])
+import_lecturers_adapter = TypeAdapter(list[ImportLecturer])
+import_events_adapter = TypeAdapter(list[ImportEvent])
+
+
+class JSONArrayStreamReader:
+    """Incrementally reads a JSON object whose values are arrays, e.g. `{"a": [1, 2], "b": []}`.
+
+    Iterating yields a `(key, items)` tuple for each array in the given keys, where `items` lazily decodes the array
+    elements from the file. Values of other keys are skipped. Only the current read buffer and the current element
+    are kept in memory.
+    """
+
+    WHITESPACE = re.compile(r"[ \t\n\r]*")
+    NUMBER_CHARACTERS = re.compile(r"[0-9.eE+-]*")
+    # the parts of a number or a \uXXXX escape at the end of the buffer that a decoding error can point to
+    CUT_OFF_TOKEN = re.compile(r"[0-9.eE+-]*|u[0-9a-fA-F]{0,4}")
+    LITERALS = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+
+    def __init__(self, file: TextIO, keys: Collection[str], read_size: int = 1024 * 1024) -> None:
+        self.file = file
+        self.keys = keys
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self) -> bool:
+        if self.eof:
+            return False
+        data = self.file.read(self.read_size)
+        self.buffer = self.buffer[self.pos :] + data
+        self.pos = 0
+        self.eof = not data
+        return not self.eof
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character without consuming it, or "" at the end of the file."""
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()  # type: ignore[union-attr]
+            if self.pos < len(self.buffer) or not self._read():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def _expect(self, expected: str) -> str:
+        char = self._peek()
+        if char not in expected:
+            raise json.JSONDecodeError(f"Expecting one of {expected!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def _is_cut_off(self, error: json.JSONDecodeError) -> bool:
+        """Whether the value failed to decode only because it continues in the next part of the file."""
+        if error.msg.startswith("Unterminated string"):
+            return True
+        rest = self.buffer[error.pos :]
+        return bool(self.CUT_OFF_TOKEN.fullmatch(rest)) or any(literal.startswith(rest) for literal in self.LITERALS)
+
+    def _decode_value(self) -> Any:
+        self._peek()
+        buffered_length = len(self.buffer) - self.pos
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if not self._is_cut_off(e) or not self._read():
+                    raise
+                # read at least as much as was buffered, so that a long value is decoded a logarithmic number of times
+                while len(self.buffer) < 2 * buffered_length and self._read():
+                    pass
+                buffered_length = len(self.buffer)
+                continue
+            # a number might continue in the next part of the file
+            if isinstance(value, int | float) and self.NUMBER_CHARACTERS.fullmatch(self.buffer, end) and self._read():
+                continue
+            self.pos = end
+            return value
+
+    def _iter_array(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._decode_value()
+            if self._expect(",]") == "]":
+                return
+
+    def __iter__(self) -> Iterator[tuple[str, Iterator[Any]]]:
+        self._expect("{")
+        if self._peek() != "}":
+            while True:
+                key = self._decode_value()
+                if not isinstance(key, str):
+                    raise json.JSONDecodeError("Expecting property name", self.buffer, self.pos)
+                self._expect(":")
+                if key in self.keys:
+                    items = self._iter_array()
+                    yield key, items
+                    # skip elements the caller did not consume
+                    for __ in items:
+                        pass
+                else:
+                    self._decode_value()
+                if self._expect(",}") == "}":
+                    break
+        else:
+            self.pos += 1
+        if self._peek():
+            raise json.JSONDecodeError("Extra data", self.buffer, self.pos)
 
 
 @dataclass
@@ -144,6 +256,14 @@ class ImportStatistics:
         log += "\n"
         return log
 
+    def update(self, other: "ImportStatistics") -> None:
+        for statistics_field in fields(self):
+            value = getattr(self, statistics_field.name)
+            if isinstance(value, set):
+                value.update(getattr(other, statistics_field.name))
+            else:
+                value.extend(getattr(other, statistics_field.name))
+
     def get_log(self) -> str:
         log = self._make_heading("JSON IMPORTER REPORT", "=")
         log += "\n"
@@ -228,31 +348,140 @@ class ImportCache[T: (CourseType, ExamType, Program)]:
         return obj
 
 
+class ImportIndex:
+    """A helper class for looking up existing objects linked to the imported events by their gguids.
+
+    Fetches the links, ignored evaluations, linked evaluations and some attributes of all evaluations in the linked
+    courses up front, so that importing an event needs dictionary lookups instead of database queries.
+    """
+
+    def __init__(self, gguids: Collection[str]) -> None:
+        self.ignored_cms_ids: set[str] = set(
+            IgnoredEvaluation.objects.filter(cms_id__in=gguids).values_list("cms_id", flat=True)
+        )
+        self.course_links_by_cms_id: dict[str, CourseLink] = {
+            course_link.cms_id: course_link
+            for course_link in CourseLink.objects.filter(cms_id__in=gguids)
+            .select_related("course")
+            .prefetch_related("course__programs")
+        }
+
+        self.evaluation_links_by_cms_id: dict[str, EvaluationLink] = {}
+        self.evaluations_by_course_id: dict[int, dict[int, Evaluation]] = defaultdict(dict)
+        self.editor_ids_by_evaluation_id: dict[int, set[int]] = defaultdict(set)
+        evaluations = Evaluation.objects.filter(cms_evaluation_links__cms_id__in=gguids).distinct()
+        for evaluation in evaluations.select_related("exam_type").prefetch_related(
+            "cms_evaluation_links", "participants"
+        ):
+            # all links of a merged evaluation share the same evaluation instance
+            for evaluation_link in evaluation.cms_evaluation_links.all():
+                self.add_evaluation_link(evaluation_link)
+
+        editor_contributions = Contribution.objects.filter(
+            evaluation__cms_evaluation_links__cms_id__in=gguids,
+            role=Contribution.Role.EDITOR,
+            textanswer_visibility=Contribution.TextAnswerVisibility.GENERAL_TEXTANSWERS,
+        ).values_list("evaluation_id", "contributor_id")
+        for evaluation_id, contributor_id in editor_contributions:
+            self.editor_ids_by_evaluation_id[evaluation_id].add(contributor_id)
+
+        self.exam_vote_start_datetimes_by_course_id: dict[int, dict[int, datetime]] = defaultdict(dict)
+        self.wait_for_grade_upload_by_course_id: dict[int, dict[int, bool]] = defaultdict(dict)
+        course_evaluations = Evaluation.objects.filter(course__cms_course_links__cms_id__in=gguids).values_list(
+            "course_id", "id", "exam_type_id", "vote_start_datetime", "wait_for_grade_upload_before_publishing"
+        )
+        for course_id, evaluation_id, exam_type_id, vote_start_datetime, wait_for_grade_upload in course_evaluations:
+            if exam_type_id is not None:
+                self.exam_vote_start_datetimes_by_course_id[course_id][evaluation_id] = vote_start_datetime
+            self.wait_for_grade_upload_by_course_id[course_id][evaluation_id] = wait_for_grade_upload
+
+    def is_ignored(self, cms_id: str) -> bool:
+        return cms_id in self.ignored_cms_ids
+
+    def has_inactive_evaluation_link(self, cms_id: str) -> bool:
+        evaluation_link = self.evaluation_links_by_cms_id.get(cms_id)
+        return evaluation_link is not None and not evaluation_link.is_active
+
+    def get_linked_evaluation(self, course: Course, cms_id: str) -> Evaluation | None:
+        evaluation_link = self.evaluation_links_by_cms_id.get(cms_id)
+        if evaluation_link is None or evaluation_link.evaluation.course_id != course.id:
+            return None
+        return evaluation_link.evaluation
+
+    def add_evaluation_link(self, evaluation_link: EvaluationLink) -> None:
+        evaluation = evaluation_link.evaluation
+        self.evaluation_links_by_cms_id[evaluation_link.cms_id] = evaluation_link
+        self.evaluations_by_course_id[evaluation.course_id][evaluation.id] = evaluation
+
+    def is_editor(self, evaluation: Evaluation, user_profile: UserProfile) -> bool:
+        return user_profile.id in self.editor_ids_by_evaluation_id[evaluation.id]
+
+    def add_editor(self, evaluation: Evaluation, user_profile: UserProfile) -> None:
+        self.editor_ids_by_evaluation_id[evaluation.id].add(user_profile.id)
+
+    def get_min_exam_vote_start_datetime(self, course: Course) -> datetime | None:
+        return min(self.exam_vote_start_datetimes_by_course_id[course.id].values(), default=None)
+
+    def has_other_wait_for_grade_upload(self, course: Course, wait_for_grade_upload: bool) -> bool:
+        return any(
+            value != wait_for_grade_upload for value in self.wait_for_grade_upload_by_course_id[course.id].values()
+        )
+
+    def set_wait_for_grade_upload(
+        self, course: Course, wait_for_grade_upload: bool, exclude: Evaluation | None = None
+    ) -> None:
+        """Update the index and the linked evaluations (except `exclude`) after all evaluations of the course were
+        updated."""
+        values = self.wait_for_grade_upload_by_course_id[course.id]
+        for evaluation_id in values:
+            values[evaluation_id] = wait_for_grade_upload
+        for evaluation in self.evaluations_by_course_id[course.id].values():
+            if evaluation != exclude:
+                evaluation.wait_for_grade_upload_before_publishing = wait_for_grade_upload
+
+    def update_evaluation(self, evaluation: Evaluation) -> None:
+        vote_start_datetimes = self.exam_vote_start_datetimes_by_course_id[evaluation.course_id]
+        if evaluation.exam_type_id is not None:
+            vote_start_datetimes[evaluation.id] = evaluation.vote_start_datetime
+        else:
+            vote_start_datetimes.pop(evaluation.id, None)
+        self.wait_for_grade_upload_by_course_id[evaluation.course_id][evaluation.id] = (
+            evaluation.wait_for_grade_upload_before_publishing
+        )
+
+
 # pylint: disable=too-many-instance-attributes
 class JSONImporter:
     DATETIME_FORMAT = "%d.%m.%Y %H:%M:%S"
     MIDNIGHT = datetime_time()
+    BULK_BATCH_SIZE = 1000
 
-    def __init__(self, semester: Semester, default_course_end: date) -> None:
+    def __init__(self, semester: Semester, default_course_end: date, chunk_size: int | None = None) -> None:
         self.semester = semester
         self.default_course_end = default_course_end
+        # in chunked mode, each chunk of at most chunk_size items is committed in its own transaction
+        self.chunk_size = chunk_size
+        self.committed_chunk_count = 0
         self.users_by_gguid: dict[str, UserProfile] = {}
         self.course_type_cache = ImportCache(CourseType)
         self.exam_type_cache = ImportCache(ExamType)
         self.program_cache = ImportCache(Program)
         self.statistics = ImportStatistics()
 
-        # raw events
-        self.events_by_gguid: dict[str, ImportEvent] = {}
+        # the few fields of the raw events that are needed across events, populated in _import_events
+        self.event_languages_by_gguid: dict[str, str] = {}
+        self.event_students_by_gguid: dict[str, list[ImportRelated]] = {}
         # events already parsed as courses
         self.courses_by_gguid: dict[str, Course] = {}
+        # existing objects linked to the events, populated in _import_events
+        self.import_index = ImportIndex([])
 
-    def get_main_evaluation_data(self, exam_event: ImportEvent) -> ImportEvent:
+    def get_main_evaluation_gguid(self, exam_event: ImportEvent) -> str:
         # Exam events have the non-exam event (its main evaluation) as a single entry in the relatedevents list
 
         # expects exam evaluation as input
         assert len(exam_event["relatedevents"]) == 1
-        return self.events_by_gguid[exam_event["relatedevents"][0]["gguid"]]
+        return exam_event["relatedevents"][0]["gguid"]
 
     def _extract_number_in_name(self, name: str, wanted_name: str) -> int | None:
         if not name.startswith(wanted_name):
@@ -309,7 +538,50 @@ class JSONImporter:
         )
         self.statistics.name_changes.append(change)
 
+    def _import_user_profiles(self, entries: list[tuple[str, str, dict[str, str]]]) -> None:
+        """Create or update the user profiles for the given (gguid, email, defaults) entries.
+
+        Behaves like an update_or_create with change tracking for each entry in order, but uses one query to fetch the
+        existing user profiles and bulk queries to write them back.
+        """
+        user_profiles_by_email = {
+            user_profile.email: user_profile
+            for user_profile in UserProfile.objects.filter(email__in={entry[1] for entry in entries})
+        }
+        new_user_profiles_by_email: dict[str, UserProfile] = {}
+        changed_user_profiles_by_email: dict[str, UserProfile] = {}
+        changed_fields: set[str] = set()
+
+        for gguid, email, defaults in entries:
+            if email not in user_profiles_by_email:
+                user_profile = UserProfile(email=email, **defaults)
+                user_profiles_by_email[email] = user_profile
+                new_user_profiles_by_email[email] = user_profile
+            else:
+                user_profile = user_profiles_by_email[email]
+                changes = {
+                    key: (getattr(user_profile, key), value)
+                    for key, value in defaults.items()
+                    if getattr(user_profile, key) != value
+                }
+                if changes:
+                    for key, (__, value) in changes.items():
+                        setattr(user_profile, key, value)
+                    if email not in new_user_profiles_by_email:
+                        changed_user_profiles_by_email[email] = user_profile
+                        changed_fields.update(changes)
+                    self._create_name_change_from_changes(user_profile, changes)
+
+            self.users_by_gguid[gguid] = user_profile
+
+        UserProfile.objects.bulk_create(new_user_profiles_by_email.values(), batch_size=self.BULK_BATCH_SIZE)
+        if changed_user_profiles_by_email:
+            UserProfile.objects.bulk_update(
+                changed_user_profiles_by_email.values(), sorted(changed_fields), batch_size=self.BULK_BATCH_SIZE
+            )
+
     def _import_students(self, data: list[ImportStudent]) -> None:
+        entries = []
         for entry in data:
             email = clean_email(entry["email"])
             first_name_given = _clean_whitespaces_and_hyphens(self._get_first_name_given(entry))
@@ -322,17 +594,12 @@ class JSONImporter:
                 if email in settings.IGNORE_USERS:
                     continue
 
-                user_profile, __, changes = update_or_create_with_changes(
-                    UserProfile,
-                    email=email,
-                    defaults={"last_name": last_name, "first_name_given": first_name_given},
-                )
-                if changes:
-                    self._create_name_change_from_changes(user_profile, changes)
+                entries.append((entry["gguid"], email, {"last_name": last_name, "first_name_given": first_name_given}))
 
-                self.users_by_gguid[entry["gguid"]] = user_profile
+        self._import_in_chunks(entries, self._import_user_profiles)
 
     def _import_lecturers(self, data: list[ImportLecturer]) -> None:
+        entries = []
         for entry in data:
             email = clean_email(entry["email"])
             first_name_given = _clean_whitespaces_and_hyphens(entry["christianname"])
@@ -348,19 +615,19 @@ class JSONImporter:
                 if email in settings.IGNORE_USERS:
                     continue
 
-                user_profile, __, changes = update_or_create_with_changes(
-                    UserProfile,
-                    email=email,
-                    defaults={
-                        "last_name": last_name,
-                        "first_name_given": first_name_given,
-                        "title": _clean_whitespaces_and_hyphens(entry["titlefront"]),
-                    },
+                entries.append(
+                    (
+                        entry["gguid"],
+                        email,
+                        {
+                            "last_name": last_name,
+                            "first_name_given": first_name_given,
+                            "title": _clean_whitespaces_and_hyphens(entry["titlefront"]),
+                        },
+                    )
                 )
-                if changes:
-                    self._create_name_change_from_changes(user_profile, changes)
 
-                self.users_by_gguid[entry["gguid"]] = user_profile
+        self._import_in_chunks(entries, self._import_user_profiles)
 
     def _import_course(self, data: ImportEvent, course_type: CourseType | None = None) -> Course | None:
         course_type = self.course_type_cache.get(data["type"]) if course_type is None else course_type
@@ -377,8 +644,8 @@ class JSONImporter:
         if not data["title_en"]:
             data["title_en"] = data["title"]
 
-        try:
-            cms_course_link = CourseLink.objects.get(cms_id=data["gguid"])
+        cms_course_link = self.import_index.course_links_by_cms_id.get(data["gguid"])
+        if cms_course_link is not None:
             if cms_course_link.is_active:
                 course = cms_course_link.course
                 changes = update_with_changes(
@@ -390,7 +657,7 @@ class JSONImporter:
                 )
                 if changes:
                     self.statistics.updated_courses.append(course)
-        except CourseLink.DoesNotExist:
+        else:
             course = Course.objects.create(
                 semester=self.semester,
                 name_de=_clean_whitespaces_and_hyphens(data["title"]),
@@ -403,7 +670,9 @@ class JSONImporter:
             responsibles = self._get_users_with_longest_title(responsibles)
             course.responsibles.set(responsibles)
 
-            CourseLink.objects.create(course=course, cms_id=data["gguid"])
+            self.import_index.course_links_by_cms_id[data["gguid"]] = CourseLink.objects.create(
+                course=course, cms_id=data["gguid"]
+            )
             self.statistics.new_courses.append(course)
 
         self.courses_by_gguid[data["gguid"]] = course
@@ -422,7 +691,9 @@ class JSONImporter:
 
             programs = [self.program_cache.get(c) for c in program_import_names]
 
-            course.programs.add(*programs)
+            existing_programs = set(course.programs.all())
+            if any(program not in existing_programs for program in programs):
+                course.programs.add(*programs)
 
     def _import_course_from_unused_exam(self, data: ImportEvent) -> Course | None:
         try:
@@ -437,17 +708,14 @@ class JSONImporter:
         self, course: Course, data: ImportEvent, earliest_exam_date: date | None = None
     ) -> Evaluation | None:
         # Don't import ignored evaluations again
-        if IgnoredEvaluation.objects.filter(cms_id=data["gguid"]).exists():
+        if self.import_index.is_ignored(data["gguid"]):
             return None
 
         # Skip evaluations with inactive link
-        if EvaluationLink.objects.filter(cms_id=data["gguid"], is_active=False).exists():
+        if self.import_index.has_inactive_evaluation_link(data["gguid"]):
             return None
 
-        try:
-            evaluation = Evaluation.objects.get(course=course, cms_evaluation_links__cms_id=data["gguid"])
-        except Evaluation.DoesNotExist:
-            evaluation = None
+        evaluation = self.import_index.get_linked_evaluation(course, data["gguid"])
 
         if "appointments" not in data or not data["appointments"]:
             course_info = f"{course.name} ({course.type})"
@@ -492,12 +760,14 @@ class JSONImporter:
             else:
                 wait_for_grade_upload_before_publishing = any(grade["scale"] for grade in data["courses"])
 
-            if course.evaluations.exclude(
-                wait_for_grade_upload_before_publishing=wait_for_grade_upload_before_publishing
-            ).exists():
+            if self.import_index.has_other_wait_for_grade_upload(course, wait_for_grade_upload_before_publishing):
                 course.evaluations.all().update(
                     wait_for_grade_upload_before_publishing=wait_for_grade_upload_before_publishing
                 )
+                # the imported evaluation keeps its old value, so that the change is detected and reported below
+                self.import_index.set_wait_for_grade_upload(
+                    course, wait_for_grade_upload_before_publishing, exclude=evaluation
+                )
 
             is_rewarded = False
         else:
@@ -545,8 +815,8 @@ class JSONImporter:
 
         main_language = LANGUAGE_MAP.get(data["language"], Evaluation.UNDECIDED_MAIN_LANGUAGE)
         if main_language == Evaluation.UNDECIDED_MAIN_LANGUAGE and data["isexam"]:
-            related_main_evaluation = self.get_main_evaluation_data(data)
-            main_language = LANGUAGE_MAP.get(related_main_evaluation["language"], Evaluation.UNDECIDED_MAIN_LANGUAGE)
+            related_main_language = self.event_languages_by_gguid[self.get_main_evaluation_gguid(data)]
+            main_language = LANGUAGE_MAP.get(related_main_language, Evaluation.UNDECIDED_MAIN_LANGUAGE)
 
         if main_language == Evaluation.UNDECIDED_MAIN_LANGUAGE and not evaluation:
             self.statistics.warnings.append(
@@ -561,9 +831,7 @@ class JSONImporter:
             cms_ids = [cms_evaluation_link.cms_id for cms_evaluation_link in evaluation.cms_evaluation_links.all()]
             student_data = []
             for cms_id in cms_ids:
-                event = self.events_by_gguid[cms_id]
-                if "students" in event:
-                    student_data.extend(event["students"])
+                student_data.extend(self.event_students_by_gguid[cms_id])
         else:
             student_data = data["students"] if "students" in data else []
         participants = self._get_user_profiles(student_data) if student_data else []
@@ -587,7 +855,9 @@ class JSONImporter:
                 name_en=name_en,
                 **defaults,
             )
-            EvaluationLink.objects.create(evaluation=evaluation, cms_id=data["gguid"])
+            self.import_index.add_evaluation_link(
+                EvaluationLink.objects.create(evaluation=evaluation, cms_id=data["gguid"])
+            )
 
         # Only allow changes for new evaluations and if they have not more than one evaluation link
         # Otherwise, data may already have been changed or be ambiguous
@@ -620,76 +890,66 @@ class JSONImporter:
             self.statistics.warnings.append(WarningMessage(obj=evaluation.full_name, message="No contributors defined"))
         elif allow_contributor_changes:
             for lecturer in data["lecturers"]:
-                __, lecturer_created = self._import_contribution(evaluation, lecturer)
-                any_lecturers_changed |= lecturer_created
+                any_lecturers_changed |= self._import_contribution(evaluation, lecturer)
         if any_lecturers_changed and not created:
             self.statistics.updated_evaluations.add(evaluation)
 
         if created:
             self.statistics.new_evaluations.append(evaluation)
 
+        self.import_index.update_evaluation(evaluation)
         return evaluation
 
-    def _import_contribution(self, evaluation: Evaluation, data: ImportRelated) -> tuple[Contribution | None, bool]:
+    def _import_contribution(self, evaluation: Evaluation, data: ImportRelated) -> bool:
+        """Make the lecturer an editor of the evaluation and return whether a new contribution was created."""
         if data["gguid"] not in self.users_by_gguid:
-            return None, False
+            return False
 
         user_profile = self.users_by_gguid[data["gguid"]]
 
         if user_profile.email in settings.NON_RESPONSIBLE_USERS:
-            return None, False
+            return False
+
+        if self.import_index.is_editor(evaluation, user_profile):
+            return False
 
-        contribution, created = Contribution.objects.update_or_create(
+        __, created = Contribution.objects.update_or_create(
             evaluation=evaluation,
             contributor=user_profile,
             role=Contribution.Role.EDITOR,
             textanswer_visibility=Contribution.TextAnswerVisibility.GENERAL_TEXTANSWERS,
         )
-        return contribution, created
-
-    def _import_events(self, data: list[ImportEvent]) -> None:  # noqa:PLR0912
-        # Divide in multiple lists to handle individually
-        non_exam_events, exam_events, exam_events_without_related_non_exam_event = [], [], []
-        for event in data:
-            self.events_by_gguid[event["gguid"]] = event
-            if not event["isexam"]:
-                non_exam_events.append(event)
-            elif event.get("relatedevents"):
-                exam_events.append(event)
-            else:
-                exam_events_without_related_non_exam_event.append(event)
+        self.import_index.add_editor(evaluation, user_profile)
+        return created
 
-        # Only import courses in first step, don't create evaluations yet
+    def _import_courses(self, non_exam_events: Iterable[ImportEvent]) -> None:
         for event in non_exam_events:
-            course = self._import_course(event)
+            self._import_course(event)
 
+    def _import_exam_evaluations(self, exam_events: Iterable[ImportEvent]) -> None:
         for event in exam_events:
             # We lookup the Course from the main evaluation to add the exam evaluation to the same Course
 
             # Don't import if course was skipped
-            course = self.courses_by_gguid.get(self.get_main_evaluation_data(event)["gguid"])
+            course = self.courses_by_gguid.get(self.get_main_evaluation_gguid(event))
             if course is None:
                 continue
 
             self._import_course_programs(course, event)
             self._import_evaluation(course, event)
 
-        # Now import main evaluations
+    def _import_main_evaluations(self, non_exam_events: Iterable[ImportEvent]) -> None:
         for event in non_exam_events:
             course = self.courses_by_gguid.get(event["gguid"])
             if course is not None:
-                min_vote_start_datetime = course.evaluations.filter(exam_type__isnull=False).aggregate(
-                    Min("vote_start_datetime")
-                )["vote_start_datetime__min"]
+                min_vote_start_datetime = self.import_index.get_min_exam_vote_start_datetime(course)
                 earliest_exam_date = (
                     min_vote_start_datetime.date() - timedelta(days=1) if min_vote_start_datetime else None
                 )
                 self._import_evaluation(course, event, earliest_exam_date=earliest_exam_date)
 
-        # Handle exam events that exist on their own without a related non-exam event
-        # They can be handled like non-exam events if they have a prefix existing in CourseType import names,
-        # this replaces the necessary CourseType information otherwise defined in non-exam events
-        for event in exam_events_without_related_non_exam_event:
+    def _import_exam_events_without_related_non_exam_event(self, exam_events: Iterable[ImportEvent]) -> None:
+        for event in exam_events:
             course_from_unused_exam = self._import_course_from_unused_exam(event)
             if not course_from_unused_exam:
                 self.statistics.warnings.append(
@@ -700,14 +960,151 @@ class JSONImporter:
             self._import_course_programs(course_from_unused_exam, event)
             self._import_evaluation(course_from_unused_exam, event)
 
-    @transaction.atomic
-    def import_dict(self, data: dict) -> None:
-        validated_data = import_dict_adapter.validate_python(data, strict=True)
+    def _import_events(self, read_events: Callable[[], Iterable[ImportEvent]]) -> None:
+        """Import the events in several passes, each calling read_events to iterate over all events again.
+
+        Only the languages of all events and the students of events linked to merged evaluations are kept between the
+        passes, so that the events can be read from a file one at a time.
+        """
+        for event in read_events():
+            self.event_languages_by_gguid[event["gguid"]] = event["language"]
+        self.import_index = ImportIndex(list(self.event_languages_by_gguid))
+
+        # the participants of merged evaluations are collected from all linked events
+        merged_cms_ids = {
+            cms_id
+            for cms_id, evaluation_link in self.import_index.evaluation_links_by_cms_id.items()
+            if len(evaluation_link.evaluation.cms_evaluation_links.all()) > 1
+        }
+        if merged_cms_ids:
+            for event in read_events():
+                if event["gguid"] in merged_cms_ids:
+                    self.event_students_by_gguid[event["gguid"]] = event.get("students", [])
+
+        def non_exam_events() -> Iterator[ImportEvent]:
+            return (event for event in read_events() if not event["isexam"])
+
+        def exam_events() -> Iterator[ImportEvent]:
+            return (event for event in read_events() if event["isexam"] and event.get("relatedevents"))
+
+        def exam_events_without_related_non_exam_event() -> Iterator[ImportEvent]:
+            return (event for event in read_events() if event["isexam"] and not event.get("relatedevents"))
+
+        # Only import courses in first step, don't create evaluations yet
+        self._import_events_in_chunks(non_exam_events(), self._import_courses)
+        self._import_events_in_chunks(exam_events(), self._import_exam_evaluations)
+        # Now import main evaluations
+        self._import_events_in_chunks(non_exam_events(), self._import_main_evaluations)
+        # Handle exam events that exist on their own without a related non-exam event
+        # They can be handled like non-exam events if they have a prefix existing in CourseType import names,
+        # this replaces the necessary CourseType information otherwise defined in non-exam events
+        self._import_events_in_chunks(
+            exam_events_without_related_non_exam_event(), self._import_exam_events_without_related_non_exam_event
+        )
 
-        self._import_students(validated_data["students"])
-        self._import_lecturers(validated_data["lecturers"])
-        self._import_events(validated_data["events"])
+    def _import_events_in_chunks(
+        self, events: Iterable[ImportEvent], import_function: Callable[[list[ImportEvent]], None]
+    ) -> None:
+        # the events of a pass are taken in batches, so that they are never all kept in memory at once
+        for batch in batched(events, self.chunk_size or self.BULK_BATCH_SIZE, strict=False):
+            self._import_in_chunks(list(batch), import_function)
+
+    def _import_in_chunks[T](self, items: list[T], import_function: Callable[[list[T]], None]) -> None:
+        """Import all items at once, or in chunked mode, in chunks that are each committed in their own transaction.
+
+        The import of each item is idempotent, because the imported objects are identified by their gguid links or
+        email addresses, so an import that failed in chunked mode can be resumed by running it again.
+        """
+        if self.chunk_size is None:
+            import_function(items)
+            return
+
+        for chunk in batched(items, self.chunk_size, strict=False):
+            # statistics of a chunk are only kept if the chunk is committed
+            statistics, self.statistics = self.statistics, ImportStatistics()
+            try:
+                with transaction.atomic():
+                    import_function(list(chunk))
+                statistics.update(self.statistics)
+            finally:
+                self.statistics = statistics
+            self.committed_chunk_count += 1
+            logger.info("Committed chunk %d (%s).", self.committed_chunk_count, import_function.__name__)
+
+    @contextmanager
+    def _import_transaction(self) -> Iterator[None]:
+        """Run the whole import in one transaction, or in chunked mode, report the committed chunks on failure."""
+        if self.chunk_size is None:
+            with transaction.atomic():
+                yield
+                self.statistics.send_mail()
+            return
+
+        try:
+            yield
+        except Exception as e:
+            self.statistics.warnings.append(
+                WarningMessage(
+                    obj="Import",
+                    message=f"Aborted after {self.committed_chunk_count} committed chunks, run the import again to resume: {e!r}",
+                )
+            )
+            self.statistics.send_mail()
+            raise
         self.statistics.send_mail()
 
+    def import_dict(self, data: dict) -> None:
+        with self._import_transaction():
+            validated_data = import_dict_adapter.validate_python(data, strict=True)
+
+            self._import_students(validated_data["students"])
+            self._import_lecturers(validated_data["lecturers"])
+            self._import_events(lambda: validated_data["events"])
+
     def import_json(self, data: str) -> None:
         self.import_dict(json.loads(data))
+
+    def import_json_file(self, file: TextIO) -> None:
+        """Import JSON data like import_json, but read and validate the file incrementally.
+
+        Students and lecturers are imported in batches while reading the file. Lecturers appearing before students in
+        the file are buffered to keep the import order of import_dict. The events are skipped in this first pass and
+        read again in each pass of _import_events, so the file must be seekable.
+        """
+        with self._import_transaction():
+            start = file.tell()
+            imported_keys = set()
+            buffered_lecturers: list[ImportLecturer] = []
+
+            for key, items in JSONArrayStreamReader(file, ImportDict.__annotations__.keys()):
+                if key in imported_keys:
+                    raise ValueError(f"Duplicate key {key!r} in import data")
+                imported_keys.add(key)
+                if key == "events":
+                    # the reader skips the events, they are read in the passes of _import_events
+                    continue
+                for chunk_tuple in batched(items, self.BULK_BATCH_SIZE, strict=False):
+                    chunk = list(chunk_tuple)
+                    match key:
+                        case "students":
+                            self._import_students(import_students_adapter.validate_python(chunk, strict=True))
+                        case "lecturers":
+                            lecturers = import_lecturers_adapter.validate_python(chunk, strict=True)
+                            if "students" in imported_keys:
+                                self._import_lecturers(lecturers)
+                            else:
+                                buffered_lecturers.extend(lecturers)
+                if key == "students" and buffered_lecturers:
+                    self._import_lecturers(buffered_lecturers)
+                    buffered_lecturers = []
+
+            # raises a validation error for missing keys
+            import_dict_adapter.validate_python({key: [] for key in imported_keys}, strict=True)
+
+            def read_events() -> Iterator[ImportEvent]:
+                file.seek(start)
+                for __, items in JSONArrayStreamReader(file, ["events"]):
+                    for chunk in batched(items, self.BULK_BATCH_SIZE, strict=False):
+                        yield from import_events_adapter.validate_python(list(chunk), strict=True)
+
+            self._import_events(read_events)
@@ -1,8 +1,11 @@
 import argparse
 import logging
+import resource
 import urllib.parse
 from datetime import datetime
 from pathlib import Path
+from tempfile import TemporaryFile
+from typing import TextIO
 
 import requests
 from django.core.management.base import BaseCommand, CommandError
@@ -15,15 +18,60 @@ logger = logging.getLogger(__name__)
 
 RETRIES = 3
 TIMEOUT = 120
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 def parse_course_end_date(date_str) -> datetime:
     return datetime.strptime(date_str, "%Y-%m-%d")
 
 
+def download(url: str) -> str | None:
+    for _ in range(RETRIES):
+        try:
+            return requests.get(url, timeout=TIMEOUT).text
+        except requests.exceptions.Timeout:
+            logger.warning("Download timed out: %s", url)
+    return None
+
+
+def download_to_file(url: str, file: TextIO) -> bool:
+    for _ in range(RETRIES):
+        file.seek(0)
+        file.truncate()
+        try:
+            with requests.get(url, timeout=TIMEOUT, stream=True) as response:
+                response.encoding = response.encoding or "utf-8"
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE, decode_unicode=True):
+                    file.write(chunk)
+            file.seek(0)
+            return True
+        # read timeouts while streaming are raised as connection errors
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            logger.warning("Download timed out: %s", url)
+    return False
+
+
+def get_peak_memory_usage_mib() -> int:
+    # ru_maxrss is given in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
 @log_exceptions
 class Command(BaseCommand):
     def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Read and import the JSON data incrementally instead of loading it into memory at once.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=None,
+            help="Commit the import in chunks of this many items instead of a single transaction. "
+            "A failed chunked import can be resumed by running it again.",
+        )
+
         mode = parser.add_subparsers(help="import mode", required=True, dest="mode")
 
         download_mode = mode.add_parser("download")
@@ -42,18 +90,25 @@ class Command(BaseCommand):
                 for semester in Semester.objects.exclude(default_course_end_date__isnull=True).exclude(cms_name=""):
                     logger.info("Downloading data for %s.", semester.name_en)
                     url = options["url"].format(urllib.parse.quote(semester.cms_name))
-                    for _ in range(RETRIES):
-                        try:
-                            json_contents = requests.get(url, timeout=TIMEOUT).text
-                            break
-                        except requests.exceptions.Timeout:
-                            logger.warning("Download timed out: %s", url)
-                    else:
-                        logger.warning("Giving up.")
-                        continue
 
-                    logger.info("Importing downloaded data for %s.", semester.name_en)
-                    JSONImporter(semester, semester.default_course_end_date).import_json(json_contents)
+                    if options["stream"]:
+                        with TemporaryFile("w+", encoding="utf-8") as file:
+                            if not download_to_file(url, file):
+                                logger.warning("Giving up.")
+                                continue
+                            logger.info("Importing downloaded data for %s.", semester.name_en)
+                            JSONImporter(
+                                semester, semester.default_course_end_date, options["chunk_size"]
+                            ).import_json_file(file)
+                    else:
+                        json_contents = download(url)
+                        if json_contents is None:
+                            logger.warning("Giving up.")
+                            continue
+                        logger.info("Importing downloaded data for %s.", semester.name_en)
+                        JSONImporter(semester, semester.default_course_end_date, options["chunk_size"]).import_json(
+                            json_contents
+                        )
                     logger.info("Finished %s.", semester.name_en)
             case "file":
                 try:
@@ -66,5 +121,11 @@ class Command(BaseCommand):
                 if not default_course_end:
                     raise CommandError("Semester has no default course end date, please specify one as an argument.")
                 with open(options["path-to-json"], encoding="utf-8") as file:
-                    JSONImporter(semester, default_course_end).import_json(file.read())
+                    importer = JSONImporter(semester, default_course_end, options["chunk_size"])
+                    if options["stream"]:
+                        importer.import_json_file(file)
+                    else:
+                        importer.import_json(file.read())
                 logger.info("Finished %s.", semester.name_en)
+
+        logger.info("Peak memory usage: %d MiB.", get_peak_memory_usage_mib())
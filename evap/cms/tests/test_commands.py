@@ -2,7 +2,7 @@ import os
 from datetime import date
 from io import StringIO
 from tempfile import TemporaryDirectory
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
 from django.core.management import CommandError, call_command
 from model_bakery import baker
@@ -23,7 +23,7 @@ class TestImportCMSData(TestCase):
         call_command("import_cms_data", "download", url_template, stdout=StringIO())
 
         mock_get.assert_called_once_with("https://example.com/download?semester=WS%2025/26", timeout=120)
-        mock_json_importer.assert_called_once_with(semester, semester.default_course_end_date)
+        mock_json_importer.assert_called_once_with(semester, semester.default_course_end_date, None)
 
     @patch("evap.cms.management.commands.import_cms_data.JSONImporter.import_json")
     def test_file_import(self, mock_import_json):
@@ -74,4 +74,63 @@ class TestImportCMSData(TestCase):
                 stdout=StringIO(),
             )
 
-            mock_json_importer.assert_called_once_with(semester, date(2001, 2, 3))
+            mock_json_importer.assert_called_once_with(semester, date(2001, 2, 3), None)
+
+    @patch("evap.cms.management.commands.import_cms_data.logger")
+    @patch("evap.cms.management.commands.import_cms_data.JSONImporter.import_json_file")
+    def test_file_import_stream(self, mock_import_json_file, mock_logger):
+        semester = baker.make(Semester, default_course_end_date=date(2001, 2, 3))
+        with TemporaryDirectory() as temp_dir:
+            test_filename = os.path.join(temp_dir, "test.json")
+            with open(test_filename, "w", encoding="utf-8") as f:
+                f.write("example contents")
+            call_command(
+                "import_cms_data",
+                "--stream",
+                "file",
+                "--semester-id",
+                semester.id,
+                test_filename,
+                stdout=StringIO(),
+            )
+
+            mock_import_json_file.assert_called_once()
+            self.assertEqual(mock_import_json_file.call_args.args[0].name, test_filename)
+            mock_logger.info.assert_called_with("Peak memory usage: %d MiB.", ANY)
+
+    @patch("requests.get")
+    @patch("evap.cms.management.commands.import_cms_data.JSONImporter")
+    def test_download_import_stream(self, mock_json_importer, mock_get):
+        semester = baker.make(Semester, cms_name="WS 25/26", default_course_end_date=date(2026, 2, 28))
+        mock_get.return_value.__enter__.return_value.iter_content.return_value = ['{"students": ', "[]}"]
+
+        def check_file_contents(file):
+            self.assertEqual(file.read(), '{"students": []}')
+
+        mock_json_importer.return_value.import_json_file.side_effect = check_file_contents
+        call_command("import_cms_data", "--stream", "download", "https://example.com/{}", stdout=StringIO())
+
+        mock_get.assert_called_once_with("https://example.com/WS%2025/26", timeout=120, stream=True)
+        mock_json_importer.assert_called_once_with(semester, semester.default_course_end_date, None)
+        mock_json_importer.return_value.import_json_file.assert_called_once()
+
+    @patch("evap.cms.management.commands.import_cms_data.JSONImporter")
+    def test_chunk_size(self, mock_json_importer):
+        semester = baker.make(Semester, default_course_end_date=date(2001, 2, 3))
+        with TemporaryDirectory() as temp_dir:
+            test_filename = os.path.join(temp_dir, "test.json")
+            with open(test_filename, "w", encoding="utf-8") as f:
+                f.write("example contents")
+            call_command(
+                "import_cms_data",
+                "--chunk-size",
+                "100",
+                "file",
+                "--semester-id",
+                semester.id,
+                test_filename,
+                stdout=StringIO(),
+            )
+
+            mock_json_importer.assert_called_once_with(semester, date(2001, 2, 3), 100)
+            mock_json_importer.return_value.import_json.assert_called_once_with("example contents")
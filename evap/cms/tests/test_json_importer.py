@@ -2,16 +2,28 @@ import json
 from contextlib import nullcontext
 from copy import deepcopy
 from datetime import date, datetime, timedelta
+from io import StringIO
 from pathlib import Path
+from unittest.mock import patch
 
 from django.conf import settings
 from django.core import mail
+from django.db import connection, transaction
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from model_bakery import baker
 from pydantic import ValidationError
 
 import evap.cms.fixtures
-from evap.cms.json_importer import ImportDict, JSONImporter, NameChange, WarningMessage, _clean_whitespaces_and_hyphens
+from evap.cms.json_importer import (
+    ImportDict,
+    JSONArrayStreamReader,
+    JSONImporter,
+    NameChange,
+    WarningMessage,
+    _clean_whitespaces_and_hyphens,
+    import_events_adapter,
+)
 from evap.cms.models import EvaluationLink, IgnoredEvaluation
 from evap.evaluation.models import (
     Contribution,
@@ -311,6 +323,66 @@ class TestImportUserProfiles(TestCase):
             ],
         )
 
+    def test_import_duplicate_emails(self):
+        students = [
+            {"gguid": "0x1", "email": "1@example.com", "name": "Doe", "christianname": "Jane", "callingname": ""},
+            {"gguid": "0x2", "email": "1@Example.com ", "name": "Roe", "christianname": "Jane", "callingname": ""},
+        ]
+
+        importer = JSONImporter(self.semester, date(2000, 1, 1))
+        importer._import_students(students)
+
+        user_profile = UserProfile.objects.get()
+        self.assertEqual(user_profile.last_name, "Roe")
+        self.assertEqual(importer.users_by_gguid["0x1"], user_profile)
+        self.assertEqual(importer.users_by_gguid["0x2"], user_profile)
+        self.assertEqual(
+            importer.statistics.name_changes,
+            [
+                NameChange(
+                    old_title="",
+                    old_last_name="Doe",
+                    old_first_name_given="Jane",
+                    new_title="",
+                    new_last_name="Roe",
+                    new_first_name_given="Jane",
+                    email="1@example.com",
+                )
+            ],
+        )
+
+    def test_import_many_students_with_constant_queries(self):
+        person_count = 3 * JSONImporter.BULK_BATCH_SIZE
+        students = [
+            {
+                "gguid": hex(i),
+                "email": f"student{i}@example.com",
+                "name": f"Last {i}",
+                "christianname": f"First {i}",
+                "callingname": "",
+            }
+            for i in range(person_count)
+        ]
+        # every third student already exists with an outdated name
+        UserProfile.objects.bulk_create(
+            UserProfile(email=f"student{i}@example.com", last_name="Old", first_name_given=f"First {i}")
+            for i in range(0, person_count, 3)
+        )
+
+        importer = JSONImporter(self.semester, date(2000, 1, 1))
+        # one select for the existing users, then two batched inserts for the new and one batched update for the
+        # existing users
+        with self.assertNumQueries(1 + 2 + 1):
+            importer._import_students(students)
+
+        self.assertEqual(UserProfile.objects.count(), person_count)
+        self.assertEqual(UserProfile.objects.filter(last_name="Old").count(), 0)
+        self.assertEqual(len(importer.statistics.name_changes), person_count // 3)
+        self.assertEqual(importer.statistics.name_changes[0].old_last_name, "Old")
+        self.assertEqual(importer.statistics.name_changes[0].new_last_name, "Last 0")
+        self.assertEqual(len(importer.users_by_gguid), person_count)
+        self.assertTrue(all(user_profile.pk for user_profile in importer.users_by_gguid.values()))
+
 
 class TestImportEvents(TestCase):
     @classmethod
@@ -328,6 +400,31 @@ class TestImportEvents(TestCase):
             importer.import_json(data)
         return importer
 
+    def test_reimport_query_count_is_independent_of_event_count(self):
+        def make_data(course_count):
+            events = []
+            for i in range(course_count):
+                main_event, exam_event = deepcopy(EXAMPLE_DATA["events"][:2])
+                main_event["gguid"] = f"0x5-{course_count}-{i}"
+                exam_event["gguid"] = f"0x6-{course_count}-{i}"
+                main_event["relatedevents"] = [{"gguid": exam_event["gguid"]}]
+                exam_event["relatedevents"] = [{"gguid": main_event["gguid"]}]
+                for event in [main_event, exam_event]:
+                    event["title"] += f" {course_count}-{i}"
+                    event["title_en"] += f" {course_count}-{i}"
+                events += [main_event, exam_event]
+            return {"students": EXAMPLE_DATA["students"], "lecturers": EXAMPLE_DATA["lecturers"], "events": events}
+
+        query_counts = []
+        for course_count in [1, 5]:
+            data = make_data(course_count)
+            self._import(data)
+            with CaptureQueriesContext(connection) as context:
+                self._import(data, assert_nop=True)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1], query_counts)
+
     @override_settings(EXAM_EVALUATION_DEFAULT_DURATION=timedelta(days=3))
     def test_import_courses(self):
         importer = self._import()
@@ -876,3 +973,206 @@ class TestImportEvents(TestCase):
         self._import(EXAMPLE_DATA_SPECIAL_CASES)
         evaluation = Evaluation.objects.get(cms_evaluation_links__cms_id="0x51")
         self.assertEqual(evaluation.main_language, "en")
+
+
+class TestJSONArrayStreamReader(TestCase):
+    def _read(self, text, keys=("a", "b"), read_size=3):
+        return [(key, list(items)) for key, items in JSONArrayStreamReader(StringIO(text), keys, read_size=read_size)]
+
+    def test_reads_arrays_across_buffer_boundaries(self):
+        text = ' { "a" : [ {"x": "y ,]}\\u00e4"}, 12345, [1, [2]], null, false ] ,\n"b":[],"c": {"d": [1]} , "e": 1.5e3 }  '
+        for read_size in [1, 2, 3, 7, 1024]:
+            self.assertEqual(
+                self._read(text, read_size=read_size),
+                [("a", [{"x": "y ,]}\u00e4"}, 12345, [1, [2]], None, False]), ("b", [])],
+            )
+
+    def test_skips_unconsumed_items(self):
+        reader = JSONArrayStreamReader(StringIO('{"a": [1, 2, 3], "b": [4]}'), ["a", "b"], read_size=2)
+        self.assertEqual([key for key, __ in reader], ["a", "b"])
+
+    def test_empty_object(self):
+        self.assertEqual(self._read(" {} "), [])
+
+    def test_invalid_json(self):
+        for text in ["", "[]", '{"a": 1}', '{"a": [1 2]}', '{"a": [1,]}', '{"a": [1]', '{"a": []} {}', "{1: []}"]:
+            with self.subTest(text=text), self.assertRaises(json.JSONDecodeError):
+                self._read(text)
+
+    def test_invalid_value_is_not_read_to_the_end(self):
+        file = StringIO('{"a": [{"b": x}, ' + "1, " * 1000 + "1]}")
+        with self.assertRaises(json.JSONDecodeError):
+            list(JSONArrayStreamReader(file, ["a"], read_size=16))
+        self.assertLess(file.tell(), 100)
+
+
+class TestImportJSONFile(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.semester = baker.make(Semester)
+
+    def _import_file(self, data):
+        importer = JSONImporter(self.semester, date(2000, 1, 1))
+        importer.import_json_file(StringIO(json.dumps(data)))
+        return importer
+
+    def test_same_result_as_import_json(self):
+        for data in [EXAMPLE_DATA, EXAMPLE_DATA_SPECIAL_CASES]:
+            with self.subTest(data=data), transaction.atomic():
+                importer = JSONImporter(self.semester, date(2000, 1, 1))
+                importer.import_json(json.dumps(data))
+                expected = {
+                    "evaluations": set(Evaluation.objects.values_list("name_en", "course__name_en", "vote_end_date")),
+                    "participants": set(Evaluation.participants.through.objects.values_list("userprofile__email")),
+                    "statistics": importer.statistics.get_log().split("\n", 4)[4],
+                }
+                transaction.set_rollback(True)
+
+            with self.subTest(data=data), transaction.atomic():
+                importer = self._import_file(data)
+                self.assertEqual(
+                    set(Evaluation.objects.values_list("name_en", "course__name_en", "vote_end_date")),
+                    expected["evaluations"],
+                )
+                self.assertEqual(
+                    set(Evaluation.participants.through.objects.values_list("userprofile__email")),
+                    expected["participants"],
+                )
+                # skip the line with the timestamp
+                self.assertEqual(importer.statistics.get_log().split("\n", 4)[4], expected["statistics"])
+                transaction.set_rollback(True)
+
+    def test_events_are_read_in_batches(self):
+        validate_python = import_events_adapter.validate_python
+        with (
+            patch.object(JSONImporter, "BULK_BATCH_SIZE", 1),
+            patch.object(import_events_adapter, "validate_python", wraps=validate_python) as validate_mock,
+        ):
+            self._import_file(EXAMPLE_DATA)
+
+        # each event is validated on its own, once for collecting the gguids and once in each of the four import passes
+        self.assertEqual(validate_mock.call_count, 5 * len(EXAMPLE_DATA["events"]))
+        for call in validate_mock.call_args_list:
+            self.assertEqual(len(call.args[0]), 1)
+
+    def test_merged_evaluations(self):
+        self._import_file(EXAMPLE_DATA_SPECIAL_CASES)
+        main_evaluation = Evaluation.objects.get(cms_evaluation_links__cms_id="0x10")
+        other_evaluation = Evaluation.objects.get(cms_evaluation_links__cms_id="0x44")
+        cms_evaluation_link = other_evaluation.cms_evaluation_links.get()
+        cms_evaluation_link.evaluation = main_evaluation
+        cms_evaluation_link.save()
+        baker.make(IgnoredEvaluation, cms_id=cms_evaluation_link.cms_id, course=other_evaluation.course)
+        other_evaluation.delete()
+
+        self._import_file(EXAMPLE_DATA_SPECIAL_CASES)
+        evaluation = Evaluation.objects.get(cms_evaluation_links__cms_id="0x10")
+        self.assertEqual(set(evaluation.participants.values_list("last_name", flat=True)), {"2", "3", "7"})
+
+    def test_lecturers_before_students(self):
+        user_data = {
+            "gguid": "0x1",
+            "email": "1@example.com",
+            "name": "1",
+            "christianname": "Student",
+            "callingname": "",
+        }
+        data = {
+            "lecturers": [{**user_data, "christianname": "Lecturer", "titlefront": "Dr."}],
+            "events": [],
+            "students": [user_data],
+        }
+        self._import_file(data)
+
+        user_profile = UserProfile.objects.get()
+        self.assertEqual(user_profile.first_name_given, "Lecturer")
+        self.assertEqual(user_profile.title, "Dr.")
+
+    def test_invalid_data(self):
+        wrong_data = deepcopy(EXAMPLE_DATA)
+        wrong_data["events"][0]["isexam"] = "false"
+        with self.assertRaises(ValidationError):
+            self._import_file(wrong_data)
+        self.assertFalse(UserProfile.objects.exists())
+
+        with self.assertRaises(ValidationError):
+            self._import_file({"students": [], "lecturers": []})
+
+        importer = JSONImporter(self.semester, date(2000, 1, 1))
+        with self.assertRaisesMessage(ValueError, "Duplicate key 'events' in import data"):
+            importer.import_json_file(StringIO('{"students": [], "lecturers": [], "events": [], "events": []}'))
+        with self.assertRaisesMessage(ValueError, "Duplicate key 'students' in import data"):
+            importer.import_json_file(StringIO('{"students": [], "lecturers": [], "events": [], "students": []}'))
+
+
+@override_settings(JSON_IMPORTER_LOG_RECIPIENTS=["test@example.com"])
+class TestChunkedImport(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.semester = baker.make(Semester)
+
+    def _import(self, chunk_size):
+        importer = JSONImporter(self.semester, date(2000, 1, 1), chunk_size=chunk_size)
+        importer.import_json(json.dumps(EXAMPLE_DATA_SPECIAL_CASES))
+        return importer
+
+    def _get_state(self):
+        return {
+            "user_profiles": set(UserProfile.objects.values_list("email", "last_name", "title")),
+            "courses": set(Course.objects.values_list("name_en", "cms_course_links__cms_id")),
+            "evaluations": set(
+                Evaluation.objects.values_list("name_en", "cms_evaluation_links__cms_id", "vote_end_date", "weight")
+            ),
+            "participants": set(
+                Evaluation.participants.through.objects.values_list("evaluation__name_en", "userprofile__email")
+            ),
+            "contributions": set(Contribution.objects.values_list("evaluation__name_en", "contributor__email")),
+        }
+
+    def test_same_result_as_single_transaction(self):
+        with transaction.atomic():
+            importer = self._import(chunk_size=None)
+            expected_state = self._get_state()
+            # skip the line with the timestamp
+            expected_log = importer.statistics.get_log().split("\n", 4)[4]
+            transaction.set_rollback(True)
+
+        importer = self._import(chunk_size=1)
+        self.assertEqual(self._get_state(), expected_state)
+        self.assertEqual(importer.statistics.get_log().split("\n", 4)[4], expected_log)
+        self.assertGreater(importer.committed_chunk_count, 10)
+
+    def test_resume_after_failure(self):
+        with transaction.atomic():
+            self._import(chunk_size=None)
+            expected_state = self._get_state()
+            transaction.set_rollback(True)
+
+        original_import_evaluation = JSONImporter._import_evaluation
+
+        def failing_import_evaluation(importer, course, data, *args, **kwargs):
+            if data["gguid"] == "0x8":
+                raise RuntimeError("Connection lost")
+            return original_import_evaluation(importer, course, data, *args, **kwargs)
+
+        with (
+            patch.object(JSONImporter, "_import_evaluation", failing_import_evaluation),
+            self.assertRaisesMessage(RuntimeError, "Connection lost"),
+        ):
+            self._import(chunk_size=2)
+
+        # the chunks before the failing one are committed and reported
+        self.assertTrue(Course.objects.exists())
+        self.assertFalse(Evaluation.objects.filter(cms_evaluation_links__cms_id="0x8").exists())
+        self.assertIn("Aborted after", mail.outbox[-1].body)
+        self.assertIn("RuntimeError('Connection lost')", mail.outbox[-1].body)
+
+        importer = self._import(chunk_size=2)
+        self.assertEqual(self._get_state(), expected_state)
+        self.assertEqual(importer.statistics.new_courses, [])
+        self.assertNotIn("Aborted after", mail.outbox[-1].body)
+
+        importer = self._import(chunk_size=2)
+        self.assertEqual(self._get_state(), expected_state)
+        self.assertEqual(importer.statistics.new_evaluations, [])
+        self.assertEqual(importer.statistics.updated_evaluations, set())
@@ -1,16 +1,23 @@
+from unittest.mock import patch
+
 import xlrd
 from django.conf import settings
 from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from model_bakery import baker
 
-from evap.evaluation.models import Contribution, Course, Evaluation, Questionnaire, UserProfile
+from evap.contributor.views import get_index_semester_list
+from evap.evaluation.models import Contribution, Course, Evaluation, Program, Questionnaire, Semester, UserProfile
 from evap.evaluation.tests.tools import (
     WebTest,
     WebTestWith200Check,
     create_evaluation_with_responsible_and_editor,
     submit_with_modal,
 )
+from evap.evaluation.tools import invalidate_start_pages
+from evap.results.tools import cache_results
 
 
 class TestContributorDirectDelegationView(WebTest):
@@ -84,6 +91,78 @@ class TestContributorView(WebTestWith200Check):
     def setUpTestData(cls):
         users = create_evaluation_with_responsible_and_editor()
         cls.test_users = [users["editor"], users["responsible"]]
+        cls.responsible = users["responsible"]
+        cls.evaluation = users["evaluation"]
+
+    def test_semester_list_is_cached(self):
+        delegate = baker.make(UserProfile, email="delegate@institution.example.com")
+        baker.make(
+            Contribution,
+            contributor=delegate,
+            evaluation__state=Evaluation.State.PREPARED,
+            role=Contribution.Role.EDITOR,
+        )
+        self.app.get(self.url, user=self.responsible)
+        page = self.app.get(self.url, user=delegate)
+        self.assertNotContains(page, self.evaluation.full_name)
+
+        with patch("evap.contributor.views.get_index_semester_list", wraps=get_index_semester_list) as mock:
+            self.app.get(self.url, user=self.responsible)
+            self.app.get(self.url, user=delegate)
+            mock.assert_not_called()
+
+            # the shown evaluations depend on the delegations
+            self.responsible.delegates.add(delegate)
+            page = self.app.get(self.url, user=delegate)
+            mock.assert_called_once()
+            self.assertContains(page, self.evaluation.full_name)
+
+    def test_num_queries_is_independent_of_delegations(self):
+        delegate = baker.make(UserProfile, email="secretary@institution.example.com")
+        semesters = baker.make(Semester, _quantity=10)
+
+        def make_represented_users(count):
+            for represented_user in baker.make(UserProfile, _quantity=count):
+                represented_user.delegates.add(delegate)
+                course = baker.make(
+                    Course,
+                    semester=semesters[represented_user.pk % len(semesters)],
+                    responsibles=[represented_user],
+                    programs=[baker.make(Program)],
+                    is_private=represented_user.pk % 3 == 0,
+                )
+                baker.make(
+                    Evaluation,
+                    course=course,
+                    state=iter([Evaluation.State.PREPARED, Evaluation.State.PUBLISHED]),
+                    name_en=iter(["first", "second"]),
+                    name_de=iter(["erste", "zweite"]),
+                    _participant_count=iter([None, 10]),
+                    _voter_count=iter([None, 10]),
+                    _quantity=2,
+                )
+                baker.make(
+                    Contribution,
+                    evaluation=course.evaluations.first(),
+                    contributor=baker.make(UserProfile),
+                    role=Contribution.Role.EDITOR,
+                )
+            for evaluation in Evaluation.objects.filter(state=Evaluation.State.PUBLISHED):
+                cache_results(evaluation)
+
+        def count_queries():
+            # measure the uncached page
+            invalidate_start_pages()
+            with CaptureQueriesContext(connection) as context:
+                self.app.get(self.url, user=delegate)
+            return len(context.captured_queries)
+
+        make_represented_users(2)
+        count_queries()  # warm up the session and the cache versions
+        num_queries_before = count_queries()
+
+        make_represented_users(48)
+        self.assertEqual(count_queries(), num_queries_before)
 
 
 class TestContributorEvaluationView(WebTestWith200Check):
@@ -1,10 +1,12 @@
 from django.contrib import messages
+from django.core.cache import caches
 from django.core.exceptions import PermissionDenied, SuspiciousOperation
 from django.db import IntegrityError, transaction
-from django.db.models import Exists, Max, OuterRef, Q
+from django.db.models import Exists, Max, OuterRef, Prefetch, Q
 from django.forms.models import inlineformset_factory
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
 from django.utils.translation import gettext as _
 from django.views.decorators.http import require_POST
 
@@ -16,27 +18,30 @@ from evap.evaluation.models import (
     CourseType,
     EmailTemplate,
     Evaluation,
+    EvaluationManager,
     Program,
     Semester,
     UserProfile,
 )
 from evap.evaluation.tools import (
+    START_PAGE_CACHE_TIMEOUT,
     AttachmentResponse,
     get_bool_parameter_from_url_or_session,
     get_object_from_dict_pk_entry_or_logged_40x,
+    get_start_page_cache_key,
     sort_formset,
 )
 from evap.results.exporters import ResultsExporter
-from evap.results.tools import annotate_distributions_and_grades, get_evaluations_with_course_result_attributes
+from evap.results.tools import (
+    annotate_distributions_and_grades,
+    get_evaluations_with_course_result_attributes,
+    get_results_for_average_distributions,
+)
 from evap.staff.forms import ContributionFormset
 from evap.student.views import render_vote_page
 
 
-@responsible_or_contributor_or_delegate_required
-def index(request):
-    user = request.user
-    show_delegated = get_bool_parameter_from_url_or_session(request, "show_delegated", True)
-
+def get_index_semester_list(user, show_delegated):
     represented_proxy_users = user.represented_users.filter(is_proxy_user=True)
     contributor_visible_states = [
         Evaluation.State.PREPARED,
@@ -56,15 +61,7 @@ def index(request):
             | Q(responsibles__in=represented_proxy_users)
         )
     )
-
-    own_evaluations = (
-        Evaluation.objects.filter(course__in=own_courses)
-        .annotate(contributes_to=Exists(Evaluation.objects.filter(id=OuterRef("id"), contributions__contributor=user)))
-        .prefetch_related("course", "course__evaluations", "course__programs", "course__type", "course__semester")
-    )
-    own_evaluations = [evaluation for evaluation in own_evaluations if evaluation.can_be_seen_by(user)]
-
-    displayed_evaluations = own_evaluations
+    displayed_courses = Q(course__in=own_courses)
     if show_delegated:
         represented_users = user.represented_users.exclude(is_proxy_user=True)
         delegated_courses = Course.objects.filter(
@@ -77,23 +74,56 @@ def index(request):
                 )
             )
         )
-        delegated_evaluations = Evaluation.objects.filter(course__in=delegated_courses).prefetch_related(
-            "course", "course__evaluations", "course__programs", "course__type", "course__semester"
+        displayed_courses |= Q(course__in=delegated_courses)
+
+    # the annotations replace per-evaluation queries in the template
+    evaluations = (
+        Evaluation.objects.visible_to(user)
+        .filter(displayed_courses)
+        .annotate(
+            delegated_evaluation=~Q(course__in=own_courses),
+            contributes_to=Exists(Contribution.objects.filter(evaluation=OuterRef("pk"), contributor=user)),
+            user_is_responsible_or_contributor_or_delegate=EvaluationManager.represented_by(user),
+            user_is_editor_or_delegate=EvaluationManager.represented_by(user, editors_only=True),
+            results_page_can_be_seen_by_user=EvaluationManager.results_page_visibility(user),
+            has_nonresponsible_editor=Exists(
+                Contribution.objects.filter(evaluation=OuterRef("pk"), role=Contribution.Role.EDITOR).exclude(
+                    contributor__courses_responsible_for=OuterRef("course")
+                )
+            ),
+        )
+        .select_related("course", "course__type", "course__semester", "exam_type")
+        .prefetch_related(
+            "course__programs",
+            Prefetch(
+                "course__evaluations",
+                queryset=Evaluation.annotate_with_participant_and_voter_counts(Evaluation.objects.all()),
+            ),
         )
-        delegated_evaluations = [evaluation for evaluation in delegated_evaluations if evaluation.can_be_seen_by(user)]
-        for evaluation in delegated_evaluations:
-            evaluation.delegated_evaluation = True
-        displayed_evaluations += set(delegated_evaluations) - set(displayed_evaluations)
+    )
+    displayed_evaluations = list(Evaluation.annotate_with_participant_and_voter_counts(evaluations))
 
     displayed_evaluations.sort(
         key=lambda evaluation: (evaluation.course.name, evaluation.name)
     )  # evaluations must be sorted for regrouping them in the template
 
-    annotate_distributions_and_grades(e for e in displayed_evaluations if e.state == Evaluation.State.PUBLISHED)
-    displayed_evaluations = get_evaluations_with_course_result_attributes(displayed_evaluations)
+    # the displayed evaluations are among their courses' evaluations, so this fetches all needed results at once
+    results_by_evaluation_id = get_results_for_average_distributions(
+        course_evaluation
+        for evaluation in displayed_evaluations
+        for course_evaluation in evaluation.course.evaluations.all()
+        if course_evaluation.state == Evaluation.State.PUBLISHED
+    )
+    annotate_distributions_and_grades(
+        (evaluation for evaluation in displayed_evaluations if evaluation.state == Evaluation.State.PUBLISHED),
+        results_by_evaluation_id,
+    )
+    displayed_evaluations = get_evaluations_with_course_result_attributes(
+        displayed_evaluations, results_by_evaluation_id
+    )
 
     semesters = Semester.objects.all()
-    semester_list = [
+    return [
         {
             "semester_name": semester.name,
             "id": semester.id,
@@ -105,6 +135,18 @@ def index(request):
         for semester in semesters
     ]
 
+
+@responsible_or_contributor_or_delegate_required
+def index(request):
+    show_delegated = get_bool_parameter_from_url_or_session(request, "show_delegated", True)
+
+    # the sorting of the evaluations depends on the language
+    cache_key = get_start_page_cache_key("contributor", request.user.id, show_delegated, get_language())
+    semester_list = caches["default"].get(cache_key)
+    if semester_list is None:
+        semester_list = get_index_semester_list(request.user, show_delegated)
+        caches["default"].set(cache_key, semester_list, START_PAGE_CACHE_TIMEOUT.total_seconds())
+
     template_data = {
         "semester_list": semester_list,
         "show_delegated": show_delegated,
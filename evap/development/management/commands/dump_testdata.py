@@ -28,6 +28,8 @@ class Command(BaseCommand):
             "grades",
             "cms",
             "--exclude=evaluation.LogEntry",
+            # loading the participants and voters counts them again
+            "--exclude=evaluation.EvaluationCounter",
             indent=2,
             output=outfile_name,
             natural_foreign=True,
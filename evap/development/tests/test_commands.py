@@ -23,6 +23,7 @@ class TestDumpTestDataCommand(TestCase):
             "grades",
             "cms",
             "--exclude=evaluation.LogEntry",
+            "--exclude=evaluation.EvaluationCounter",
             indent=2,
             natural_foreign=True,
             natural_primary=True,
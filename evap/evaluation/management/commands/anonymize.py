@@ -1,6 +1,9 @@
 import itertools
 import os
 import random
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
 from datetime import date, timedelta
 from math import floor
 
@@ -8,6 +11,7 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.core.serializers.base import ProgressBar
 from django.db import transaction
+from django.db.models import Count
 
 from evap.evaluation.management.commands.tools import confirm_harmful_operation
 from evap.evaluation.models import (
@@ -16,6 +20,7 @@ from evap.evaluation.models import (
     Contribution,
     Course,
     CourseType,
+    Evaluation,
     Program,
     RatingAnswerCounter,
     Semester,
@@ -41,6 +46,26 @@ class Command(BaseCommand):
     new_institution_domain = settings.INSTITUTION_EMAIL_DOMAINS[0]
     new_external_domain = "external.example.com"
 
+    chunk_size = 1000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.random = random.Random()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=None,
+            help="Seed for the random generator. Anonymizing the same data with the same seed gives the same result.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=Command.chunk_size,
+            help="Number of objects that are loaded and updated at once.",
+        )
+
     def handle(self, *args, **options):
         self.stdout.write("")
         self.stdout.write("WARNING! This will anonymize all the data in")
@@ -48,6 +73,8 @@ class Command(BaseCommand):
         if not confirm_harmful_operation(self.stdout):
             return
 
+        self.random.seed(options["seed"])
+        self.chunk_size = options["chunk_size"]
         self.anonymize_data()
 
     def anonymize_data(self):
@@ -64,11 +91,15 @@ class Command(BaseCommand):
         try:
             with transaction.atomic():
                 self.anonymize_email_templates()
-                self.anonymize_users(first_names, last_names)
-                self.anonymize_courses()
-                self.anonymize_evaluations()
+                with self.timed("users"):
+                    self.anonymize_users(first_names, last_names)
+                with self.timed("courses"):
+                    self.anonymize_courses()
+                with self.timed("evaluations"):
+                    self.anonymize_evaluations()
                 self.anonymize_questionnaires()
-                self.anonymize_answers(lorem_ipsum)
+                with self.timed("answers"):
+                    self.anonymize_answers(lorem_ipsum)
 
                 self.stdout.write("")
                 self.stdout.write("Done.")
@@ -80,82 +111,125 @@ class Command(BaseCommand):
             self.stdout.write("")
             raise
 
+    @contextmanager
+    def timed(self, table: str) -> Iterator[None]:
+        start = time.monotonic()
+        yield
+        self.stdout.write(f"Anonymized {table} in {time.monotonic() - start:.1f}s.")
+
+    def chunks(self, queryset):
+        """
+        Yield the objects of the queryset in lists of at most chunk_size objects, ordered by primary key, and show
+        the progress. Only one chunk is held in memory at a time.
+        """
+        queryset = queryset.order_by("pk")
+        progress_bar = ProgressBar(self.stdout, queryset.count())
+        done_count = 0
+        chunk = list(queryset[: self.chunk_size])
+        try:
+            self.stdout.ending = ""
+            while chunk:
+                yield chunk
+                done_count += len(chunk)
+                progress_bar.update(done_count)
+                chunk = list(queryset.filter(pk__gt=chunk[-1].pk)[: self.chunk_size])
+        finally:
+            self.stdout.ending = "\n"
+
     def anonymize_email_templates(self):
         self.stdout.write("REMINDER: The email templates could still contain sensitive contact information...")
 
-    # Replaces names, email addresses, login keys and valid until dates with fake ones
-    def anonymize_users(self, first_names, last_names):
-        user_profiles = UserProfile.objects.all()
-
+    def generate_fake_usernames(self, first_names, last_names, user_count):
         # Generate as many fake usernames as real ones exist. Use the provided first/last names for that
         self.stdout.write("Generating fake usernames...")
-        fake_usernames = set()
+        fake_usernames = []
+        fake_username_set = set()
 
-        if len(first_names) * len(last_names) < len(user_profiles) * 1.5:
+        if len(first_names) * len(last_names) < user_count * 1.5:
             self.stdout.write(
                 "Warning: There are few example names compared to all that real data to be anonymized. "
                 "Consider adding more data to the first_names.txt and last_names.txt files in the anonymize_data "
                 "folder."
             )
 
-        while len(fake_usernames) < len(user_profiles):
-            fake_usernames.add((random.choice(first_names), random.choice(last_names)))  # nosec
+        while len(fake_usernames) < user_count:
+            name = (self.random.choice(first_names), self.random.choice(last_names))
+            if name not in fake_username_set:
+                fake_username_set.add(name)
+                fake_usernames.append(name)
+        return fake_usernames
 
-        for i, user in enumerate(user_profiles):
-            # Give users unique temporary emails to counter identity errors due to the emails being unique
-            if user.email:
-                if user.email.split("@")[0] in Command.ignore_email_usernames:
-                    continue
-                user.email = f"<User.{i}>@{user.email.split('@')[1]}"
-                user.save()
+    # Replaces names, email addresses, login keys and valid until dates with fake ones
+    def anonymize_users(self, first_names, last_names):
+        user_profiles = UserProfile.objects.exclude(email__regex=rf"^({'|'.join(Command.ignore_email_usernames)})@")
+
+        fake_usernames = self.generate_fake_usernames(first_names, last_names, user_profiles.count())
+
+        # Give users unique temporary emails and no login keys to counter identity errors due to them being unique
+        self.stdout.write("Removing email addresses and login keys...")
+        for chunk in self.chunks(user_profiles.exclude(email=None).exclude(email="")):
+            for user in chunk:
+                user.email = f"<User.{user.pk}>@{user.email.split('@')[1]}"
+            UserProfile.objects.bulk_update(chunk, ["email"])
+        users_with_login_keys = set(user_profiles.exclude(login_key=None).values_list("pk", flat=True))
+        user_profiles.update(login_key=None)
+        used_login_keys = set(UserProfile.objects.exclude(login_key=None).values_list("login_key", flat=True))
 
         # Actually replace all the real user data
         self.stdout.write("Replacing email addresses and login keys with fake ones...")
-        for user, name in zip(user_profiles, fake_usernames, strict=True):
-            if user.email and user.email.split("@")[0] in Command.ignore_email_usernames:
-                continue
-            user.first_name_given = name[0]
-            user.first_name_chosen = random.choice(first_names) if random.random() < 0.1 else ""  # nosec
-            user.last_name = name[1]
-
-            if user.email:
-                old_domain = user.email.split("@")[1]
-                is_institution_domain = old_domain in Command.previous_institution_domains
-                new_domain = Command.new_institution_domain if is_institution_domain else Command.new_external_domain
-                user.email = (user.first_name_given + "." + user.last_name).lower() + "@" + new_domain
-
-            if user.login_key is not None:
-                # Create a new login key
-                user.login_key = None
-                user.valid_until = None
-                user.ensure_valid_login_key()
-                # Invalidate some keys
-                user.valid_until = date.today() + random.choice([1, -1]) * timedelta(365 * 100)  # nosec
-
-            assert not user.has_usable_password()
-
-            user.save()
+        fake_username_iterator = iter(fake_usernames)
+        for chunk in self.chunks(user_profiles):
+            for user, name in zip(chunk, fake_username_iterator, strict=False):
+                user.first_name_given = name[0]
+                user.first_name_chosen = self.random.choice(first_names) if self.random.random() < 0.1 else ""
+                user.last_name = name[1]
+
+                if user.email:
+                    old_domain = user.email.split("@")[1]
+                    is_institution_domain = old_domain in Command.previous_institution_domains
+                    new_domain = (
+                        Command.new_institution_domain if is_institution_domain else Command.new_external_domain
+                    )
+                    user.email = (user.first_name_given + "." + user.last_name).lower() + "@" + new_domain
+
+                if user.pk in users_with_login_keys:
+                    # Create a new login key
+                    while (login_key := self.random.randrange(UserProfile.MAX_LOGIN_KEY)) in used_login_keys:
+                        pass
+                    used_login_keys.add(login_key)
+                    user.login_key = login_key
+                    # Invalidate some keys
+                    user.login_key_valid_until = date.today() + self.random.choice([1, -1]) * timedelta(365 * 100)
+
+                assert not user.has_usable_password()
+
+            UserProfile.objects.bulk_update(
+                chunk,
+                ["first_name_given", "first_name_chosen", "last_name", "email", "login_key", "login_key_valid_until"],
+            )
 
     def anonymize_courses(self):
-        all_programs = list(Program.objects.all())
-        all_course_types = CourseType.objects.all()
-
-        # Randomize the programs
-        self.stdout.write("Randomizing programs...")
-        for course in Course.objects.all():
-            programs = random.sample(all_programs, course.programs.count())
-            course.programs.set(programs)
-
-        # Randomize course types
-        self.stdout.write("Randomizing course types...")
-        for course in Course.objects.all():
-            course.type = random.choice(all_course_types)  # nosec
-            course.save()
+        all_programs = list(Program.objects.order_by("pk"))
+        all_course_types = list(CourseType.objects.order_by("pk"))
+
+        # Randomize the programs and course types
+        self.stdout.write("Randomizing programs and course types...")
+        through_model = Course.programs.through
+        for chunk in self.chunks(Course.objects.annotate(program_count=Count("programs")).only("type")):
+            through_model.objects.filter(course__in=chunk).delete()
+            through_model.objects.bulk_create(
+                through_model(course_id=course.pk, program_id=program.pk)
+                for course in chunk
+                for program in self.random.sample(all_programs, course.program_count)
+            )
+            for course in chunk:
+                course.type = self.random.choice(all_course_types)
+            Course.objects.bulk_update(chunk, ["type"])
 
         # Randomize names
-        for semester in Semester.objects.all():
-            courses = list(semester.courses.all())
-            random.shuffle(courses)
+        for semester in Semester.objects.order_by("pk"):
+            courses = list(semester.courses.order_by("pk").only("name_de", "name_en", "is_private"))
+            self.random.shuffle(courses)
             public_courses = [course for course in courses if not course.is_private]
 
             self.stdout.write(f"Anonymizing {len(courses)} courses of semester {semester}...")
@@ -163,14 +237,14 @@ class Command(BaseCommand):
             # Shuffle public courses' names in order to decouple them from the results.
             # Also, assign public courses' names to private ones as their names may be confidential.
             self.stdout.write("Shuffling course names...")
-            public_names = list({(c.name_de, c.name_en) for c in public_courses})
-            random.shuffle(public_names)
+            public_names = sorted({(c.name_de, c.name_en) for c in public_courses})
+            self.random.shuffle(public_names)
 
             for i, course in enumerate(courses):
                 # Give courses unique temporary names to counter identity errors due to the names being unique
                 course.name_de = f"<Veranstaltung #{i}>"
                 course.name_en = f"<Course #{i}>"
-                course.save()
+            Course.objects.bulk_update(courses, ["name_de", "name_en"], batch_size=self.chunk_size)
 
             for i, course in enumerate(courses):
                 if public_names:
@@ -180,18 +254,18 @@ class Command(BaseCommand):
                 else:
                     course.name_de = f"Veranstaltung #{i + 1}"
                     course.name_en = f"Course #{i + 1}"
-                course.save()
+            Course.objects.bulk_update(courses, ["name_de", "name_en"], batch_size=self.chunk_size)
 
     def anonymize_evaluations(self):
-        for semester in Semester.objects.all():
-            evaluations = list(semester.evaluations.all())
-            random.shuffle(evaluations)
+        for semester in Semester.objects.order_by("pk"):
+            evaluations = list(semester.evaluations.order_by("pk").only("name_de", "name_en"))
+            self.random.shuffle(evaluations)
             self.stdout.write(f"Anonymizing {len(evaluations)} evaluations of semester {semester}...")
 
             self.stdout.write("Shuffling evaluation names...")
             named_evaluations = (evaluation for evaluation in evaluations if evaluation.name_de and evaluation.name_en)
-            names = list({(c.name_de, c.name_en) for c in named_evaluations})
-            random.shuffle(names)
+            names = sorted({(c.name_de, c.name_en) for c in named_evaluations})
+            self.random.shuffle(names)
 
             for i, evaluation in enumerate(evaluations):
                 # Give evaluations unique temporary names to counter identity errors due to the names being unique
@@ -199,7 +273,7 @@ class Command(BaseCommand):
                     evaluation.name_de = f"<Evaluierung #{i}>"
                 if evaluation.name_en:
                     evaluation.name_en = f"<Evaluation #{i}>"
-                evaluation.save()
+            Evaluation.objects.bulk_update(evaluations, ["name_de", "name_en"], batch_size=self.chunk_size)
 
             for i, evaluation in enumerate(evaluations):
                 if not evaluation.name_de and not evaluation.name_en:
@@ -211,70 +285,68 @@ class Command(BaseCommand):
                 else:
                     evaluation.name_de = f"Evaluierung #{i + 1}"
                     evaluation.name_en = f"Evaluation #{i + 1}"
-                evaluation.save()
+            Evaluation.objects.bulk_update(evaluations, ["name_de", "name_en"], batch_size=self.chunk_size)
 
     def anonymize_questionnaires(self):
         self.stdout.write("REMINDER: You still need to randomize the questionnaire names...")
         self.stdout.write("REMINDER: You still need to randomize the questionnaire questions...")
 
     def anonymize_answers(self, lorem_ipsum):
-        # This method is very mathematical and has a lot of "one new variable per line" code, but we think it's okay.
-        # pylint: disable=too-many-locals
         self.stdout.write("Replacing text answers with fake ones...")
-        for text_answer in TextAnswer.objects.all():
-            text_answer.answer = self.lorem(text_answer.answer, lorem_ipsum)
-            if text_answer.original_answer:
-                text_answer.original_answer = self.lorem(text_answer.original_answer, lorem_ipsum)
-                # answer and original answer must not be the same (see #1798)
-                if text_answer.answer == text_answer.original_answer:
-                    text_answer.original_answer += " ipsum"
-            text_answer.save()
+        for chunk in self.chunks(TextAnswer.objects.only("answer", "original_answer")):
+            for text_answer in chunk:
+                text_answer.answer = self.lorem(text_answer.answer, lorem_ipsum)
+                if text_answer.original_answer:
+                    text_answer.original_answer = self.lorem(text_answer.original_answer, lorem_ipsum)
+                    # answer and original answer must not be the same (see #1798)
+                    if text_answer.answer == text_answer.original_answer:
+                        text_answer.original_answer += " ipsum"
+            TextAnswer.objects.bulk_update(chunk, ["answer", "original_answer"])
 
         self.stdout.write("Shuffling rating answer counter counts...")
+        contributions = Contribution.objects.only("pk")
+        for chunk in self.chunks(contributions):
+            counters = RatingAnswerCounter.objects.filter(contribution__in=chunk).select_related("assignment__question")
+            counters_to_save = []
+            counters_to_delete = []
+            counters_per_assignment = unordered_groupby(
+                ((counter.contribution_id, counter.assignment), counter) for counter in counters.order_by("pk")
+            )
+            for (contribution_id, assignment), assignment_counters in counters_per_assignment.items():
+                self.shuffle_counts(contribution_id, assignment, assignment_counters)
+                counters_to_save += [counter for counter in assignment_counters if counter.count]
+                counters_to_delete += [
+                    counter.pk for counter in assignment_counters if not counter.count and counter.pk
+                ]
+
+            RatingAnswerCounter.objects.bulk_update([counter for counter in counters_to_save if counter.pk], ["count"])
+            RatingAnswerCounter.objects.bulk_create([counter for counter in counters_to_save if not counter.pk])
+            RatingAnswerCounter.objects.filter(pk__in=counters_to_delete).delete()
+
+    def shuffle_counts(self, contribution_id, assignment, counters):
+        """Randomly redistribute the answers of the counters of one assignment, also using missing answer values."""
+        original_sum = sum(counter.count for counter in counters)
+
+        missing_values = set(CHOICES[assignment.question.type].values).difference({c.answer for c in counters})
+        missing_values.discard(NO_ANSWER)  # don't add NO_ANSWER counter if it didn't exist before
+        for value in sorted(missing_values):
+            counters.append(
+                RatingAnswerCounter(assignment=assignment, contribution_id=contribution_id, answer=value, count=0)
+            )
 
-        contributions = Contribution.objects.all().prefetch_related("ratinganswercounter_set__assignment__question")
-        try:
-            self.stdout.ending = ""
-            progress_bar = ProgressBar(self.stdout, contributions.count())
-            for contribution_counter, contribution in enumerate(contributions):
-                progress_bar.update(contribution_counter + 1)
+        generated_counts = [self.random.random() for c in counters]
+        generated_sum = sum(generated_counts)
+        generated_counts = [floor(count / generated_sum * original_sum) for count in generated_counts]
 
-                counters_per_assignment = unordered_groupby(
-                    (counter.assignment, counter) for counter in contribution.ratinganswercounter_set.all()
-                )
+        to_add = original_sum - sum(generated_counts)
+        index = self.random.randint(0, len(generated_counts) - 1)
+        generated_counts[index] += to_add
 
-                for assignment, counters in counters_per_assignment.items():
-                    original_sum = sum(counter.count for counter in counters)
+        for counter, generated_count in zip(counters, generated_counts, strict=True):
+            assert generated_count >= 0
+            counter.count = generated_count
 
-                    missing_values = set(CHOICES[assignment.question.type].values).difference(
-                        {c.answer for c in counters}
-                    )
-                    missing_values.discard(NO_ANSWER)  # don't add NO_ANSWER counter if it didn't exist before
-                    for value in missing_values:
-                        counters.append(
-                            RatingAnswerCounter(assignment=assignment, contribution=contribution, answer=value, count=0)
-                        )
-
-                    generated_counts = [random.random() for c in counters]  # nosec
-                    generated_sum = sum(generated_counts)
-                    generated_counts = [floor(count / generated_sum * original_sum) for count in generated_counts]
-
-                    to_add = original_sum - sum(generated_counts)
-                    index = random.randint(0, len(generated_counts) - 1)  # nosec
-                    generated_counts[index] += to_add
-
-                    for counter, generated_count in zip(counters, generated_counts, strict=True):
-                        assert generated_count >= 0
-                        counter.count = generated_count
-
-                        if counter.count:
-                            counter.save()
-                        elif counter.id:
-                            counter.delete()
-
-                    assert original_sum == sum(counter.count for counter in counters)
-        finally:
-            self.stdout.ending = "\n"
+        assert original_sum == sum(counter.count for counter in counters)
 
     # Returns a string with the same number of lorem ipsum words as the given text
     @staticmethod
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from evap.evaluation.management.commands.tools import log_exceptions
+from evap.evaluation.models import Evaluation, EvaluationCounter
+
+
+@log_exceptions
+class Command(BaseCommand):
+    help = "Verifies the live participant and voter counts of all evaluations against the stored participations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Recalculate all inconsistent counts.")
+
+    def handle(self, *args, **options):
+        stored = {
+            evaluation_id: (participant_count, voter_count)
+            for evaluation_id, participant_count, voter_count in EvaluationCounter.objects.values_list(
+                "evaluation", "participant_count", "voter_count"
+            )
+        }
+        expected = Evaluation.calculate_live_counts()
+
+        inconsistent_evaluation_ids = sorted(
+            evaluation_id for evaluation_id in expected if stored.get(evaluation_id, (0, 0)) != expected[evaluation_id]
+        )
+        for evaluation_id in inconsistent_evaluation_ids:
+            self.stdout.write(
+                f"Evaluation {evaluation_id}: stored (participants, voters) {stored.get(evaluation_id, (0, 0))}, "
+                f"expected {expected[evaluation_id]}"
+            )
+
+        if not inconsistent_evaluation_ids:
+            self.stdout.write("All participant and voter counts are consistent.")
+        elif options["fix"]:
+            Evaluation.recalculate_live_counts(inconsistent_evaluation_ids)
+            self.stdout.write(f"Fixed the counts of {len(inconsistent_evaluation_ids)} evaluations.")
+        else:
+            raise CommandError(f"The counts of {len(inconsistent_evaluation_ids)} evaluations are inconsistent.")
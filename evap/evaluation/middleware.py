@@ -3,7 +3,7 @@ from collections.abc import Callable
 
 from django.http import HttpRequest, HttpResponseBase
 
-from evap.evaluation.models_logging import LoggedModel
+from evap.evaluation.models_logging import LoggedModel, buffered_logentries
 
 
 class LoggingRequestMiddleware:
@@ -27,7 +27,8 @@ class LoggingRequestMiddleware:
             # https://docs.djangoproject.com/en/4.0/topics/http/middleware/#writing-your-own-middleware
             # However, django-webtest sets DEBUG_PROPAGATE_EXCEPTIONS, and propagated exceptions caused our deletion to
             # be skipped, leading to weird errors in the tests executed afterwards. See #1727.
-            response = self.get_response(request)
+            with buffered_logentries():
+                response = self.get_response(request)
         finally:
             del LoggedModel.thread.request
             del LoggedModel.thread.request_id
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.5 on 2026-10-19 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("evaluation", "0164_remove_questionnaire_questionnaire_visibility_choices_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="logentry",
+            index=models.Index(
+                fields=["attached_to_object_type", "attached_to_object_id", "datetime"],
+                name="evaluation__attache_356583_idx",
+            ),
+        ),
+    ]
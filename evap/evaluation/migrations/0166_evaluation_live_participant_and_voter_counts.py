@@ -0,0 +1,45 @@
+# Generated by Django 6.0.5 on 2026-10-19 15:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_live_counts(apps, _schema_editor):
+    Evaluation = apps.get_model("evaluation", "Evaluation")
+
+    def count_subquery(through):
+        return Coalesce(
+            Subquery(
+                through.objects.filter(evaluation=OuterRef("pk"))
+                .values("evaluation")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+
+    Evaluation.objects.update(
+        _live_participant_count=count_subquery(Evaluation.participants.through),
+        _live_voter_count=count_subquery(Evaluation.voters.through),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluation", "0165_logentry_attached_to_object_datetime_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="evaluation",
+            name="_live_participant_count",
+            field=models.IntegerField(default=0, editable=False, verbose_name="live participant count"),
+        ),
+        migrations.AddField(
+            model_name="evaluation",
+            name="_live_voter_count",
+            field=models.IntegerField(default=0, editable=False, verbose_name="live voter count"),
+        ),
+        migrations.RunPython(populate_live_counts, reverse_code=migrations.RunPython.noop),
+    ]
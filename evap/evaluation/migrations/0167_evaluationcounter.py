@@ -0,0 +1,63 @@
+# Generated by Django 6.0.5 on 2026-10-19 17:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_live_counts_to_counters(apps, _schema_editor):
+    Evaluation = apps.get_model("evaluation", "Evaluation")
+    EvaluationCounter = apps.get_model("evaluation", "EvaluationCounter")
+
+    EvaluationCounter.objects.bulk_create(
+        EvaluationCounter(evaluation_id=evaluation_id, participant_count=participant_count, voter_count=voter_count)
+        for evaluation_id, participant_count, voter_count in Evaluation.objects.exclude(
+            _live_participant_count=0, _live_voter_count=0
+        ).values_list("pk", "_live_participant_count", "_live_voter_count")
+    )
+
+
+def copy_counters_to_live_counts(apps, _schema_editor):
+    Evaluation = apps.get_model("evaluation", "Evaluation")
+    EvaluationCounter = apps.get_model("evaluation", "EvaluationCounter")
+
+    for evaluation_id, participant_count, voter_count in EvaluationCounter.objects.values_list(
+        "evaluation", "participant_count", "voter_count"
+    ):
+        Evaluation.objects.filter(pk=evaluation_id).update(
+            _live_participant_count=participant_count, _live_voter_count=voter_count
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluation", "0166_evaluation_live_participant_and_voter_counts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EvaluationCounter",
+            fields=[
+                (
+                    "evaluation",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="counter",
+                        serialize=False,
+                        to="evaluation.evaluation",
+                    ),
+                ),
+                ("participant_count", models.IntegerField(default=0, verbose_name="participant count")),
+                ("voter_count", models.IntegerField(default=0, verbose_name="voter count")),
+            ],
+        ),
+        migrations.RunPython(copy_live_counts_to_counters, reverse_code=copy_counters_to_live_counts),
+        migrations.RemoveField(
+            model_name="evaluation",
+            name="_live_participant_count",
+        ),
+        migrations.RemoveField(
+            model_name="evaluation",
+            name="_live_voter_count",
+        ),
+    ]
@@ -2,6 +2,7 @@ import enum
 import logging
 import secrets
 import uuid
+import weakref
 from collections import defaultdict
 from collections.abc import Collection, Container, Iterable, Sequence
 from dataclasses import dataclass
@@ -17,13 +18,13 @@ from django.contrib.auth.hashers import check_password, is_password_usable, make
 from django.contrib.auth.models import BaseUserManager, Group, PermissionsMixin
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.postgres.fields import ArrayField
-from django.core.cache import caches
 from django.core.exceptions import ValidationError
 from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.db import IntegrityError, models, transaction
-from django.db.models import CheckConstraint, Count, Exists, F, Manager, OuterRef, Q, QuerySet, Subquery, Value
+from django.db.models import CheckConstraint, Count, Exists, ExpressionWrapper, F, Manager, OuterRef, Q, QuerySet, Value
 from django.db.models.functions import Coalesce, Lower, NullIf, TruncDate
-from django.db.models.signals import post_delete
+from django.db.models.lookups import GreaterThanOrEqual
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import Signal, receiver
 from django.http import HttpRequest
 from django.template import Context, Template
@@ -43,7 +44,9 @@ from evap.evaluation.models_logging import LoggedModel
 from evap.evaluation.tools import (
     StrOrPromise,
     clean_email,
+    count_subquery,
     inject_choices_constraint,
+    invalidate_start_pages,
     is_external_email,
     is_prefetched,
     password_login_is_active,
@@ -415,6 +418,9 @@ class Course(LoggedModel):
 
     @property
     def can_be_deleted_by_manager(self):
+        # the staff semester view annotates the number of evaluations to avoid a query per course
+        if hasattr(self, "num_evaluations"):
+            return self.num_evaluations == 0
         return not self.evaluations.exists()
 
     @property
@@ -447,6 +453,69 @@ class Course(LoggedModel):
         return not self.evaluations.exclude(state__gte=Evaluation.State.EVALUATED).exists()
 
 
+class EvaluationManager(Manager["Evaluation"]):
+    @staticmethod
+    def represented_by(user: "UserProfile", *, editors_only: bool = False) -> Q:
+        """
+        Condition for evaluations the user is responsible for or contributes to, directly or as a delegate. This is
+        Evaluation.is_user_responsible_or_contributor_or_delegate, or Evaluation.is_user_editor_or_delegate if
+        editors_only is set, as a database condition.
+        """
+        represented_users = UserProfile.objects.filter(Q(pk=user.pk) | Q(delegates=user))
+        contributions = Contribution.objects.filter(evaluation=OuterRef("pk"), contributor__in=represented_users)
+        if editors_only:
+            contributions = contributions.filter(role=Contribution.Role.EDITOR)
+        responsibilities = Course.responsibles.through.objects.filter(
+            course=OuterRef("course"), userprofile__in=represented_users
+        )
+        return Q(Exists(contributions)) | Q(Exists(responsibilities))
+
+    @staticmethod
+    def visibility(user: "UserProfile") -> Q:
+        """Evaluation.can_be_seen_by(user) as a database condition."""
+        if user.is_manager:
+            return Q(pk__isnull=False)
+
+        visible = EvaluationManager.represented_by(user) | Q(
+            Exists(Evaluation.participants.through.objects.filter(evaluation=OuterRef("pk"), userprofile=user))
+        )
+        if not user.is_external:
+            visible |= Q(course__is_private=False)
+        if user.is_reviewer:
+            visible |= Q(course__semester__results_are_archived=False)
+        return ~Q(state=Evaluation.State.NEW) & visible
+
+    @staticmethod
+    def results_page_visibility(user: "UserProfile") -> Q:
+        """Evaluation.can_results_page_be_seen_by(user) as a database condition."""
+        if user.is_manager:
+            return Q(pk__isnull=False)
+
+        # mirrors Evaluation.can_publish_rating_results, using the same counts as num_voters
+        can_publish_rating_results = Q(
+            GreaterThanOrEqual(
+                Coalesce("_voter_count", "counter__voter_count", 0),
+                settings.VOTER_COUNT_NEEDED_FOR_PUBLISHING_RATING_RESULTS,
+            )
+        )
+        results_are_not_archived = Q(course__semester__results_are_archived=False)
+        visible = Q(state=Evaluation.State.PUBLISHED) & (
+            EvaluationManager.represented_by(user)
+            | (can_publish_rating_results & results_are_not_archived & EvaluationManager.visibility(user))
+        )
+        if user.is_reviewer:
+            visible |= results_are_not_archived
+        return visible
+
+    def visible_to(self, user: "UserProfile") -> QuerySet["Evaluation"]:
+        """The evaluations for which Evaluation.can_be_seen_by(user) is true, as a single query."""
+        return self.filter(EvaluationManager.visibility(user))
+
+    def results_visible_to(self, user: "UserProfile") -> QuerySet["Evaluation"]:
+        """The evaluations for which Evaluation.can_results_page_be_seen_by(user) is true, as a single query."""
+        return self.filter(EvaluationManager.results_page_visibility(user))
+
+
 class Evaluation(LoggedModel):
     """Models a single evaluation, e.g. the exam evaluation of the Math 101 course of 2002."""
 
@@ -511,6 +580,9 @@ class Evaluation(LoggedModel):
     )
     _voter_count = models.IntegerField(verbose_name=_("voter count"), blank=True, null=True, default=None)
 
+    # the fields of EvaluationCounter that count the rows of the m2m fields
+    LIVE_COUNT_FIELDS = {"participants": "participant_count", "voters": "voter_count"}
+
     dropout_count = models.IntegerField(verbose_name=_("dropout count"), default=0)
 
     # when the evaluation takes place
@@ -521,6 +593,8 @@ class Evaluation(LoggedModel):
     # Disable to prevent editors from changing evaluation data
     allow_editors_to_edit = models.BooleanField(verbose_name=_("allow editors to edit"), default=True)
 
+    # vote_recorded is sent inside the transaction of a vote, evaluation_evaluated after it has been committed
+    vote_recorded = Signal()
     evaluation_evaluated = Signal()
 
     # whether to wait for grade uploading before publishing results
@@ -569,6 +643,8 @@ class Evaluation(LoggedModel):
         REVIEW_URGENT = auto()
         REVIEWED = auto()
 
+    objects = EvaluationManager()
+
     @inject_choices_constraint(locals())
     class Meta:
         unique_together = [
@@ -609,33 +685,25 @@ class Evaluation(LoggedModel):
             from evap.results.tools import (  # noqa: PLC0415
                 STATES_WITH_RESULT_TEMPLATE_CACHING,
                 STATES_WITH_RESULTS_CACHING,
+                queue_results_cache_update,
+                queue_template_cache_update,
             )
 
+            # The queued updates run once after the transaction commits, so multiple state changes of the same
+            # evaluation (or of multiple evaluations of the same course) only cause a single recomputation.
+            # The queue decides between updating and deleting the cache entries based on the state at that time.
             if (
                 state_changed_to(self, STATES_WITH_RESULTS_CACHING)
+                or state_changed_from(self, STATES_WITH_RESULTS_CACHING)
                 or self.state_change_source == Evaluation.State.EVALUATED
                 and self.state == Evaluation.State.REVIEWED
             ):  # reviewing changes results -> cache update required
-                from evap.results.tools import cache_results  # noqa: PLC0415
-
-                cache_results(self)
-            elif state_changed_from(self, STATES_WITH_RESULTS_CACHING):
-                from evap.results.tools import get_results_cache_key  # noqa: PLC0415
-
-                caches["results"].delete(get_results_cache_key(self))
-
-            if state_changed_to(self, STATES_WITH_RESULT_TEMPLATE_CACHING):
-                from evap.results.views import update_template_cache_of_published_evaluations_in_course  # noqa: PLC0415
-
-                update_template_cache_of_published_evaluations_in_course(self.course)
-            elif state_changed_from(self, STATES_WITH_RESULT_TEMPLATE_CACHING):
-                from evap.results.views import (  # noqa: PLC0415
-                    delete_template_cache,
-                    update_template_cache_of_published_evaluations_in_course,
-                )
+                queue_results_cache_update([self])
 
-                delete_template_cache(self)
-                update_template_cache_of_published_evaluations_in_course(self.course)
+            if state_changed_to(self, STATES_WITH_RESULT_TEMPLATE_CACHING) or state_changed_from(
+                self, STATES_WITH_RESULT_TEMPLATE_CACHING
+            ):
+                queue_template_cache_update(self)
             del self.state_change_source
 
     @property
@@ -1109,20 +1177,62 @@ class Evaluation(LoggedModel):
 
     @classmethod
     def annotate_with_participant_and_voter_counts(cls, evaluation_query):
-        subquery = Evaluation.objects.filter(pk=OuterRef("pk"))
+        return evaluation_query.annotate(
+            num_participants=Coalesce("_participant_count", "counter__participant_count", 0),
+            num_voters=Coalesce("_voter_count", "counter__voter_count", 0),
+        )
 
-        participant_count_subquery = subquery.annotate(
-            num_participants=Coalesce("_participant_count", Count("participants")),
-        ).values("num_participants")
+    @staticmethod
+    def calculate_live_counts(evaluation_ids: Collection[int] | None = None) -> dict[int, tuple[int, int]]:
+        """Counts the participants and voters rows, returning (participants, voters) for each evaluation."""
+        evaluations = Evaluation.objects.all()
+        if evaluation_ids is not None:
+            evaluations = evaluations.filter(pk__in=evaluation_ids)
+
+        counts = {
+            m2m_field_name: count_subquery(
+                getattr(Evaluation, m2m_field_name).through.objects.filter(evaluation=OuterRef("pk")), "evaluation"
+            )
+            for m2m_field_name in Evaluation.LIVE_COUNT_FIELDS
+        }
+        return {
+            evaluation_id: (participant_count, voter_count)
+            for evaluation_id, participant_count, voter_count in evaluations.values_list(
+                "pk", counts["participants"], counts["voters"]
+            )
+        }
 
-        voter_count_subquery = subquery.annotate(
-            num_voters=Coalesce("_voter_count", Count("voters")),
-        ).values("num_voters")
+    @staticmethod
+    def recalculate_live_counts(evaluation_ids: Collection[int]) -> None:
+        counters = []
+        for evaluation_id, (participant_count, voter_count) in Evaluation.calculate_live_counts(evaluation_ids).items():
+            counters.append(
+                EvaluationCounter(
+                    evaluation_id=evaluation_id, participant_count=participant_count, voter_count=voter_count
+                )
+            )
+        EvaluationCounter.objects.bulk_create(
+            counters,
+            update_conflicts=True,
+            unique_fields=["evaluation"],
+            update_fields=["participant_count", "voter_count"],
+        )
 
-        return evaluation_query.annotate(
-            num_participants=Subquery(participant_count_subquery),
-            num_voters=Subquery(voter_count_subquery),
+    @staticmethod
+    def add_to_live_counts(m2m_field_name: str, values_by_evaluation_id: dict[int, int]) -> None:
+        field_name = Evaluation.LIVE_COUNT_FIELDS[m2m_field_name]
+        EvaluationCounter.objects.bulk_create(
+            [EvaluationCounter(evaluation_id=evaluation_id) for evaluation_id in values_by_evaluation_id],
+            ignore_conflicts=True,
         )
+        # there are only few distinct values, so this needs few queries while still changing the counts atomically
+        evaluation_ids_by_value = defaultdict(list)
+        for evaluation_id, value in values_by_evaluation_id.items():
+            evaluation_ids_by_value[value].append(evaluation_id)
+        for value, evaluation_ids in evaluation_ids_by_value.items():
+            EvaluationCounter.objects.filter(evaluation__in=evaluation_ids).update(
+                **{field_name: F(field_name) + value}
+            )
 
     @property
     def unlogged_fields(self):
@@ -1155,6 +1265,64 @@ def log_state_transition(instance, name, source: int, target: int, **_kwargs):
     )
 
 
+class EvaluationCounter(models.Model):
+    """
+    Denormalized counts of the participants and voters rows of an evaluation, so that listings do not need to count
+    them. Changes of the rows increment them atomically, the management command `verify_counters` checks them. A
+    missing row means that both counts are zero.
+    """
+
+    evaluation = models.OneToOneField(Evaluation, models.CASCADE, primary_key=True, related_name="counter")
+    participant_count = models.IntegerField(verbose_name=_("participant count"), default=0)
+    voter_count = models.IntegerField(verbose_name=_("voter count"), default=0)
+
+
+@receiver(m2m_changed, sender=Evaluation.participants.through)
+@receiver(m2m_changed, sender=Evaluation.voters.through)
+def update_live_counts_on_m2m_change(sender, instance, action: str, pk_set, **kwargs) -> None:
+    m2m_field_name = "participants" if sender is Evaluation.participants.through else "voters"
+    is_reverse = kwargs["reverse"]
+
+    if action == "post_add" and pk_set:
+        # only the newly added rows are in pk_set
+        values_by_evaluation_id = dict.fromkeys(pk_set, 1) if is_reverse else {instance.pk: len(pk_set)}
+    elif action == "pre_remove" and pk_set or action == "pre_clear":
+        # pk_set may contain rows that do not exist, so count the rows before they are deleted in the same transaction
+        rows = sender.objects.filter(userprofile=instance) if is_reverse else sender.objects.filter(evaluation=instance)
+        if action == "pre_remove":
+            rows = rows.filter(**{"evaluation__in" if is_reverse else "userprofile__in": pk_set})
+        values_by_evaluation_id = {
+            evaluation_id: -count
+            for evaluation_id, count in rows.values("evaluation")
+            .annotate(count=Count("pk"))
+            .values_list("evaluation", "count")
+        }
+    else:
+        return
+
+    Evaluation.add_to_live_counts(m2m_field_name, values_by_evaluation_id)
+
+
+@receiver(post_save, sender=Evaluation)
+def reset_live_counts_on_raw_save(instance: Evaluation, raw: bool, **_kwargs) -> None:
+    # loaddata adds the participants and voters afterwards, which counts them again
+    if raw:
+        EvaluationCounter.objects.filter(evaluation=instance).delete()
+
+
+@receiver(m2m_changed, sender=Evaluation.participants.through)
+@receiver(m2m_changed, sender=Evaluation.voters.through)
+def invalidate_start_pages_on_participation_change(sender, instance, action: str, pk_set, **kwargs) -> None:
+    if action in ("post_add", "post_remove") and not pk_set:
+        return
+    if kwargs["reverse"] and action in ("post_add", "post_remove", "post_clear"):
+        invalidate_start_pages([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        invalidate_start_pages(pk_set)
+    elif action == "pre_clear" and not kwargs["reverse"]:
+        invalidate_start_pages(sender.objects.filter(evaluation=instance).values_list("userprofile", flat=True))
+
+
 class Contribution(LoggedModel):
     """A contributor who is assigned to an evaluation and their questionnaires."""
 
@@ -2017,6 +2185,7 @@ class UserProfile(EvapBaseUser, PermissionsMixin):
 
     @property
     def can_be_marked_inactive_by_manager(self):
+        # keep in sync with annotate_removability_by_manager
         if self.is_reviewer or self.is_grade_publisher or self.is_superuser:
             return False
         if any(not evaluation.participations_are_archived for evaluation in self.evaluations_participating_in.all()):
@@ -2029,6 +2198,7 @@ class UserProfile(EvapBaseUser, PermissionsMixin):
 
     @property
     def can_be_deleted_by_manager(self):
+        # keep in sync with annotate_removability_by_manager
         if (
             self.is_responsible
             or self.is_contributor
@@ -2043,6 +2213,34 @@ class UserProfile(EvapBaseUser, PermissionsMixin):
             return False
         return True
 
+    @staticmethod
+    def annotate_removability_by_manager(users: QuerySet["UserProfile"]) -> QuerySet["UserProfile"]:
+        """
+        Annotate is_deletable_by_manager and is_deactivatable_by_manager, the set-based versions of
+        can_be_deleted_by_manager and can_be_marked_inactive_by_manager.
+        """
+        unarchived = Q(evaluation__course__semester__participations_are_archived=False)
+        is_privileged = Exists(
+            UserProfile.groups.through.objects.filter(
+                userprofile=OuterRef("pk"), group__name__in=["Manager", "Reviewer", "Grade publisher"]
+            )
+        )
+        has_unarchived_participation = Exists(
+            Evaluation.participants.through.objects.filter(unarchived, userprofile=OuterRef("pk"))
+        )
+        is_removable = ~is_privileged & Q(is_superuser=False, is_proxy_user=False) & ~has_unarchived_participation
+        is_responsible = Exists(Course.responsibles.through.objects.filter(userprofile=OuterRef("pk")))
+        is_contributor = Exists(Contribution.objects.filter(contributor=OuterRef("pk")))
+        has_unarchived_contribution = Exists(Contribution.objects.filter(unarchived, contributor=OuterRef("pk")))
+        return users.annotate(
+            is_deletable_by_manager=ExpressionWrapper(
+                is_removable & ~is_responsible & ~is_contributor, output_field=models.BooleanField()
+            ),
+            is_deactivatable_by_manager=ExpressionWrapper(
+                is_removable & ~has_unarchived_contribution, output_field=models.BooleanField()
+            ),
+        )
+
     @cached_property
     def is_participant(self):
         return self.evaluations_participating_in.exists()
@@ -2122,7 +2320,8 @@ class UserProfile(EvapBaseUser, PermissionsMixin):
 
     def ensure_valid_login_key(self):
         if self.login_key and self.login_key_valid_until > date.today():
-            self.reset_login_key_validity()
+            if self.login_key_valid_until != UserProfile.new_login_key_validity():
+                self.reset_login_key_validity()
             return
 
         while True:
@@ -2135,8 +2334,42 @@ class UserProfile(EvapBaseUser, PermissionsMixin):
                 # unique constraint failed, the login key was already in use. Generate another one.
                 continue
 
+    @staticmethod
+    def ensure_valid_login_keys(users: Iterable["UserProfile"]) -> None:
+        """
+        Bulk version of ensure_valid_login_key for all given users that need a login key. The new keys are checked
+        for collisions before saving, so all keys and validity dates are written with a single bulk_update.
+        """
+        valid_until = UserProfile.new_login_key_validity()
+        users = [user for user in users if user.needs_login_key and user.login_key_valid_until != valid_until]
+        users_without_valid_key = [
+            user
+            for user in users
+            if not (user.login_key and user.login_key_valid_until and user.login_key_valid_until > date.today())
+        ]
+
+        new_keys: set[int] = set()
+        while len(new_keys) < len(users_without_valid_key):
+            candidates = {
+                secrets.choice(range(UserProfile.MAX_LOGIN_KEY))
+                for __ in range(len(users_without_valid_key) - len(new_keys))
+            }
+            candidates -= new_keys
+            candidates -= set(UserProfile.objects.filter(login_key__in=candidates).values_list("login_key", flat=True))
+            new_keys |= candidates
+
+        for user, key in zip(users_without_valid_key, new_keys, strict=True):
+            user.login_key = key
+        for user in users:
+            user.login_key_valid_until = valid_until
+        UserProfile.objects.bulk_update(users, ["login_key", "login_key_valid_until"])
+
+    @staticmethod
+    def new_login_key_validity() -> date:
+        return date.today() + timedelta(settings.LOGIN_KEY_VALIDITY)
+
     def reset_login_key_validity(self):
-        self.login_key_valid_until = date.today() + timedelta(settings.LOGIN_KEY_VALIDITY)
+        self.login_key_valid_until = UserProfile.new_login_key_validity()
         self.save()
 
     @property
@@ -2167,6 +2400,83 @@ class UserProfile(EvapBaseUser, PermissionsMixin):
         return sorted(evaluations_and_days_left, key=lambda tup: (tup[1], tup[0].full_name))
 
 
+# the users whose participations and votes were already subtracted from the live counts, for each running deletion
+_users_removed_from_live_counts: weakref.WeakKeyDictionary[Any, set[int]] = weakref.WeakKeyDictionary()
+
+
+@receiver(pre_delete, sender=UserProfile)
+def update_live_counts_on_user_delete(instance: UserProfile, origin, **_kwargs) -> None:
+    # The cascade deletes the participations and votes without sending m2m_changed. When deleting a queryset, this is
+    # sent for each of its users before anything is deleted, so the rows of all of them are subtracted at once.
+    if not isinstance(origin, QuerySet) or origin.model is not UserProfile:
+        user_ids = {instance.pk}
+    elif instance.pk in _users_removed_from_live_counts.get(origin, ()):
+        return
+    else:
+        user_ids = set(origin.order_by().values_list("pk", flat=True))
+        _users_removed_from_live_counts.setdefault(origin, set()).update(user_ids)
+
+    for m2m_field_name in Evaluation.LIVE_COUNT_FIELDS:
+        rows = getattr(Evaluation, m2m_field_name).through.objects.filter(userprofile__in=user_ids)
+        Evaluation.add_to_live_counts(
+            m2m_field_name,
+            {
+                evaluation_id: -count
+                for evaluation_id, count in rows.values("evaluation")
+                .annotate(count=Count("pk"))
+                .values_list("evaluation", "count")
+            },
+        )
+
+
+@receiver(post_save, sender=Semester)
+@receiver(post_delete, sender=Semester)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Evaluation)
+@receiver(post_delete, sender=Evaluation)
+@receiver(post_save, sender=Contribution)
+@receiver(post_delete, sender=Contribution)
+def invalidate_start_pages_on_save_or_delete(**_kwargs) -> None:
+    # this includes all state transitions of evaluations, which are always saved afterwards
+    invalidate_start_pages()
+
+
+@receiver(m2m_changed, sender=Course.programs.through)
+@receiver(m2m_changed, sender=Course.responsibles.through)
+@receiver(m2m_changed, sender=UserProfile.delegates.through)
+def invalidate_start_pages_on_m2m_change(action: str, pk_set, **_kwargs) -> None:
+    if action == "post_clear" or action in ("post_add", "post_remove") and pk_set:
+        invalidate_start_pages()
+
+
+@receiver(m2m_changed, sender=Course.responsibles.through)
+def delete_results_index_cache_on_responsibles_change(instance, action: str, pk_set, **kwargs) -> None:
+    # the results index stores the responsibles and contributors of each evaluation to decide about its visibility
+    from evap.results.views import delete_results_index_cache  # noqa: PLC0415
+
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not kwargs["reverse"]:
+        delete_results_index_cache([instance.semester_id])
+    elif action == "pre_clear":
+        delete_results_index_cache(Course.objects.filter(responsibles=instance).values_list("semester", flat=True))
+    elif pk_set:
+        delete_results_index_cache(Course.objects.filter(pk__in=pk_set).values_list("semester", flat=True))
+
+
+@receiver(post_save, sender=Contribution)
+@receiver(post_delete, sender=Contribution)
+def delete_results_index_cache_on_contribution_change(instance: Contribution, **_kwargs) -> None:
+    from evap.results.views import delete_results_index_cache  # noqa: PLC0415
+
+    delete_results_index_cache(
+        Evaluation.objects.filter(pk=instance.evaluation_id, state=Evaluation.State.PUBLISHED).values_list(
+            "course__semester", flat=True
+        )
+    )
+
+
 def validate_template(value):
     """Field validator which ensures that the value can be compiled into a
     Django Template."""
@@ -2270,6 +2580,9 @@ class EmailTemplate(models.Model):
             for user in recipients:
                 user_evaluation_map.setdefault(user, []).append(evaluation)
 
+        # provision the login keys up front, so that sending the emails does not save each user separately
+        UserProfile.ensure_valid_login_keys(user for user in user_evaluation_map if user.email)
+
         for user, user_evaluations in user_evaluation_map.items():
             remaining_days_by_evaluation = {
                 evaluation: (evaluation.vote_end_date - date.today()).days for evaluation in user_evaluations
@@ -1,10 +1,10 @@
-import itertools
 import threading
 from collections import defaultdict, namedtuple
 from collections.abc import Iterator
 from contextlib import contextmanager
 from datetime import date, datetime, time
 from enum import StrEnum
+from functools import cache, partial
 from json import JSONEncoder
 from typing import assert_never
 
@@ -12,6 +12,7 @@ from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models import Q, prefetch_related_objects
 from django.db.models.signals import m2m_changed
 from django.dispatch import receiver
 from django.forms.models import model_to_dict
@@ -19,10 +20,12 @@ from django.template.defaultfilters import yesno
 from django.utils.formats import localize
 from django.utils.translation import gettext_lazy as _
 
-from evap.evaluation.tools import capitalize_first, inject_choices_constraint
+from evap.evaluation.tools import TrackedOnCommit, capitalize_first, inject_choices_constraint
 
 CREATE_LOGENTRIES = True
 
+LOGENTRY_GROUPS_PER_PAGE = 20
+
 
 @contextmanager
 def disable_logentries() -> Iterator[None]:
@@ -45,6 +48,7 @@ class FieldActionType(StrEnum):
 
 
 FieldAction = namedtuple("FieldAction", "label type items")
+LogEntryPage = namedtuple("LogEntryPage", "groups next_before")
 
 
 class InstanceActionType(StrEnum):
@@ -107,6 +111,7 @@ class LogEntry(models.Model):
     @inject_choices_constraint(locals())
     class Meta:
         ordering = ["-datetime", "-id"]
+        indexes = [models.Index(fields=["attached_to_object_type", "attached_to_object_id", "datetime"])]
 
     @property
     def field_context_data(self):
@@ -140,6 +145,62 @@ class LogEntry(models.Model):
         )
 
 
+class LogEntryBuffer:
+    """
+    Collects logentries, so that they can be written with a single query.
+    Like on_commit callbacks, changes to the buffer are dropped if the (sub)transaction they were made in rolls back.
+    Unlike them, they are kept if that transaction is still open when the buffer is flushed, e.g. inside of TestCase.
+    """
+
+    def __init__(self) -> None:
+        # (transaction, logentry) to add it, (transaction, (attached_to_object_type_id, attached_to_object_id)) to
+        # discard the entries attached to that object
+        self.operations: list[tuple[TrackedOnCommit, LogEntry | tuple[int, int]]] = []
+
+    def _record(self, operation: LogEntry | tuple[int, int]) -> None:
+        self.operations.append((TrackedOnCommit(), operation))
+
+    def add(self, entry: LogEntry) -> None:
+        self._record(entry)
+
+    def discard_attached_to(self, attached_to_object_type: ContentType, attached_to_object_id: int) -> None:
+        self._record((attached_to_object_type.pk, attached_to_object_id))
+
+    def flush(self) -> None:
+        operations = self.operations
+        self.operations = []
+
+        entries: dict[int, LogEntry] = {}
+        for operation_transaction, operation in operations:
+            if not operation_transaction.has_run and not operation_transaction.is_pending:
+                # rolled back
+                continue
+            if isinstance(operation, LogEntry):
+                entries[id(operation)] = operation
+            else:
+                entries = {
+                    key: entry
+                    for key, entry in entries.items()
+                    if (entry.attached_to_object_type_id, entry.attached_to_object_id) != operation
+                }
+
+        LogEntry.objects.bulk_create([entry for entry in entries.values() if entry.pk is None])
+        LogEntry.objects.bulk_update([entry for entry in entries.values() if entry.pk is not None], ["data"])
+
+
+@contextmanager
+def buffered_logentries() -> Iterator[None]:
+    """Write all logentries of changes committed in this block at its end, instead of one query per change."""
+    old_buffer = getattr(LoggedModel.thread, "logentry_buffer", None)
+    buffer = LoggedModel.thread.logentry_buffer = LogEntryBuffer()
+    try:
+        yield
+    finally:
+        LoggedModel.thread.logentry_buffer = old_buffer
+        # entries of changes that were not rolled back are written even if an exception occurred
+        buffer.flush()
+
+
 class LoggedModel(models.Model):
     thread = threading.local()
 
@@ -149,7 +210,10 @@ class LoggedModel(models.Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._logentry = None
-        self._m2m_changes = defaultdict(lambda: defaultdict(list))
+        # not a lambda, so that instances can be pickled, e.g. for caching
+        self._m2m_changes = defaultdict(partial(defaultdict, list))
+        # field values as they are stored in the database, to find changes without fetching the instance again
+        self._saved_field_values = {}
 
     def save(self, *args, **kw):
         # Are we creating a new instance?
@@ -159,10 +223,40 @@ class LoggedModel(models.Model):
             super().save(*args, **kw)
             self.log_instance_create()
         else:
-            # when saving an existing instance, we get changes by comparing to the version from the database
+            # when saving an existing instance, we get changes by comparing to the saved field values
             # therefore we save the instance after building the logentry
             self.log_instance_change()
             super().save(*args, **kw)
+        self._snapshot_field_values(kw.get("update_fields"))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_field_values = dict(zip(field_names, values, strict=True))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        self._snapshot_field_values(fields)
+
+    def _snapshot_field_values(self, field_names=None):
+        concrete_fields = self._meta.concrete_fields
+        if field_names is not None:
+            # refresh_from_db also accepts names of reverse relations, to clear their prefetch cache
+            concrete_fields = [
+                field for field in map(self._meta.get_field, field_names) if field in self._meta.concrete_fields
+            ]
+        # deferred fields are not in __dict__ and must not be loaded here
+        self._saved_field_values.update(
+            (field.attname, self.__dict__[field.attname]) for field in concrete_fields if field.attname in self.__dict__
+        )
+
+    def has_unsaved_changes(self, *attnames: str) -> bool:
+        """Whether any of the given fields differs from its stored value. Fields with unknown stored values count as changed."""
+        return any(
+            attname not in self._saved_field_values or self._saved_field_values[attname] != getattr(self, attname)
+            for attname in attnames
+        )
 
     def _as_dict(self):
         """
@@ -177,6 +271,18 @@ class LoggedModel(models.Model):
         ]
         return model_to_dict(self, fields)
 
+    def _saved_as_dict(self):
+        """Like _as_dict, but with the values stored in the database. Fetches the instance if they are unknown."""
+        field_names = self._as_dict().keys()
+        try:
+            return {
+                field_name: self._saved_field_values[self._meta.get_field(field_name).attname]
+                for field_name in field_names
+            }
+        except KeyError:
+            # not loaded from or saved to the database by this instance, or deferred fields
+            return type(self)._default_manager.get(pk=self.pk)._as_dict()
+
     def _get_change_data(self, action_type: InstanceActionType):
         """
         Return a dict mapping field names to changes that happened in this model instance,
@@ -190,14 +296,14 @@ class LoggedModel(models.Model):
                 if created_value is not None
             }
         elif action_type == InstanceActionType.CHANGE:
-            old_dict = type(self)._default_manager.get(pk=self.pk)._as_dict()
+            old_dict = self._saved_as_dict()
             changes = {
                 field_name: {FieldActionType.VALUE_CHANGE: [old_value, self_dict[field_name]]}
                 for field_name, old_value in old_dict.items()
                 if old_value != self_dict[field_name]
             }
         elif action_type == InstanceActionType.DELETE:
-            old_dict = type(self)._default_manager.get(pk=self.pk)._as_dict()
+            old_dict = self._saved_as_dict()
             changes = {
                 field_name: {FieldActionType.INSTANCE_DELETE: [deleted_value]}
                 for field_name, deleted_value in old_dict.items()
@@ -246,7 +352,9 @@ class LoggedModel(models.Model):
         attach_to_model, attached_to_object_id = self.object_to_attach_logentries_to
         attached_to_object_type = ContentType.objects.get_for_model(attach_to_model)
         return LogEntry(
-            content_object=self,
+            # not content_object=self, so that buffered logentries of deleted objects can be saved
+            content_type=ContentType.objects.get_for_model(type(self)),
+            content_object_id=self.pk,
             attached_to_object_type=attached_to_object_type,
             attached_to_object_id=attached_to_object_id,
             user=user,
@@ -271,12 +379,21 @@ class LoggedModel(models.Model):
         self._logentry.data.update(changes)
 
         if store_in_db:
-            self._logentry.save()
+            buffer = getattr(self.thread, "logentry_buffer", None)
+            if buffer is None:
+                self._logentry.save()
+            else:
+                buffer.add(self._logentry)
 
     def delete(self, *args, **kw):
         self.log_instance_delete()
         self.related_logentries().delete()
+        pk = self.pk
         super().delete(*args, **kw)
+        buffer = getattr(self.thread, "logentry_buffer", None)
+        if buffer is not None:
+            # deletion signals might have caused further logentries, so this has to be done afterwards
+            buffer.discard_attached_to(ContentType.objects.get_for_model(type(self)), pk)
 
     @staticmethod
     def update_log_after_bulk_create(instances):
@@ -299,7 +416,18 @@ class LoggedModel(models.Model):
         for instance in from_instances:
             instance.log_m2m_change(m2m_field, FieldActionType.M2M_ADD, added_related[instance.pk], store_in_db=False)
 
-        logentries = [instance._logentry for instance in from_instances]
+        LoggedModel.store_logentries(from_instances)
+
+    @staticmethod
+    def store_logentries(instances):
+        """Store the logentries that were updated with store_in_db=False for all instances at once."""
+        logentries = [instance._logentry for instance in instances if instance._logentry is not None]
+
+        buffer = getattr(LoggedModel.thread, "logentry_buffer", None)
+        if buffer is not None:
+            for logentry in logentries:
+                buffer.add(logentry)
+            return
 
         to_create = [logentry for logentry in logentries if logentry.pk is None]
         to_update = [logentry for logentry in logentries if logentry.pk is not None]
@@ -316,18 +444,38 @@ class LoggedModel(models.Model):
             attached_to_object_id=self.pk,
         )
 
-    def grouped_logentries(self):
+    def grouped_logentries(self, before: LogEntry | None = None, group_count: int = LOGENTRY_GROUPS_PER_PAGE):
         """
-        Returns a list of lists of logentries for display. The order is not changed.
-        Logentries are grouped if they have a matching request_id.
+        Returns a page of at most `group_count` lists of logentries for display, starting after the logentry `before`.
+        The order is not changed. Logentries are grouped if they have a matching request_id.
+        Only the logentries of the page are fetched, the last of them can be used as `before` to fetch the next page.
         """
-        yield from (
-            list(group)
-            for key, group in itertools.groupby(
-                self.related_logentries().select_related("user"),
-                lambda entry: entry.request_id or entry.pk,
-            )
-        )
+        logentries = self.related_logentries().select_related("user", "content_type")
+        batch_size = group_count * 5
+        groups: list[list[LogEntry]] = []
+        next_before = None
+        while True:
+            batch = logentries
+            if before is not None:
+                batch = batch.filter(Q(datetime__lt=before.datetime) | Q(datetime=before.datetime, id__lt=before.id))
+            batch = list(batch[:batch_size])
+
+            for entry in batch:
+                if groups and (entry.request_id or entry.pk) == (groups[-1][0].request_id or groups[-1][0].pk):
+                    groups[-1].append(entry)
+                elif len(groups) < group_count:
+                    groups.append([entry])
+                else:
+                    next_before = groups[-1][-1]
+                    break
+
+            if next_before is not None or len(batch) < batch_size:
+                break
+            before = batch[-1]
+
+        # messages of the page show the logged objects
+        prefetch_related_objects([entry for group in groups for entry in group], "content_object")
+        return LogEntryPage(groups, next_before)
 
     @property
     def object_to_attach_logentries_to(self):
@@ -346,17 +494,23 @@ class LoggedModel(models.Model):
         return ["id", "order"]
 
 
+@cache
+def _m2m_field_name(model_class, through) -> str | None:
+    """Return the name of the m2m field of model_class that uses the through model, as m2m_changed only sends the latter."""
+    return next(
+        (field.name for field in model_class._meta.many_to_many if getattr(model_class, field.name).through == through),
+        None,
+    )
+
+
 @receiver(m2m_changed)
 def _m2m_changed(sender, instance, action, reverse, model, pk_set, **kwargs):  # noqa: PLR0912
     model_class = model if reverse else type(instance)
-    field_name = next(
-        (field.name for field in model_class._meta.many_to_many if getattr(model_class, field.name).through == sender),
-        None,
-    )
-    if field_name is None:
+    if not issubclass(model_class, LoggedModel):
         return
 
-    if not issubclass(model_class, LoggedModel):
+    field_name = _m2m_field_name(model_class, sender)
+    if field_name is None:
         return
 
     match action:
@@ -386,11 +540,14 @@ def _m2m_changed(sender, instance, action, reverse, model, pk_set, **kwargs):  #
             related_name = field.remote_field.get_accessor_name()
             related_instances = getattr(instance, related_name).all()
 
+        related_instances = [
+            related_instance
+            for related_instance in related_instances
+            if field_name not in related_instance.unlogged_fields
+        ]
         for related_instance in related_instances:
-            if field_name in related_instance.unlogged_fields:
-                continue
-
-            related_instance.log_m2m_change(field_name, action_type, [instance.pk])
+            related_instance.log_m2m_change(field_name, action_type, [instance.pk], store_in_db=False)
+        LoggedModel.store_logentries(related_instances)
     else:
         if field_name in instance.unlogged_fields:
             return
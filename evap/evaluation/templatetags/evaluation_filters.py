@@ -4,7 +4,7 @@ from django.forms import TypedChoiceField
 from django.template import Library
 from django.utils.translation import gettext_lazy as _
 
-from evap.evaluation.models import BASE_UNIPOLAR_CHOICES, Contribution, Evaluation
+from evap.evaluation.models import BASE_UNIPOLAR_CHOICES, Evaluation
 from evap.results.tools import RatingResult
 from evap.rewards.tools import can_reward_points_be_used_by
 from evap.student.forms import HeadingField
@@ -178,16 +178,6 @@ def is_heading_field(field):
     return isinstance(field.field, HeadingField)
 
 
-@register.filter
-def is_user_editor_or_delegate(evaluation, user):
-    return evaluation.is_user_editor_or_delegate(user)
-
-
-@register.filter
-def is_user_responsible_or_contributor_or_delegate(evaluation, user):
-    return evaluation.is_user_responsible_or_contributor_or_delegate(user)
-
-
 @register.filter
 def message_class(level):
     return {
@@ -206,15 +196,6 @@ def hours_and_minutes(time_left_for_evaluation):
     return f"{hours:02}:{minutes:02}"
 
 
-@register.filter
-def has_nonresponsible_editor(evaluation):
-    return (
-        evaluation.contributions.filter(role=Contribution.Role.EDITOR)
-        .exclude(contributor__in=evaluation.course.responsibles.all())
-        .exists()
-    )
-
-
 @register.filter
 def order_by(iterable, attribute):
     return sorted(iterable, key=lambda item: getattr(item, attribute))
@@ -9,6 +9,7 @@ from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from django.core import mail, management
 from django.core.management import CommandError
+from django.db import transaction
 from django.db.models import Sum
 from django.test.utils import override_settings
 from model_bakery import baker
@@ -20,6 +21,7 @@ from evap.evaluation.models import (
     Course,
     EmailTemplate,
     Evaluation,
+    EvaluationCounter,
     QuestionAssignment,
     Questionnaire,
     RatingAnswerCounter,
@@ -175,6 +177,33 @@ class TestAnonymizeCommand(TestCase):
             ]
             self.assertEqual(answers_per_assignment[assignment], answer_count)
 
+    def test_same_seed_same_result(self):
+        baker.make(UserProfile, _quantity=5, password=make_password(None), login_key=iter(range(5)))
+        baker.make(TextAnswer, contribution=self.contribution, answer="some secret text", _quantity=3)
+        counters = []
+        for assignment in self.contributor_assignments:
+            counts = [5 for choice in CHOICES[assignment.question.type].values if choice != NO_ANSWER]
+            counters.extend(make_rating_answer_counters(assignment, self.contribution, counts, False))
+        RatingAnswerCounter.objects.bulk_create(counters)
+
+        def anonymized_data():
+            with transaction.atomic():
+                output = StringIO()
+                management.call_command("anonymize", "--seed", "42", "--chunk-size", "2", stdout=output)
+                self.assertIn("Anonymized users in", output.getvalue())
+                data = (
+                    list(UserProfile.objects.order_by("pk").values_list("email", "last_name", "login_key")),
+                    list(Course.objects.order_by("pk").values_list("name_en", "type")),
+                    list(TextAnswer.objects.order_by("pk").values_list("answer")),
+                    list(RatingAnswerCounter.objects.order_by("assignment", "answer").values_list("answer", "count")),
+                )
+                transaction.set_rollback(True)
+            return data
+
+        data = anonymized_data()
+        self.assertNotIn("secret.email@hpi.de", [email for email, __, __ in data[0]])
+        self.assertEqual(data, anonymized_data())
+
     def test_user_with_password(self):
         baker.make(UserProfile, password=make_password("evap"))
         with self.assertRaises(AssertionError):
@@ -191,6 +220,39 @@ class TestRefreshResultsCacheCommand(TestCase):
         self.assertEqual(mock.call_count, Evaluation.objects.count())
 
 
+class TestVerifyCountersCommand(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.evaluation = baker.make(Evaluation, participants=baker.make(UserProfile, _quantity=3))
+        cls.evaluation.voters.add(cls.evaluation.participants.first())
+
+    def test_consistent_counts(self):
+        output = StringIO()
+        management.call_command("verify_counters", stdout=output)
+        self.assertIn("All participant and voter counts are consistent.", output.getvalue())
+
+    def test_inconsistent_counts(self):
+        EvaluationCounter.objects.filter(evaluation=self.evaluation).update(participant_count=10, voter_count=0)
+
+        output = StringIO()
+        with self.assertRaisesMessage(CommandError, "The counts of 1 evaluations are inconsistent."):
+            management.call_command("verify_counters", stdout=output)
+        self.assertIn(
+            f"Evaluation {self.evaluation.pk}: stored (participants, voters) (10, 0), expected (3, 1)",
+            output.getvalue(),
+        )
+
+        management.call_command("verify_counters", "--fix", stdout=output)
+        self.assertIn("Fixed the counts of 1 evaluations.", output.getvalue())
+        self.assertEqual(
+            EvaluationCounter.objects.values_list("participant_count", "voter_count").get(evaluation=self.evaluation),
+            (3, 1),
+        )
+
+        management.call_command("verify_counters", stdout=output)
+        self.assertIn("All participant and voter counts are consistent.", output.getvalue())
+
+
 class TestScssCommand(TestCase):
     def setUp(self):
         self.scss_path = settings.STATICFILES_DIRS[0] / "scss" / "evap.scss"
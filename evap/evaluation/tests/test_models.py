@@ -1,3 +1,4 @@
+import random
 from datetime import date, datetime, timedelta
 from unittest.mock import Mock, call, patch
 
@@ -5,7 +6,10 @@ from django.contrib.auth.models import Group
 from django.core import mail
 from django.core.cache import caches
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Count
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django_fsm import TransitionNotAllowed
 from model_bakery import baker
 
@@ -15,6 +19,7 @@ from evap.evaluation.models import (
     CourseType,
     EmailTemplate,
     Evaluation,
+    EvaluationCounter,
     NotArchivableError,
     Question,
     QuestionAssignment,
@@ -30,6 +35,7 @@ from evap.evaluation.tests.tools import (
     let_user_vote_for_evaluation,
     make_contributor,
     make_editor,
+    make_random_visibility_scenario,
 )
 from evap.grades.models import GradeDocument
 from evap.results.tools import cache_results, calculate_average_distribution
@@ -450,7 +456,8 @@ class TestEvaluations(WebTest):
         )
 
         evaluation.publish()
-        evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluation.save()
 
         self.assertIsNotNone(
             caches["results"].get(get_evaluation_result_template_fragment_cache_key(evaluation.id, "en", True))
@@ -466,7 +473,8 @@ class TestEvaluations(WebTest):
         )
 
         evaluation.unpublish()
-        evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluation.save()
 
         self.assertIsNone(
             caches["results"].get(get_evaluation_result_template_fragment_cache_key(evaluation.id, "en", True))
@@ -576,6 +584,96 @@ class TestEvaluations(WebTest):
         evaluation.save()
         evaluation.manager_approve()
 
+    def assert_live_counts(self, evaluation, participant_count, voter_count):
+        self.assertEqual(
+            EvaluationCounter.objects.values_list("participant_count", "voter_count").get(evaluation=evaluation),
+            (participant_count, voter_count),
+        )
+        self.assertEqual(
+            Evaluation.calculate_live_counts([evaluation.pk])[evaluation.pk], (participant_count, voter_count)
+        )
+
+    def test_live_counts_follow_participation_changes(self):
+        evaluation = baker.make(Evaluation)
+        other_evaluation = baker.make(Evaluation)
+        users = baker.make(UserProfile, _quantity=3)
+
+        evaluation.participants.add(*users)
+        evaluation.participants.add(users[0])
+        evaluation.voters.add(users[0])
+        self.assert_live_counts(evaluation, 3, 1)
+
+        users[1].evaluations_participating_in.add(evaluation, other_evaluation)
+        users[1].evaluations_voted_for.add(evaluation)
+        self.assert_live_counts(evaluation, 3, 2)
+        self.assert_live_counts(other_evaluation, 1, 0)
+
+        evaluation.participants.remove(users[2], baker.make(UserProfile))
+        users[1].evaluations_voted_for.remove(evaluation)
+        self.assert_live_counts(evaluation, 2, 1)
+
+        users[1].evaluations_participating_in.clear()
+        self.assert_live_counts(evaluation, 1, 1)
+        self.assert_live_counts(other_evaluation, 0, 0)
+
+        evaluation.participants.set(users)
+        evaluation.voters.clear()
+        self.assert_live_counts(evaluation, 3, 0)
+
+    def test_save_does_not_overwrite_live_counts(self):
+        evaluation = baker.make(Evaluation)
+        stale_evaluation = Evaluation.objects.get(pk=evaluation.pk)
+        evaluation.participants.add(*baker.make(UserProfile, _quantity=2))
+
+        stale_evaluation.name_en = "new name"
+        stale_evaluation.save()
+        self.assert_live_counts(evaluation, 2, 0)
+
+    def test_live_counts_follow_user_deletion(self):
+        evaluation = baker.make(Evaluation)
+        other_evaluation = baker.make(Evaluation)
+        users = baker.make(UserProfile, _quantity=4)
+        evaluation.participants.set(users)
+        evaluation.voters.set(users[:3])
+        other_evaluation.participants.set(users[1:3])
+
+        with CaptureQueriesContext(connection) as context:
+            UserProfile.objects.filter(pk=users[0].pk).delete()
+        self.assert_live_counts(evaluation, 3, 2)
+
+        # the rows of all deleted users are subtracted at once
+        with self.assertNumQueries(len(context)):
+            UserProfile.objects.filter(pk__in=[users[1].pk, users[2].pk]).delete()
+        self.assert_live_counts(evaluation, 1, 0)
+        self.assert_live_counts(other_evaluation, 0, 0)
+
+        users[3].delete()
+        self.assert_live_counts(evaluation, 0, 0)
+
+    def test_listing_counts_use_live_counts(self):
+        evaluation = baker.make(Evaluation, participants=baker.make(UserProfile, _quantity=2))
+        EvaluationCounter.objects.filter(evaluation=evaluation).update(participant_count=5)
+
+        annotated = Evaluation.annotate_with_participant_and_voter_counts(Evaluation.objects.filter(pk=evaluation.pk))
+        self.assertEqual(annotated.get().num_participants, 5)
+
+    @override_settings(INSTITUTION_EMAIL_DOMAINS=["institution.example.com"])
+    def test_visibility_queries_match_python_methods(self):
+        for seed in range(5):
+            with self.subTest(seed=seed), transaction.atomic():
+                user_pks = make_random_visibility_scenario(random.Random(seed))
+                for user in UserProfile.objects.filter(pk__in=user_pks):
+                    evaluations = Evaluation.objects.all()
+                    self.assertEqual(
+                        set(Evaluation.objects.visible_to(user)),
+                        {evaluation for evaluation in evaluations if evaluation.can_be_seen_by(user)},
+                    )
+                    self.assertEqual(
+                        set(Evaluation.objects.results_visible_to(user)),
+                        {evaluation for evaluation in evaluations if evaluation.can_results_page_be_seen_by(user)},
+                    )
+                transaction.set_rollback(True)
+
 
 class TestCourse(TestCase):
     def test_can_be_deleted_by_manager(self):
@@ -586,6 +684,17 @@ class TestCourse(TestCase):
         evaluation.delete()
         self.assertTrue(course.can_be_deleted_by_manager)
 
+    def test_can_be_deleted_by_manager_with_annotated_evaluation_count(self):
+        course = baker.make(Course)
+        baker.make(Evaluation, course=course)
+        courses = Course.objects.annotate(num_evaluations=Count("evaluations"))
+
+        annotated_course = courses.get(pk=course.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(annotated_course.can_be_deleted_by_manager)
+        course.evaluations.all().delete()
+        self.assertTrue(courses.get(pk=course.pk).can_be_deleted_by_manager)
+
     def test_responsibles_names(self):
         # last names required for sorting
         user1 = baker.make(UserProfile, last_name="Doe")
@@ -703,11 +812,82 @@ class TestUserProfile(TestCase):
         proxy_user = baker.make(UserProfile, is_proxy_user=True)
         self.assertFalse(proxy_user.can_be_marked_inactive_by_manager)
 
+    def test_annotate_removability_by_manager(self):
+        archived_evaluation = baker.make(
+            Evaluation,
+            course__semester__participations_are_archived=True,
+            _participant_count=1,
+            _voter_count=0,
+        )
+        evaluation = baker.make(Evaluation)
+        archived_participant = baker.make(UserProfile, evaluations_participating_in=[archived_evaluation])
+        users = [
+            baker.make(UserProfile),
+            baker.make(UserProfile, is_active=False),
+            baker.make(UserProfile, is_superuser=True),
+            baker.make(UserProfile, is_proxy_user=True),
+            *(
+                baker.make(UserProfile, groups=[Group.objects.get(name=name)])
+                for name in ["Manager", "Reviewer", "Grade publisher"]
+            ),
+            archived_participant,
+            baker.make(UserProfile, evaluations_participating_in=[evaluation]),
+            baker.make(UserProfile, courses_responsible_for=[archived_evaluation.course]),
+            baker.make(UserProfile, contributions=[baker.make(Contribution, evaluation=archived_evaluation)]),
+            baker.make(UserProfile, contributions=[baker.make(Contribution, evaluation=evaluation)]),
+            baker.make(
+                UserProfile,
+                is_proxy_user=True,
+                contributions=[baker.make(Contribution, evaluation=archived_evaluation)],
+            ),
+        ]
+
+        annotated_users = UserProfile.annotate_removability_by_manager(
+            UserProfile.objects.filter(pk__in=[user.pk for user in users])
+        )
+        self.assertEqual(len(annotated_users), len(users))
+        for user in annotated_users:
+            fresh_user = UserProfile.objects.get(pk=user.pk)
+            self.assertEqual(user.is_deletable_by_manager, fresh_user.can_be_deleted_by_manager, fresh_user)
+            self.assertEqual(user.is_deactivatable_by_manager, fresh_user.can_be_marked_inactive_by_manager, fresh_user)
+        self.assertTrue(annotated_users.get(pk=archived_participant.pk).is_deletable_by_manager)
+
     @override_settings(INSTITUTION_EMAIL_REPLACEMENTS=[("example.com", "institution.com")])
     def test_email_domain_replacement(self):
         user = baker.make(UserProfile, email="test@example.com")
         self.assertEqual(user.email, "test@institution.com")
 
+    @override_settings(INSTITUTION_EMAIL_DOMAINS=["institution.example.com"])
+    def test_ensure_valid_login_keys(self):
+        baker.make(UserProfile, email="other@extern.com", login_key=1234, login_key_valid_until=date.today())
+        user_without_key, user_with_valid_key, user_with_expired_key, internal_user = baker.make(
+            UserProfile,
+            email=iter(
+                ["new@extern.com", "valid@extern.com", "expired@extern.com", "internal@institution.example.com"]
+            ),
+            login_key=iter([None, 42, 43, None]),
+            login_key_valid_until=iter([None, date.today() + timedelta(days=1), date.today(), None]),
+            _quantity=4,
+        )
+
+        # the first key collides with an existing one, so one more key is generated
+        with patch("evap.evaluation.models.secrets.choice", side_effect=[1234, 5, 6]), self.assertNumQueries(3):
+            UserProfile.ensure_valid_login_keys(
+                [user_without_key, user_with_valid_key, user_with_expired_key, internal_user]
+            )
+
+        for user in [user_without_key, user_with_valid_key, user_with_expired_key, internal_user]:
+            user.refresh_from_db()
+        self.assertEqual({user_without_key.login_key, user_with_expired_key.login_key}, {5, 6})
+        self.assertEqual(user_with_valid_key.login_key, 42)
+        for user in [user_without_key, user_with_valid_key, user_with_expired_key]:
+            self.assertEqual(user.login_key_valid_until, UserProfile.new_login_key_validity())
+        self.assertIsNone(internal_user.login_key)
+
+        with self.assertNumQueries(0):
+            UserProfile.ensure_valid_login_keys([user_without_key, user_with_valid_key, user_with_expired_key])
+            user_without_key.ensure_valid_login_key()
+
     def test_get_sorted_due_evaluations(self):
         student = baker.make(UserProfile, email="student@example.com")
         course = baker.make(Course)
@@ -1,11 +1,20 @@
 from datetime import date, datetime, timedelta
 from unittest.mock import patch
 
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.utils.formats import localize
 from model_bakery import baker
 
 from evap.evaluation.models import Contribution, Course, Evaluation, ExamType, Program, Questionnaire, UserProfile
-from evap.evaluation.models_logging import FieldAction, InstanceActionType, _m2m_changed
+from evap.evaluation.models_logging import (
+    FieldAction,
+    InstanceActionType,
+    LogEntry,
+    _m2m_changed,
+    buffered_logentries,
+)
 from evap.evaluation.tests.tools import TestCase, assert_no_database_modifications
 
 
@@ -60,6 +69,29 @@ class TestLoggedModel(TestCase):
         self.evaluation.delete()
         self.assertEqual(self.evaluation.related_logentries().count(), 0)
 
+    def test_change_uses_loaded_field_values(self):
+        evaluation = Evaluation.objects.get(pk=self.evaluation.pk)
+        old_name = evaluation.name_en
+        evaluation.name_en = "new name"
+        with CaptureQueriesContext(connection) as context:
+            evaluation.save()
+        # the old values are not fetched again
+        self.assertFalse(
+            any(query["sql"].startswith('SELECT "evaluation_evaluation"') for query in context.captured_queries)
+        )
+        self.assertEqual(evaluation.related_logentries()[0].data["name_en"], {"change": [old_name, "new name"]})
+
+        evaluation.name_en = "newer name"
+        evaluation.save()
+        self.assertEqual(evaluation.related_logentries()[0].data["name_en"], {"change": ["new name", "newer name"]})
+
+    def test_change_with_deferred_fields(self):
+        evaluation = Evaluation.objects.only("name_en").get(pk=self.evaluation.pk)
+        old_name = evaluation.name_en
+        evaluation.name_en = "new name"
+        evaluation.save()
+        self.assertEqual(evaluation.related_logentries()[0].data, {"name_en": {"change": [old_name, "new name"]}})
+
     def test_creation(self):
         course = baker.make(Course)
         self.assertEqual(course.related_logentries().count(), 1)
@@ -195,6 +227,34 @@ class TestLoggedModel(TestCase):
         result_no_field_name = _m2m_changed(None, None, None, True, Evaluation, None)
         self.assertEqual(result_no_field_name, None)
 
+    def test_adding_many_participants_benchmark(self):
+        def add_participants(count):
+            evaluation = Evaluation.objects.get(pk=baker.make(Evaluation).pk)
+            participants = baker.make(UserProfile, _quantity=count, _bulk_create=True)
+            with CaptureQueriesContext(connection) as context:
+                evaluation.participants.add(*participants)
+            self.assertCountEqual(
+                evaluation.related_logentries().order_by("id").last().data["participants"]["add"],
+                [participant.pk for participant in participants],
+            )
+            return len(context.captured_queries)
+
+        query_count = add_participants(5)
+        self.assertEqual(add_participants(5000), query_count)
+
+    def test_reverse_m2m_changes_logged_at_once(self):
+        def add_to_evaluations(count):
+            participant = baker.make(UserProfile)
+            evaluations = baker.make(Evaluation, _quantity=count)
+            with CaptureQueriesContext(connection) as context:
+                participant.evaluations_participating_in.add(*evaluations)
+            for evaluation in evaluations:
+                self.assertEqual(evaluation.related_logentries()[0].data, {"participants": {"add": [participant.pk]}})
+            return len(context.captured_queries)
+
+        query_count = add_to_evaluations(2)
+        self.assertEqual(add_to_evaluations(50), query_count)
+
     def test_m2m_logging_respects_unlogged_fields(self):
         participant = baker.make(UserProfile)
 
@@ -265,3 +325,136 @@ class TestLoggedModel(TestCase):
                 ]
             },
         )
+
+
+class TestBufferedLogEntries(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        baker.make(Evaluation, _quantity=3)
+
+    def setUp(self):
+        # fresh instances, which do not have their creation logentry attached
+        self.evaluations = list(Evaluation.objects.all())
+
+    def test_logentries_are_written_at_once(self):
+        logentry_count = LogEntry.objects.count()
+        with CaptureQueriesContext(connection) as context:
+            with buffered_logentries():
+                with self.captureOnCommitCallbacks(execute=True):
+                    for evaluation in self.evaluations:
+                        evaluation.name_en = "new name"
+                        evaluation.save()
+                self.assertEqual(LogEntry.objects.count(), logentry_count)
+
+        self.assertEqual(LogEntry.objects.count(), logentry_count + 3)
+        self.assertEqual(
+            len(
+                [
+                    query
+                    for query in context.captured_queries
+                    if query["sql"].startswith('INSERT INTO "evaluation_logentry"')
+                ]
+            ),
+            1,
+        )
+        for evaluation in self.evaluations:
+            self.assertEqual(evaluation.related_logentries()[0].data["name_en"]["change"][1], "new name")
+
+    def test_rolled_back_changes_are_not_logged(self):
+        logentry_count = LogEntry.objects.count()
+        with buffered_logentries():
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    self.evaluations[0].name_en = "new name"
+                    self.evaluations[0].save()
+                    transaction.set_rollback(True)
+                self.evaluations[1].name_en = "new name"
+                self.evaluations[1].save()
+
+        self.assertEqual(LogEntry.objects.count(), logentry_count + 1)
+        self.assertEqual(self.evaluations[1].related_logentries()[0].data["name_en"]["change"][1], "new name")
+
+    def test_changes_in_open_transaction_are_logged(self):
+        # the transaction of the test case never commits
+        logentry_count = LogEntry.objects.count()
+        with buffered_logentries():
+            with transaction.atomic():
+                self.evaluations[0].name_en = "new name"
+                self.evaluations[0].save()
+                transaction.set_rollback(True)
+            self.evaluations[1].name_en = "new name"
+            self.evaluations[1].save()
+
+        self.assertEqual(LogEntry.objects.count(), logentry_count + 1)
+        self.assertEqual(self.evaluations[1].related_logentries()[0].data["name_en"]["change"][1], "new name")
+
+    def test_logentries_of_deleted_objects(self):
+        evaluation = self.evaluations[0]
+        related_logentries = evaluation.related_logentries()
+        contribution = Contribution.objects.get(pk=baker.make(Contribution, evaluation=self.evaluations[1]).pk)
+        with buffered_logentries():
+            with self.captureOnCommitCallbacks(execute=True):
+                evaluation.name_en = "new name"
+                evaluation.save()
+                evaluation.delete()
+                contribution.delete()
+
+        self.assertFalse(related_logentries.exists())
+        self.assertEqual(self.evaluations[1].related_logentries()[0].action_type, InstanceActionType.DELETE)
+
+
+class TestGroupedLogEntries(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = baker.make(Course)
+        cls.course.related_logentries().delete()
+        content_type = ContentType.objects.get_for_model(Course)
+
+        def make_logentries(quantity, request_id):
+            return baker.make(
+                LogEntry,
+                _quantity=quantity,
+                _bulk_create=True,
+                content_type=content_type,
+                content_object_id=cls.course.pk,
+                attached_to_object_type=content_type,
+                attached_to_object_id=cls.course.pk,
+                action_type=InstanceActionType.CHANGE,
+                request_id=request_id,
+                data={},
+            )
+
+        make_logentries(12, "first request")
+        make_logentries(3, "")
+        make_logentries(2, "second request")
+        make_logentries(4, "third request")
+
+    def test_pages(self):
+        expected_groups = [[4, "third request"], [2, "second request"]] + [[1, ""]] * 3 + [[12, "first request"]]
+
+        groups = []
+        before = None
+        with self.assertNumQueries(7):
+            for __ in range(3):
+                page = self.course.grouped_logentries(before, group_count=2)
+                self.assertEqual(len(page.groups), 2)
+                groups.extend(page.groups)
+                before = page.next_before
+
+        self.assertIsNone(before)
+        self.assertEqual([[len(group), group[0].request_id] for group in groups], expected_groups)
+        self.assertEqual(
+            [entry.pk for group in groups for entry in group], [e.pk for e in self.course.related_logentries()]
+        )
+
+    def test_group_spanning_batches(self):
+        page = self.course.grouped_logentries(before=self.course.related_logentries()[8], group_count=1)
+        self.assertEqual([len(group) for group in page.groups], [12])
+        self.assertIsNone(page.next_before)
+
+    def test_messages_without_queries(self):
+        page = self.course.grouped_logentries()
+        with self.assertNumQueries(0):
+            for group in page.groups:
+                for entry in group:
+                    self.assertEqual(entry.message, f'The Course "{self.course}" was changed.')
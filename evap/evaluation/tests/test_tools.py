@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 from uuid import UUID
 
 from django.core import management
@@ -13,6 +13,7 @@ from evap.evaluation.management.commands.tools import subprocess_run_or_exit
 from evap.evaluation.models import Contribution, Course, Evaluation, TextAnswer, UserProfile
 from evap.evaluation.tests.tools import SimpleTestCase, TestCase, WebTest
 from evap.evaluation.tools import (
+    TrackedOnCommit,
     discard_cached_related_objects,
     get_object_from_dict_pk_entry_or_logged_40x,
     inside_transaction,
@@ -226,6 +227,28 @@ class TestHelperMethods(TestCase):
         answer = baker.make(TextAnswer)
         self.assertEqual(get_object_from_dict_pk_entry_or_logged_40x(TextAnswer, {"pk": str(answer.pk)}, "pk"), answer)
 
+    def test_tracked_on_commit(self):
+        callback = Mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            committed = TrackedOnCommit(callback)
+            with transaction.atomic():
+                released = TrackedOnCommit()
+            with transaction.atomic():
+                rolled_back = TrackedOnCommit()
+                transaction.set_rollback(True)
+
+            self.assertTrue(committed.is_pending)
+            self.assertTrue(released.is_pending)
+            # the connection must not keep references to the callbacks it dropped
+            self.assertFalse(rolled_back.is_pending)
+            callback.assert_not_called()
+
+        callback.assert_called_once_with()
+        self.assertTrue(committed.has_run)
+        self.assertTrue(released.has_run)
+        self.assertFalse(committed.is_pending)
+        self.assertFalse(rolled_back.has_run)
+
     def test_subprocess_run_or_exit(self) -> None:
         subprocess_run_or_exit(["true"])
 
@@ -242,3 +265,10 @@ class TestHelperMethodsWithoutTransaction(SimpleTestCase):
 
         with transaction.atomic():
             self.assertTrue(inside_transaction())
+
+    def test_tracked_on_commit_without_transaction(self):
+        callback = Mock()
+        tracked = TrackedOnCommit(callback)
+        callback.assert_called_once_with()
+        self.assertTrue(tracked.has_run)
+        self.assertFalse(tracked.is_pending)
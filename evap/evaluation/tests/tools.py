@@ -37,6 +37,7 @@ from evap.evaluation.models import (
     QuestionAssignment,
     Questionnaire,
     RatingAnswerCounter,
+    Semester,
     TextAnswer,
     UserProfile,
 )
@@ -306,6 +307,56 @@ def make_rating_answer_counters(
     return counters
 
 
+def make_random_visibility_scenario(rng: random.Random) -> list[int]:
+    """
+    Create users, courses and evaluations with random states, roles and participations to compare the visibility
+    queries against the python methods. Returns the pks of the created users.
+    """
+    users = [
+        baker.make(
+            UserProfile,
+            email=rng.choice([f"user{i}@institution.example.com", f"user{i}@external.example.com", None]),
+            is_proxy_user=rng.random() < 0.1,
+            groups=rng.choice([[], [Group.objects.get(name="Reviewer")], [Group.objects.get(name="Manager")]]),
+        )
+        for i in range(10)
+    ]
+    for user in users:
+        user.delegates.set(rng.sample(users, k=rng.randint(0, 2)))
+
+    semesters = baker.make(Semester, results_are_archived=iter(rng.random() < 0.3 for _ in range(3)), _quantity=3)
+    for course_index in range(8):
+        course = baker.make(
+            Course,
+            semester=rng.choice(semesters),
+            is_private=rng.random() < 0.3,
+            responsibles=rng.sample(users, k=rng.randint(0, 2)),
+        )
+        for evaluation_index in range(rng.randint(1, 2)):
+            participants = rng.sample(users, k=rng.randint(0, 4))
+            evaluation = baker.make(
+                Evaluation,
+                course=course,
+                name_de=f"{course_index}-{evaluation_index}",
+                name_en=f"{course_index}-{evaluation_index}",
+                state=rng.choice(list(Evaluation.State)),
+                participants=participants,
+                voters=rng.sample(participants, k=rng.randint(0, len(participants))),
+            )
+            for contributor in rng.sample(users, k=rng.randint(0, 2)):
+                baker.make(
+                    Contribution,
+                    evaluation=evaluation,
+                    contributor=contributor,
+                    role=rng.choice(list(Contribution.Role)),
+                )
+            if rng.random() < 0.2:  # archived participations
+                Evaluation.objects.filter(pk=evaluation.pk).update(
+                    _participant_count=rng.randint(0, 3), _voter_count=rng.randint(0, 3)
+                )
+    return [user.pk for user in users]
+
+
 @contextmanager
 def assert_no_database_modifications(*args, **kwargs):
     assert len(connections.all()) == 1, "Found more than one connection, so the decorator might monitor the wrong one"
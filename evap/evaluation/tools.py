@@ -1,20 +1,25 @@
 import datetime
 import re
 import typing
+import uuid
+import weakref
 from abc import ABC, abstractmethod
 from collections.abc import Callable, Iterable, Iterator, Mapping
 from contextlib import contextmanager
+from functools import partial
 from typing import TYPE_CHECKING, Any
 from urllib.parse import quote
 
 import xlwt
 from django import forms
 from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import SuspiciousOperation, ValidationError
-from django.db import DEFAULT_DB_ALIAS, connections
-from django.db.models import Field, Model, Q
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, Field, Model, Q, QuerySet, Subquery
 from django.db.models.constraints import CheckConstraint
 from django.db.models.fields.mixins import FieldCacheMixin
+from django.db.models.functions import Coalesce
 from django.dispatch.dispatcher import Signal
 from django.forms.formsets import BaseFormSet
 from django.http import HttpRequest, HttpResponse
@@ -157,6 +162,89 @@ def inside_transaction() -> bool:
     return connections[DEFAULT_DB_ALIAS].in_atomic_block
 
 
+class _RegisteredOnCommitCallback:
+    def __init__(self, tracked: "TrackedOnCommit", callback: Callable[[], None] | None) -> None:
+        self.tracked = tracked
+        self.callback = callback
+
+    def __call__(self) -> None:
+        self.tracked.has_run = True
+        if self.callback is not None:
+            self.callback()
+
+
+class TrackedOnCommit:
+    """
+    Registers the callback with transaction.on_commit and tells whether it has run, or is still waiting for the commit
+    of its (sub)transaction. If neither is the case, that transaction was rolled back.
+
+    Only the connection references the registered callback, so it is freed as soon as the connection drops it in a
+    rollback. This avoids reading the connection's private list of callbacks.
+    """
+
+    def __init__(self, callback: Callable[[], None] | None = None) -> None:
+        self.has_run = False
+        registered = _RegisteredOnCommitCallback(self, callback)
+        self._registered = weakref.ref(registered)
+        # runs immediately if there is no transaction
+        transaction.on_commit(registered)
+
+    @property
+    def is_pending(self) -> bool:
+        return not self.has_run and self._registered() is not None
+
+
+def count_subquery(queryset: QuerySet, group_by: str) -> Coalesce:
+    """
+    Counts the rows of the queryset, which must be filtered by an OuterRef on group_by, as an annotation of the outer
+    query. Other than Count over a relation, this does not join the rows into the outer query, so several counts can
+    be annotated without multiplying each other's rows.
+    """
+    return Coalesce(Subquery(queryset.order_by().values(group_by).annotate(count=Count("pk")).values("count")), 0)
+
+
+START_PAGE_CACHE_TIMEOUT = datetime.timedelta(hours=1)
+START_PAGE_VERSION_CACHE_KEY = "evap.evaluation.tools.start_page_version"
+
+
+def start_page_version_cache_key(user_id: int | None) -> str:
+    if user_id is None:
+        return START_PAGE_VERSION_CACHE_KEY
+    return f"{START_PAGE_VERSION_CACHE_KEY}-user-{user_id}"
+
+
+def get_start_page_cache_key(page: str, user_id: int, *variants: object) -> str:
+    """
+    Return the key under which the data of a user's start page is cached. It contains a global and a per-user
+    version, so that invalidate_start_pages makes all previously cached data unreachable.
+    """
+    cache = caches["default"]
+    version_keys = [start_page_version_cache_key(None), start_page_version_cache_key(user_id)]
+    versions = cache.get_many(version_keys)
+    # invalidating deletes the versions, so each new one must differ from all versions used before
+    new_versions = {key: uuid.uuid4().hex for key in version_keys if key not in versions}
+    if new_versions:
+        cache.set_many(new_versions, timeout=None)
+        versions |= new_versions
+    return ":".join(
+        ["evap.start_page", page, str(user_id), *map(str, variants), *(versions[key] for key in version_keys)]
+    )
+
+
+def invalidate_start_pages(user_ids: Iterable[int] | None = None) -> None:
+    """Invalidate the cached start pages of the given users, or of all users if user_ids is None."""
+    if user_ids is None:
+        version_keys = [start_page_version_cache_key(None)]
+    else:
+        version_keys = [start_page_version_cache_key(user_id) for user_id in user_ids]
+    if not version_keys:
+        return
+
+    caches["default"].delete_many(version_keys)
+    # requests running concurrently with the current transaction might cache its old data under the new versions
+    transaction.on_commit(partial(caches["default"].delete_many, version_keys))
+
+
 def is_external_email(email: str) -> bool:
     return not any(email.endswith("@" + domain) for domain in settings.INSTITUTION_EMAIL_DOMAINS)
 
@@ -2,12 +2,12 @@ import os
 
 from django.conf import settings
 from django.db import models
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch.dispatcher import receiver
 from django.utils.translation import gettext_lazy as _
 
 from evap.evaluation.models import Course
-from evap.evaluation.tools import inject_choices_constraint, translate
+from evap.evaluation.tools import inject_choices_constraint, invalidate_start_pages, translate
 
 
 def helper_upload_path(instance: "GradeDocument", filename: str) -> str:
@@ -66,3 +66,10 @@ def delete_file_pre_save(instance: GradeDocument, **_kwargs) -> None:
     new_file = instance.file
     if not old_file == new_file:
         old_file.delete(False)
+
+
+# grade documents are listed on the student start page
+@receiver(post_save, sender=GradeDocument)
+@receiver(post_delete, sender=GradeDocument)
+def invalidate_start_pages_on_grade_document_change(**_kwargs) -> None:
+    invalidate_start_pages()
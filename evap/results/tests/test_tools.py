@@ -1,7 +1,10 @@
+from copy import copy
 from datetime import datetime
+from unittest.mock import patch
 
 from django.conf import settings
 from django.core.cache import caches
+from django.db import transaction
 from django.test import override_settings
 from model_bakery import baker
 
@@ -19,6 +22,7 @@ from evap.evaluation.models import (
 )
 from evap.evaluation.tests.tools import TestCase, make_rating_answer_counters
 from evap.results.tools import (
+    EvaluationResult,
     ViewContributorResults,
     ViewGeneralResults,
     cache_results,
@@ -29,7 +33,11 @@ from evap.results.tools import (
     distribution_to_grade,
     get_results,
     get_results_cache_key,
+    get_results_for_average_distributions,
+    get_results_many,
     normalized_distribution,
+    queue_results_cache_update,
+    results_cache_invalidation_stats,
     textanswers_visible_to,
     unipolarized_distribution,
 )
@@ -46,18 +54,32 @@ class TestCalculateResults(TestCase):
 
         self.assertIsNotNone(caches["results"].get(get_results_cache_key(evaluation)))
 
+    def test_get_results_many(self):
+        evaluations = baker.make(Evaluation, state=Evaluation.State.PUBLISHED, _quantity=3)
+        for evaluation in evaluations:
+            cache_results(evaluation)
+
+        with self.assertNumQueries(1):
+            results_by_evaluation_id = get_results_many(evaluations)
+
+        self.assertEqual(results_by_evaluation_id.keys(), {evaluation.id for evaluation in evaluations})
+        for result in results_by_evaluation_id.values():
+            self.assertIsInstance(result, EvaluationResult)
+
     def test_caching_lifecycle(self):
         evaluation = baker.make(Evaluation, state=Evaluation.State.IN_EVALUATION)
 
         self.assertIsNone(caches["results"].get(get_results_cache_key(evaluation)))
 
         evaluation.end_evaluation()
-        evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluation.save()
 
         self.assertIsNotNone(caches["results"].get(get_results_cache_key(evaluation)))
 
         evaluation.reopen_evaluation()
-        evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluation.save()
 
         self.assertIsNone(caches["results"].get(get_results_cache_key(evaluation)))
 
@@ -69,10 +91,101 @@ class TestCalculateResults(TestCase):
         evaluation.end_evaluation()
         evaluation.end_review()
         evaluation.publish()
-        evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluation.save()
 
         self.assertIsNotNone(caches["results"].get(get_results_cache_key(evaluation)))
 
+    def test_cache_updates_are_coalesced_per_transaction(self):
+        course = baker.make(Course)
+        evaluations = baker.make(
+            Evaluation,
+            course=course,
+            name_de=iter(["eins", "zwei"]),
+            name_en=iter(["one", "two"]),
+            state=Evaluation.State.IN_EVALUATION,
+            _quantity=2,
+        )
+        stats_before = copy(results_cache_invalidation_stats)
+
+        with (
+            patch("evap.results.tools.cache_results", wraps=cache_results) as cache_results_mock,
+            patch("evap.results.views.update_template_cache") as update_template_cache_mock,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            for evaluation in evaluations:
+                evaluation.end_evaluation()
+                evaluation.save()
+                evaluation.end_review()
+                evaluation.save()
+                evaluation.publish()
+                evaluation.save()
+
+            self.assertEqual(cache_results_mock.call_count, 0)
+            self.assertEqual(update_template_cache_mock.call_count, 0)
+
+        self.assertEqual(cache_results_mock.call_count, 2)
+        self.assertEqual(update_template_cache_mock.call_count, 1)
+        for evaluation in evaluations:
+            self.assertIsNotNone(caches["results"].get(get_results_cache_key(evaluation)))
+
+        self.assertEqual(results_cache_invalidation_stats.results_requested - stats_before.results_requested, 4)
+        self.assertEqual(results_cache_invalidation_stats.results_coalesced - stats_before.results_coalesced, 2)
+        self.assertEqual(results_cache_invalidation_stats.templates_requested - stats_before.templates_requested, 2)
+        self.assertEqual(results_cache_invalidation_stats.templates_coalesced - stats_before.templates_coalesced, 1)
+
+    def test_cache_updates_are_coalesced_across_savepoints(self):
+        evaluations = baker.make(
+            Evaluation,
+            name_de=iter(["eins", "zwei", "drei"]),
+            name_en=iter(["one", "two", "three"]),
+            state=Evaluation.State.PUBLISHED,
+            _quantity=3,
+        )
+
+        with (
+            patch("evap.results.tools.cache_results") as cache_results_mock,
+            self.captureOnCommitCallbacks(execute=True) as callbacks,
+        ):
+            queue_results_cache_update([evaluations[0]])
+            with transaction.atomic():
+                queue_results_cache_update([evaluations[1]])
+            with transaction.atomic():
+                queue_results_cache_update([evaluations[2]])
+                transaction.set_rollback(True)
+
+        self.assertEqual(len(callbacks), 1)
+        # recomputing the cache of the rolled back change is harmless
+        self.assertCountEqual([call.args[0] for call in cache_results_mock.call_args_list], evaluations)
+
+    def test_cache_updates_of_rolled_back_transactions_are_dropped(self):
+        evaluations = baker.make(
+            Evaluation,
+            name_de=iter(["eins", "zwei"]),
+            name_en=iter(["one", "two"]),
+            state=Evaluation.State.PUBLISHED,
+            _quantity=2,
+        )
+
+        with (
+            patch("evap.results.tools.cache_results") as cache_results_mock,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            with transaction.atomic():
+                queue_results_cache_update([evaluations[1]])
+                transaction.set_rollback(True)
+            queue_results_cache_update([evaluations[0]])
+
+        self.assertEqual([call.args[0] for call in cache_results_mock.call_args_list], [evaluations[0]])
+
+        # the dropped update must not be run by the next transaction either
+        with (
+            patch("evap.results.tools.cache_results") as cache_results_mock,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            queue_results_cache_update([])
+        cache_results_mock.assert_not_called()
+
     def test_calculation_unipolar_results(self):
         contributor1 = baker.make(UserProfile)
         student = baker.make(UserProfile)
@@ -157,7 +270,8 @@ class TestCalculateResults(TestCase):
 
         cache_results(evaluation)
 
-        merge_users(main_user, contributor)
+        with self.captureOnCommitCallbacks(execute=True):
+            merge_users(main_user, contributor)
 
         evaluation_results = get_results(evaluation)
 
@@ -436,6 +550,13 @@ class TestCalculateAverageDistribution(TestCase):
         self.assertEqual(distribution[3], 0)
         self.assertEqual(distribution[4], 0)
 
+        results_by_evaluation_id = get_results_for_average_distributions(course.evaluations.all())
+        self.assertEqual(results_by_evaluation_id.keys(), {self.evaluation.id, second_evaluation.id})
+        self.assertEqual(
+            calculate_average_course_distribution(course, results_by_evaluation_id=results_by_evaluation_id),
+            distribution,
+        )
+
     def test_dropout_questionnaires_are_not_included(self):
         general_questionnaire = baker.make(Questionnaire, type=Questionnaire.Type.TOP)
         general_assignment = baker.make(
@@ -1,3 +1,4 @@
+import random
 from io import StringIO
 from itertools import product
 from unittest.mock import patch
@@ -5,7 +6,7 @@ from unittest.mock import patch
 from django.contrib.auth.models import Group
 from django.core.cache import caches
 from django.core.management import call_command
-from django.db import connection
+from django.db import connection, transaction
 from django.test import override_settings
 from django.test.utils import CaptureQueriesContext
 from model_bakery import baker
@@ -26,13 +27,24 @@ from evap.evaluation.tests.tools import (
     TestCase,
     WebTest,
     let_user_vote_for_evaluation,
+    make_contributor,
     make_manager,
+    make_random_visibility_scenario,
     make_rating_answer_counters,
 )
 from evap.results.exporters import TextAnswerExporter
 from evap.results.tools import ViewContributorResults, ViewGeneralResults, cache_results
-from evap.results.views import get_evaluations_with_prefetched_data, update_template_cache
+from evap.results.views import (
+    get_evaluation_result_template_fragment_cache_key,
+    get_evaluations_with_prefetched_data,
+    get_results_index,
+    get_results_index_cache_key,
+    get_visible_results_index_evaluations,
+    update_template_cache,
+    update_template_cache_of_published_evaluations_in_course,
+)
 from evap.staff.tests.utils import WebTestStaffMode, helper_exit_staff_mode, run_in_staff_mode
+from evap.staff.tools import merge_users
 
 
 class TestResultsView(WebTest):
@@ -225,6 +237,150 @@ class TestResultsView(WebTest):
         )
         self.assertNotContains(page, "contributes 53% to")
 
+    def test_index_is_cached_per_semester(self):
+        student = baker.make(UserProfile, email="student@institution.example.com")
+        course = baker.make(Course)
+        evaluation = baker.make(
+            Evaluation, course=course, name_en="evaluation_1", name_de="evaluation_1", state=Evaluation.State.PUBLISHED
+        )
+        other_evaluation = baker.make(
+            Evaluation, course=course, name_en="evaluation_2", name_de="evaluation_2", state=Evaluation.State.REVIEWED
+        )
+
+        self.assertContains(self.app.get(self.url, user=student), "evaluation_1")
+        cache_key = get_results_index_cache_key(course.semester.id)
+        self.assertIsNotNone(caches["results"].get(cache_key))
+
+        # evaluations published without going through the state transitions are only shown after the cache update
+        Evaluation.objects.filter(pk=other_evaluation.pk).update(state=Evaluation.State.PUBLISHED)
+        other_evaluation = Evaluation.objects.get(pk=other_evaluation.pk)
+        self.assertNotContains(self.app.get(self.url, user=student), "evaluation_2")
+
+        update_template_cache([other_evaluation])
+        self.assertIsNone(caches["results"].get(cache_key))
+        self.assertContains(self.app.get(self.url, user=student), "evaluation_2")
+
+        evaluation.course.is_private = True
+        evaluation.course.save()
+        update_template_cache_of_published_evaluations_in_course(evaluation.course)
+        self.assertNotContains(self.app.get(self.url, user=student), "evaluation_1")
+
+    def test_template_fragments_are_fetched_at_once(self):
+        student = baker.make(UserProfile, email="student@institution.example.com", language="en")
+        evaluations = baker.make(Evaluation, state=Evaluation.State.PUBLISHED, _quantity=3)
+        cache = caches["results"]
+        # without voters, the results pages are not linked
+        cache_keys = [
+            get_evaluation_result_template_fragment_cache_key(evaluation.id, "en", False) for evaluation in evaluations
+        ]
+
+        # missing fragments are rendered and written back together
+        with patch.object(cache, "set_many", wraps=cache.set_many) as set_many:
+            self.app.get(self.url, user=student)
+        self.assertEqual(set(set_many.call_args.args[0]), set(cache_keys))
+
+        cache.set(cache_keys[0], "<span>cached fragment</span>")
+        with patch.object(cache, "get") as get, patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            page = self.app.get(self.url, user=student)
+        get.assert_not_called()
+        fragment_requests = [call.args[0] for call in get_many.call_args_list if cache_keys[0] in call.args[0]]
+        self.assertEqual(len(fragment_requests), 1)
+        self.assertLessEqual(set(cache_keys), set(fragment_requests[0]))
+        self.assertContains(page, "<span>cached fragment</span>", html=True)
+        for evaluation in evaluations[1:]:
+            self.assertContains(page, evaluation.full_name)
+
+    def test_index_cache_follows_responsible_and_contributor_changes(self):
+        course = baker.make(Course, is_private=True)
+        evaluation = baker.make(Evaluation, course=course, state=Evaluation.State.PUBLISHED)
+        responsible, contributor, merged_user = baker.make(UserProfile, _quantity=3)
+
+        def visible_evaluation_ids(user):
+            index_courses = get_results_index([course.semester_id])[course.semester_id]
+            return set(get_visible_results_index_evaluations(user, index_courses))
+
+        self.assertEqual(visible_evaluation_ids(responsible), set())
+        course.responsibles.add(responsible)
+        self.assertEqual(visible_evaluation_ids(responsible), {evaluation.id})
+
+        self.assertEqual(visible_evaluation_ids(contributor), set())
+        make_contributor(contributor, evaluation)
+        self.assertEqual(visible_evaluation_ids(contributor), {evaluation.id})
+
+        self.assertEqual(visible_evaluation_ids(merged_user), set())
+        merge_users(merged_user, contributor)
+        self.assertEqual(visible_evaluation_ids(merged_user), {evaluation.id})
+
+    @override_settings(INSTITUTION_EMAIL_DOMAINS=["institution.example.com"])
+    def test_index_visibility_matches_evaluation_methods(self):
+        responsible = baker.make(UserProfile, email="responsible@institution.example.com")
+        contributor = baker.make(UserProfile, email="contributor@example.com")
+        delegate = baker.make(UserProfile, email="delegate@institution.example.com")
+        contributor.delegates.add(delegate)
+        participant = baker.make(UserProfile, email="participant@example.com")
+        users = [
+            responsible,
+            contributor,
+            delegate,
+            participant,
+            baker.make(UserProfile, email="student@institution.example.com"),
+            baker.make(UserProfile, email="external@example.com"),
+            baker.make(
+                UserProfile, email="reviewer@institution.example.com", groups=[Group.objects.get(name="Reviewer")]
+            ),
+            make_manager(),
+        ]
+
+        for is_private, voter_count in product([False, True], [0, 1, 2]):
+            course = baker.make(Course, is_private=is_private, responsibles=[responsible])
+            evaluations = baker.make(
+                Evaluation,
+                course=course,
+                name_en=iter(["a", "b"]),
+                name_de=iter(["a", "b"]),
+                state=Evaluation.State.PUBLISHED,
+                _participant_count=2,
+                _voter_count=voter_count,
+                _quantity=2,
+            )
+            make_contributor(contributor, evaluations[0])
+            evaluations[1].participants.add(participant)
+
+        semester_ids = list(Semester.objects.values_list("pk", flat=True))
+        index_courses = [course for courses in get_results_index(semester_ids).values() for course in courses]
+        for user in users:
+            with self.subTest(user=user.email):
+                self.assertEqual(
+                    get_visible_results_index_evaluations(user, index_courses),
+                    {
+                        evaluation.id: evaluation.can_results_page_be_seen_by(user)
+                        for evaluation in Evaluation.objects.all()
+                        if evaluation.can_be_seen_by(user)
+                    },
+                )
+
+    @override_settings(INSTITUTION_EMAIL_DOMAINS=["institution.example.com"])
+    def test_index_visibility_matches_evaluation_methods_in_random_scenarios(self):
+        for seed in range(5):
+            with self.subTest(seed=seed), transaction.atomic():
+                user_pks = make_random_visibility_scenario(random.Random(seed))
+                # the index only contains published evaluations of semesters whose results are not archived
+                semester_ids = list(Semester.objects.filter(results_are_archived=False).values_list("pk", flat=True))
+                index_courses = [course for courses in get_results_index(semester_ids).values() for course in courses]
+                evaluations = Evaluation.objects.filter(
+                    course__semester__in=semester_ids, state=Evaluation.State.PUBLISHED
+                )
+                for user in UserProfile.objects.filter(pk__in=user_pks):
+                    self.assertEqual(
+                        get_visible_results_index_evaluations(user, index_courses),
+                        {
+                            evaluation.id: evaluation.can_results_page_be_seen_by(user)
+                            for evaluation in evaluations
+                            if evaluation.can_be_seen_by(user)
+                        },
+                    )
+                transaction.set_rollback(True)
+
 
 class TestGetEvaluationsWithPrefetchedData(TestCase):
     def test_returns_correct_participant_count(self):
@@ -614,7 +770,8 @@ class TestResultsSemesterEvaluationDetailViewFewVoters(WebTest):
         self.evaluation.end_evaluation()
         self.evaluation.end_review()
         self.evaluation.publish()
-        self.evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluation.save()
         self.assertEqual(self.evaluation.voters.count(), 1)
         with run_in_staff_mode(self):
             self.helper_test_answer_visibility_one_voter("manager@institution.example.com")
@@ -628,7 +785,8 @@ class TestResultsSemesterEvaluationDetailViewFewVoters(WebTest):
         self.evaluation.end_evaluation()
         self.evaluation.end_review()
         self.evaluation.publish()
-        self.evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluation.save()
         self.assertEqual(self.evaluation.voters.count(), 2)
 
         with run_in_staff_mode(self):
@@ -1,7 +1,10 @@
 import enum
+import logging
+import threading
 from collections import OrderedDict, defaultdict
 from collections.abc import Iterable
 from copy import copy
+from dataclasses import dataclass
 from enum import Enum
 from math import ceil, modf
 from typing import TypeGuard, cast
@@ -22,9 +25,11 @@ from evap.evaluation.models import (
     TextAnswer,
     UserProfile,
 )
-from evap.evaluation.tools import discard_cached_related_objects
+from evap.evaluation.tools import TrackedOnCommit, discard_cached_related_objects
 from evap.tools import assert_not_none, unordered_groupby
 
+logger = logging.getLogger(__name__)
+
 STATES_WITH_RESULTS_CACHING = {Evaluation.State.EVALUATED, Evaluation.State.REVIEWED, Evaluation.State.PUBLISHED}
 STATES_WITH_RESULT_TEMPLATE_CACHING = {Evaluation.State.PUBLISHED}
 
@@ -200,6 +205,132 @@ def cache_results(evaluation, *, refetch_related_objects=True):
     caches["results"].set(cache_key, _get_results_impl(evaluation, refetch_related_objects=refetch_related_objects))
 
 
+@dataclass
+class ResultsCacheInvalidationStats:
+    """
+    Process-wide counters for the results cache invalidation queue. "requested" counts how often a cache update was
+    queued, "performed" counts how often it was actually done. The difference was saved by coalescing.
+    """
+
+    results_requested: int = 0
+    results_performed: int = 0
+    templates_requested: int = 0
+    templates_performed: int = 0
+
+    @property
+    def results_coalesced(self) -> int:
+        return self.results_requested - self.results_performed
+
+    @property
+    def templates_coalesced(self) -> int:
+        return self.templates_requested - self.templates_performed
+
+
+results_cache_invalidation_stats = ResultsCacheInvalidationStats()
+
+
+class ResultsCacheUpdate:
+    """
+    The results cache updates queued in one transaction. It is registered as on_commit callback of that transaction, so
+    the queued ids are dropped together with the callback if the transaction rolls back.
+    """
+
+    def __init__(self) -> None:
+        self.evaluation_ids: set[int] = set()
+        self.template_evaluation_ids: set[int] = set()
+        self.course_ids: set[int] = set()
+
+    def __call__(self) -> None:
+        # Resolving this circular dependency makes the code more ugly, so we leave it.
+        from evap.results.views import (  # noqa: PLC0415
+            _delete_course_template_cache_impl,
+            _delete_evaluation_template_cache_impl,
+            update_template_cache,
+        )
+
+        if self.evaluation_ids:
+            evaluations = Evaluation.objects.filter(pk__in=self.evaluation_ids)
+            for evaluation in evaluations.filter(state__in=STATES_WITH_RESULTS_CACHING).prefetch_related(
+                *GET_RESULTS_PREFETCH_LOOKUPS
+            ):
+                cache_results(evaluation, refetch_related_objects=False)
+            caches["results"].delete_many(
+                [
+                    get_results_cache_key(evaluation)
+                    for evaluation in evaluations.exclude(state__in=STATES_WITH_RESULTS_CACHING)
+                ]
+            )
+            results_cache_invalidation_stats.results_performed += len(self.evaluation_ids)
+
+        if self.course_ids:
+            for evaluation in Evaluation.objects.filter(pk__in=self.template_evaluation_ids).exclude(
+                state__in=STATES_WITH_RESULT_TEMPLATE_CACHING
+            ):
+                _delete_evaluation_template_cache_impl(evaluation)
+
+            courses = Course.objects.filter(pk__in=self.course_ids)
+            for course in courses:
+                _delete_course_template_cache_impl(course)
+            update_template_cache(
+                Evaluation.objects.filter(course__in=courses, state__in=STATES_WITH_RESULT_TEMPLATE_CACHING)
+            )
+            results_cache_invalidation_stats.templates_performed += len(self.course_ids)
+
+        logger.debug(
+            "Flushed results cache updates (%d evaluations, %d courses). Coalesced so far: %d results, %d templates.",
+            len(self.evaluation_ids),
+            len(self.course_ids),
+            results_cache_invalidation_stats.results_coalesced,
+            results_cache_invalidation_stats.templates_coalesced,
+        )
+
+
+class _PendingResultsCacheUpdate(threading.local):
+    update: ResultsCacheUpdate | None = None
+    on_commit: TrackedOnCommit | None = None
+
+
+_pending_results_cache_update = _PendingResultsCacheUpdate()
+
+
+def _queue_results_cache_update_on_commit(
+    evaluation_ids: Iterable[int] = (), template_evaluation_ids: Iterable[int] = (), course_ids: Iterable[int] = ()
+) -> None:
+    # The pending update is extended until it runs or is dropped in a rollback, also from nested savepoints. If one of
+    # those rolls back, its ids are still updated after the commit, which only recomputes the caches of unchanged data.
+    pending = _pending_results_cache_update
+    is_pending = pending.on_commit is not None and pending.on_commit.is_pending
+    update = pending.update if is_pending and pending.update is not None else ResultsCacheUpdate()
+
+    update.evaluation_ids |= set(evaluation_ids)
+    update.template_evaluation_ids |= set(template_evaluation_ids)
+    update.course_ids |= set(course_ids)
+
+    if not is_pending:
+        pending.update = update
+        pending.on_commit = TrackedOnCommit(update)
+
+
+def queue_results_cache_update(evaluations: Iterable[Evaluation]) -> None:
+    """
+    Queue a recomputation of the results cache of the given evaluations. The work is done once per evaluation after
+    the current transaction commits (or immediately, if there is no transaction). Evaluations that are no longer in
+    one of STATES_WITH_RESULTS_CACHING at that point get their cache entry deleted instead.
+    """
+    evaluation_ids = {evaluation.id for evaluation in evaluations}
+    results_cache_invalidation_stats.results_requested += len(evaluation_ids)
+    _queue_results_cache_update_on_commit(evaluation_ids=evaluation_ids)
+
+
+def queue_template_cache_update(evaluation: Evaluation) -> None:
+    """
+    Queue an update of the results index template fragments of the evaluation and its course. Like
+    queue_results_cache_update, the work happens after the current transaction commits.
+    """
+    results_cache_invalidation_stats.templates_requested += 1
+    _queue_results_cache_update_on_commit(template_evaluation_ids=[evaluation.id], course_ids=[evaluation.course_id])
+
+
 def get_results(evaluation: Evaluation) -> EvaluationResult:
     assert evaluation.state in STATES_WITH_RESULTS_CACHING | {Evaluation.State.IN_EVALUATION}
 
@@ -212,6 +343,32 @@ def get_results(evaluation: Evaluation) -> EvaluationResult:
     return result
 
 
+def get_results_many(evaluations: Iterable[Evaluation]) -> dict[int, EvaluationResult]:
+    """Like get_results, but fetches the cached results of all given evaluations with a single cache lookup."""
+    evaluations = list(evaluations)
+    assert all(
+        evaluation.state in STATES_WITH_RESULTS_CACHING | {Evaluation.State.IN_EVALUATION} for evaluation in evaluations
+    )
+
+    cached_results = caches["results"].get_many(
+        [
+            get_results_cache_key(evaluation)
+            for evaluation in evaluations
+            if evaluation.state != Evaluation.State.IN_EVALUATION
+        ]
+    )
+
+    results = {}
+    for evaluation in evaluations:
+        if evaluation.state == Evaluation.State.IN_EVALUATION:
+            results[evaluation.id] = _get_results_impl(evaluation)
+            continue
+        result = cached_results.get(get_results_cache_key(evaluation))
+        assert isinstance(result, EvaluationResult)
+        results[evaluation.id] = result
+    return results
+
+
 GET_RESULTS_PREFETCH_LOOKUPS = [
     "contributions__textanswer_set",
     "contributions__ratinganswercounter_set",
@@ -276,12 +433,29 @@ def _get_results_impl(evaluation: Evaluation, *, refetch_related_objects: bool =
 type Distribution = tuple[float, ...] | None
 
 
-def annotate_distributions_and_grades(evaluations):
+def annotate_distributions_and_grades(evaluations, results_by_evaluation_id=None):
+    evaluations = list(evaluations)
+    if results_by_evaluation_id is None:
+        results_by_evaluation_id = get_results_for_average_distributions(evaluations)
+
     for evaluation in evaluations:
-        evaluation.distribution = calculate_average_distribution(evaluation)
+        evaluation.distribution = calculate_average_distribution(
+            evaluation, results_by_evaluation_id.get(evaluation.id)
+        )
         evaluation.avg_grade = distribution_to_grade(evaluation.distribution)
 
 
+def get_results_for_average_distributions(evaluations: Iterable[Evaluation]) -> dict[int, EvaluationResult]:
+    """
+    Fetch the results that calculate_average_distribution needs for the given evaluations at once, so that
+    pages showing many distributions do not query the results cache once per evaluation.
+    """
+    evaluations_by_id = {
+        evaluation.id: evaluation for evaluation in evaluations if can_calculate_average_distribution(evaluation)
+    }
+    return get_results_many(evaluations_by_id.values())
+
+
 def normalized_distribution(distribution):
     """Returns a normalized distribution with the individual values adding up to 1.
     Can also be used to convert counts to a distribution."""
@@ -343,14 +517,19 @@ def average_non_grade_rating_questions_distribution(results):
     )
 
 
-def calculate_average_course_distribution(course, check_for_unpublished_evaluations=True):
+def calculate_average_course_distribution(
+    course, check_for_unpublished_evaluations=True, results_by_evaluation_id=None
+):
     if check_for_unpublished_evaluations and course.evaluations.exclude(state=Evaluation.State.PUBLISHED).exists():
         return None
 
+    if results_by_evaluation_id is None:
+        results_by_evaluation_id = {}
+
     return avg_distribution(
         [
             (
-                calculate_average_distribution(evaluation),
+                calculate_average_distribution(evaluation, results_by_evaluation_id.get(evaluation.id)),
                 evaluation.weight,
             )
             for evaluation in course.evaluations.all()
@@ -358,7 +537,7 @@ def calculate_average_course_distribution(course, check_for_unpublished_evaluati
     )
 
 
-def get_evaluations_with_course_result_attributes(evaluations):
+def get_evaluations_with_course_result_attributes(evaluations, results_by_evaluation_id=None):
     courses_with_unpublished_evaluations = set(
         Course.objects.filter(evaluations__in=evaluations)
         .filter(Exists(Evaluation.objects.filter(course=OuterRef("pk")).exclude(state=Evaluation.State.PUBLISHED)))
@@ -373,12 +552,22 @@ def get_evaluations_with_course_result_attributes(evaluations):
 
     evaluation_weight_sum_per_course_id = {entry[0]: entry[1] for entry in course_id_evaluation_weight_sum_pairs}
 
+    if results_by_evaluation_id is None:
+        results_by_evaluation_id = get_results_for_average_distributions(
+            course_evaluation
+            for evaluation in evaluations
+            if evaluation.course.id not in courses_with_unpublished_evaluations
+            for course_evaluation in evaluation.course.evaluations.all()
+        )
+
     for evaluation in evaluations:
         if evaluation.course.id in courses_with_unpublished_evaluations:
             evaluation.course.not_all_evaluations_are_published = True
             evaluation.course.distribution = None
         else:
-            evaluation.course.distribution = calculate_average_course_distribution(evaluation.course, False)
+            evaluation.course.distribution = calculate_average_course_distribution(
+                evaluation.course, False, results_by_evaluation_id
+            )
 
         evaluation.course.evaluation_count = evaluation.course.evaluations.count()
         evaluation.course.avg_grade = distribution_to_grade(evaluation.course.distribution)
@@ -387,15 +576,22 @@ def get_evaluations_with_course_result_attributes(evaluations):
     return evaluations
 
 
-def calculate_average_distribution(evaluation):
+def can_calculate_average_distribution(evaluation):
+    return evaluation.can_staff_see_average_grade and evaluation.can_publish_average_grade
+
+
+def calculate_average_distribution(evaluation, results=None):
     assert evaluation.state >= Evaluation.State.IN_EVALUATION
 
-    if not evaluation.can_staff_see_average_grade or not evaluation.can_publish_average_grade:
+    if not can_calculate_average_distribution(evaluation):
         return None
 
+    if results is None:
+        results = get_results(evaluation)
+
     # will contain a list of question results for each contributor and one for the evaluation (where contributor is None)
     grouped_results = defaultdict(list)
-    for contribution_result in get_results(evaluation).contribution_results:
+    for contribution_result in results.contribution_results:
         for questionnaire_result in contribution_result.questionnaire_results:
             if not questionnaire_result.questionnaire.is_dropout:  # dropout questionnaires are not counted
                 grouped_results[contribution_result.contributor].extend(questionnaire_result.question_results)
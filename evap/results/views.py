@@ -1,17 +1,31 @@
 from collections import defaultdict
+from collections.abc import Collection, Iterable
+from dataclasses import dataclass
+from functools import partial
 from statistics import median
 
 from django.conf import settings
 from django.core.cache import caches
 from django.core.cache.utils import make_template_fragment_key
 from django.core.exceptions import BadRequest, PermissionDenied
-from django.db.models import Count, QuerySet
+from django.db import transaction
+from django.db.models import Count, Prefetch, QuerySet
 from django.shortcuts import get_object_or_404, render
 from django.template.loader import get_template
 from django.utils import translation
+from django.utils.safestring import mark_safe
 
 from evap.evaluation.auth import internal_required
-from evap.evaluation.models import Contribution, Course, CourseType, Evaluation, Program, Semester, UserProfile
+from evap.evaluation.models import (
+    Contribution,
+    Course,
+    CourseType,
+    Evaluation,
+    EvaluationManager,
+    Program,
+    Semester,
+    UserProfile,
+)
 from evap.evaluation.tools import AttachmentResponse
 from evap.results.exporters import TextAnswerExporter
 from evap.results.tools import (
@@ -59,6 +73,7 @@ def _delete_evaluation_template_cache_impl(evaluation):
 def _delete_course_template_cache_impl(course):
     caches["results"].delete(get_course_result_template_fragment_cache_key(course.id, "en"))
     caches["results"].delete(get_course_result_template_fragment_cache_key(course.id, "de"))
+    delete_results_index_cache([course.semester_id])
 
 
 def update_template_cache(evaluations):
@@ -66,6 +81,7 @@ def update_template_cache(evaluations):
     evaluations = get_evaluations_with_course_result_attributes(get_evaluations_with_prefetched_data(evaluations))
 
     courses_and_evaluations = unordered_groupby((evaluation.course, evaluation) for evaluation in evaluations)
+    delete_results_index_cache(course.semester_id for course in courses_and_evaluations)
 
     current_language = translation.get_language()
 
@@ -108,6 +124,187 @@ def update_template_cache_of_published_evaluations_in_course(course):
     update_template_cache(course_evaluations)
 
 
+@dataclass(frozen=True)
+class ResultsIndexEvaluation:
+    """A published evaluation on the results index, with everything needed to decide who can see it."""
+
+    id: int
+    is_private: bool
+    can_publish_rating_results: bool
+    responsible_or_contributor_ids: frozenset[int]
+
+
+@dataclass(frozen=True)
+class ResultsIndexCourse:
+    id: int
+    type_id: int
+    program_ids: tuple[int, ...]
+    num_evaluations: int
+    evaluations: tuple[ResultsIndexEvaluation, ...]
+
+
+def get_results_index_cache_key(semester_id: int) -> str:
+    return f"evap.results.views.results_index-{semester_id:d}"
+
+
+def delete_results_index_cache(semester_ids: Iterable[int]) -> None:
+    cache_keys = [get_results_index_cache_key(semester_id) for semester_id in set(semester_ids)]
+    if not cache_keys:
+        return
+
+    caches["results"].delete_many(cache_keys)
+    # requests running concurrently with the current transaction might cache the index of its old data
+    transaction.on_commit(partial(caches["results"].delete_many, cache_keys))
+
+
+def _calculate_results_index(semester_ids: Collection[int]) -> dict[int, list[ResultsIndexCourse]]:
+    courses = (
+        Course.objects.filter(
+            semester_id__in=semester_ids,
+            pk__in=Evaluation.objects.filter(state=Evaluation.State.PUBLISHED).values("course"),
+        )
+        .annotate(num_evaluations=Count("evaluations"))
+        .prefetch_related(
+            "programs",
+            "responsibles",
+            Prefetch(
+                "evaluations",
+                queryset=Evaluation.annotate_with_participant_and_voter_counts(
+                    Evaluation.objects.filter(state=Evaluation.State.PUBLISHED)
+                ).prefetch_related("contributions"),
+                to_attr="published_evaluations",
+            ),
+        )
+        .order_by("pk")
+    )
+
+    results_index: dict[int, list[ResultsIndexCourse]] = {semester_id: [] for semester_id in semester_ids}
+    for course in courses:
+        responsible_ids = {responsible.id for responsible in course.responsibles.all()}
+        results_index[course.semester_id].append(
+            ResultsIndexCourse(
+                id=course.id,
+                type_id=course.type_id,
+                program_ids=tuple(program.id for program in course.programs.all()),
+                num_evaluations=course.num_evaluations,
+                evaluations=tuple(
+                    ResultsIndexEvaluation(
+                        id=evaluation.id,
+                        is_private=course.is_private,
+                        can_publish_rating_results=evaluation.can_publish_rating_results,
+                        responsible_or_contributor_ids=frozenset(
+                            responsible_ids
+                            | {
+                                contribution.contributor_id
+                                for contribution in evaluation.contributions.all()
+                                if contribution.contributor_id is not None
+                            }
+                        ),
+                    )
+                    for evaluation in course.published_evaluations
+                ),
+            )
+        )
+    return results_index
+
+
+def get_results_index(semester_ids: Collection[int]) -> dict[int, list[ResultsIndexCourse]]:
+    """
+    The courses with published evaluations of the given semesters. The index of each semester is cached until the
+    result template cache of one of its evaluations or courses is updated or deleted.
+    """
+    cache_keys = {semester_id: get_results_index_cache_key(semester_id) for semester_id in semester_ids}
+    cached = caches["results"].get_many(cache_keys.values())
+    results_index = {semester_id: cached[key] for semester_id, key in cache_keys.items() if key in cached}
+
+    missing_semester_ids = [semester_id for semester_id in semester_ids if semester_id not in results_index]
+    if missing_semester_ids:
+        calculated = _calculate_results_index(missing_semester_ids)
+        caches["results"].set_many({cache_keys[semester_id]: courses for semester_id, courses in calculated.items()})
+        results_index.update(calculated)
+    return results_index
+
+
+def get_visible_results_index_evaluations(user: UserProfile, courses: Iterable[ResultsIndexCourse]) -> dict[int, bool]:
+    """
+    Maps the ids of the evaluations in the results index that the user can see to whether the user can also see their
+    results page. This matches Evaluation.can_be_seen_by and can_results_page_be_seen_by, which are simpler for
+    published evaluations in semesters whose results are not archived.
+    """
+    evaluations = [evaluation for course in courses for evaluation in course.evaluations]
+    if user.is_reviewer:
+        return dict.fromkeys((evaluation.id for evaluation in evaluations), True)
+
+    represented_user_ids = {user.id, *user.represented_users.values_list("id", flat=True)}
+    participated_evaluation_ids = set(
+        Evaluation.participants.through.objects.filter(userprofile=user).values_list("evaluation_id", flat=True)
+    )
+    visible_evaluations = {}
+    for evaluation in evaluations:
+        is_represented = not represented_user_ids.isdisjoint(evaluation.responsible_or_contributor_ids)
+        if (evaluation.is_private or user.is_external) and not (
+            is_represented or evaluation.id in participated_evaluation_ids
+        ):
+            continue
+        visible_evaluations[evaluation.id] = is_represented or evaluation.can_publish_rating_results
+    return visible_evaluations
+
+
+def attach_results_index_template_fragments(courses_and_evaluations):
+    """
+    Sets results_index_fragment on the courses and evaluations shown on the results index. All cached fragments are
+    fetched in a single cache request, and the missing ones are rendered and written back in another one.
+    """
+    language = translation.get_language()
+    course_cache_keys = {
+        course: get_course_result_template_fragment_cache_key(course.id, language)
+        for course in courses_and_evaluations
+        if course.num_evaluations > 1
+    }
+    evaluation_cache_keys = {
+        evaluation: get_evaluation_result_template_fragment_cache_key(
+            evaluation.id, language, evaluation.results_page_can_be_seen_by_user
+        )
+        for evaluations in courses_and_evaluations.values()
+        for evaluation in evaluations
+        if evaluation.state in STATES_WITH_RESULT_TEMPLATE_CACHING
+    }
+    fragments = caches["results"].get_many([*course_cache_keys.values(), *evaluation_cache_keys.values()])
+
+    results_index_course_template = get_template("results_index_course_impl.html", using="CachedEngine")
+    results_index_evaluation_template = get_template("results_index_evaluation_impl.html", using="CachedEngine")
+    # the fragments are rendered HTML, like the ones the cache template tag returns
+    missing_fragments = {}
+    for course, evaluations in courses_and_evaluations.items():
+        if course in course_cache_keys:
+            cache_key = course_cache_keys[course]
+            if cache_key not in fragments:
+                fragments[cache_key] = missing_fragments[cache_key] = results_index_course_template.render(
+                    {"course": course, "evaluations": evaluations}
+                )
+            course.results_index_fragment = mark_safe(fragments[cache_key])
+
+        for evaluation in evaluations:
+            cache_key = evaluation_cache_keys.get(evaluation)
+            if cache_key not in fragments:
+                fragment = results_index_evaluation_template.render(
+                    {
+                        "evaluation": evaluation,
+                        # an evaluation is a subentry or no subentry regardless of which user asks, which is why
+                        # the cache key does not need to include is_subentry
+                        "is_subentry": course.num_evaluations > 1,
+                        "links_to_results_page": evaluation.results_page_can_be_seen_by_user,
+                    }
+                )
+                if cache_key is None:  # evaluations that are not published yet are not cached
+                    evaluation.results_index_fragment = fragment
+                    continue
+                fragments[cache_key] = missing_fragments[cache_key] = fragment
+            evaluation.results_index_fragment = mark_safe(fragments[cache_key])
+
+    caches["results"].set_many(missing_fragments)
+
+
 def get_evaluations_with_prefetched_data(evaluations):
     if isinstance(evaluations, QuerySet):  # type: ignore[misc]
         evaluations = evaluations.select_related("course__type").prefetch_related(
@@ -124,38 +321,57 @@ def get_evaluations_with_prefetched_data(evaluations):
 
 @internal_required
 def index(request):
+    # pylint: disable=too-many-locals
     semesters = Semester.get_all_with_published_unarchived_results()
-    evaluations = Evaluation.objects.filter(course__semester__in=semesters, state=Evaluation.State.PUBLISHED)
-    evaluations = evaluations.select_related("course", "course__semester")
-    evaluations = [evaluation for evaluation in evaluations if evaluation.can_be_seen_by(request.user)]
+    index_courses = [
+        course for courses in get_results_index([semester.id for semester in semesters]).values() for course in courses
+    ]
+    links_to_results_page = get_visible_results_index_evaluations(request.user, index_courses)
+
+    evaluations = list(
+        Evaluation.objects.filter(pk__in=links_to_results_page.keys()).select_related("course", "course__semester")
+    )
+    for evaluation in evaluations:
+        evaluation.results_page_can_be_seen_by_user = links_to_results_page[evaluation.id]
+
+    visible_course_ids = {evaluation.course_id for evaluation in evaluations}
+    visible_index_courses = [course for course in index_courses if course.id in visible_course_ids]
+    num_evaluations = {course.id: course.num_evaluations for course in visible_index_courses}
+    program_ids = {program_id for course in visible_index_courses for program_id in course.program_ids}
+    course_type_ids = {course.type_id for course in visible_index_courses}
 
     if request.user.is_reviewer:
         additional_evaluations = get_evaluations_with_prefetched_data(
             Evaluation.objects.filter(
                 course__semester__in=semesters,
                 state__in=[Evaluation.State.IN_EVALUATION, Evaluation.State.EVALUATED, Evaluation.State.REVIEWED],
-            )
+            ).annotate(results_page_can_be_seen_by_user=EvaluationManager.results_page_visibility(request.user))
         )
         additional_evaluations = get_evaluations_with_course_result_attributes(additional_evaluations)
         evaluations += additional_evaluations
 
-    # put evaluations into a dict that maps from course to a list of evaluations.
-    # this dict is sorted by course.pk (important for the zip below)
+        for evaluation in additional_evaluations:
+            program_ids.update(program.id for program in evaluation.course.programs.all())
+            course_type_ids.add(evaluation.course.type_id)
+        num_evaluations.update(
+            Course.objects.filter(pk__in={evaluation.course_id for evaluation in additional_evaluations})
+            .exclude(pk__in=num_evaluations.keys())
+            .annotate(num_evaluations=Count("evaluations"))
+            .values_list("pk", "num_evaluations")
+        )
+
+    for evaluation in evaluations:
+        evaluation.course.num_evaluations = num_evaluations[evaluation.course_id]
+
+    # put evaluations into a dict that maps from course to a list of evaluations, sorted by course.pk
     # (this relies on python 3.7's guarantee that the insertion order of the dict is preserved)
     evaluations.sort(key=lambda evaluation: evaluation.course.pk)
     courses_and_evaluations = unordered_groupby((evaluation.course, evaluation) for evaluation in evaluations)
 
-    course_pks = [course.pk for course in courses_and_evaluations.keys()]
-
-    # annotate each course in courses with num_evaluations
-    annotated_courses = (
-        Course.objects.filter(pk__in=course_pks).annotate(num_evaluations=Count("evaluations")).order_by("pk").defer()
-    )
-    for course, annotated_course in zip(courses_and_evaluations.keys(), annotated_courses, strict=True):
-        course.num_evaluations = annotated_course.num_evaluations
+    attach_results_index_template_fragments(courses_and_evaluations)
 
-    programs = Program.objects.filter(courses__pk__in=course_pks).distinct()
-    course_types = CourseType.objects.filter(courses__pk__in=course_pks).distinct()
+    programs = Program.objects.filter(pk__in=program_ids)
+    course_types = CourseType.objects.filter(pk__in=course_type_ids)
     template_data = {
         "courses_and_evaluations": courses_and_evaluations.items(),
         "programs": programs,
@@ -7,7 +7,7 @@ from django.db import transaction
 from django.utils.translation import gettext as _
 
 from evap.evaluation.models import UserProfile
-from evap.rewards.models import RewardPointRedemption, RewardPointRedemptionEvent
+from evap.rewards.models import RewardPointBalance, RewardPointRedemption, RewardPointRedemptionEvent
 from evap.rewards.tools import reward_points_of_user
 
 
@@ -63,9 +63,8 @@ class BaseRewardPointRedemptionFormSet(forms.BaseFormSet):
     @contextmanager
     def lock(self):
         with transaction.atomic():
-            # lock these rows to prevent race conditions
-            list(self.user.reward_point_grantings.select_for_update())
-            list(self.user.reward_point_redemptions.select_for_update())
+            # lock the balance to prevent race conditions, all grantings and redemptions update it
+            RewardPointBalance.objects.select_for_update().get_or_create(user_profile=self.user)
 
             self.locked = True
             try:
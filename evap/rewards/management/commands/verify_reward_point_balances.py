@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from evap.evaluation.management.commands.tools import log_exceptions
+from evap.rewards.models import RewardPointBalance
+from evap.rewards.tools import calculate_reward_point_balances, recalculate_reward_point_balances
+
+
+@log_exceptions
+class Command(BaseCommand):
+    help = "Verifies the stored reward point balances against the grantings and redemptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Recalculate all inconsistent balances.")
+
+    def handle(self, *args, **options):
+        stored = {
+            user_id: (granted, redeemed)
+            for user_id, granted, redeemed in RewardPointBalance.objects.values_list(
+                "user_profile", "granted", "redeemed"
+            )
+        }
+        expected = calculate_reward_point_balances()
+
+        inconsistent_user_ids = sorted(
+            user_id
+            for user_id in stored.keys() | expected.keys()
+            if stored.get(user_id, (0, 0)) != expected.get(user_id, (0, 0))
+        )
+        for user_id in inconsistent_user_ids:
+            self.stdout.write(
+                f"User {user_id}: stored (granted, redeemed) {stored.get(user_id)}, expected {expected.get(user_id, (0, 0))}"
+            )
+
+        if not inconsistent_user_ids:
+            self.stdout.write("All reward point balances are consistent.")
+        elif options["fix"]:
+            recalculate_reward_point_balances(inconsistent_user_ids)
+            self.stdout.write(f"Fixed {len(inconsistent_user_ids)} reward point balances.")
+        else:
+            raise CommandError(f"{len(inconsistent_user_ids)} reward point balances are inconsistent.")
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.5 on 2026-10-19 13:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_balances(apps, _schema_editor):
+    RewardPointBalance = apps.get_model("rewards", "RewardPointBalance")
+    RewardPointGranting = apps.get_model("rewards", "RewardPointGranting")
+    RewardPointRedemption = apps.get_model("rewards", "RewardPointRedemption")
+
+    balances = {}
+    for user_id, granted in (
+        RewardPointGranting.objects.values("user_profile").annotate(sum=Sum("value")).values_list("user_profile", "sum")
+    ):
+        balances[user_id] = RewardPointBalance(user_profile_id=user_id, granted=granted)
+    for user_id, redeemed in (
+        RewardPointRedemption.objects.values("user_profile")
+        .annotate(sum=Sum("value"))
+        .values_list("user_profile", "sum")
+    ):
+        balances.setdefault(user_id, RewardPointBalance(user_profile_id=user_id)).redeemed = redeemed
+    RewardPointBalance.objects.bulk_create(balances.values())
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluation", "0164_remove_questionnaire_questionnaire_visibility_choices_and_more"),
+        ("rewards", "0007_localize_rewardpointredemption_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RewardPointBalance",
+            fields=[
+                (
+                    "user_profile",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="reward_point_balance",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("granted", models.IntegerField(default=0, verbose_name="granted points")),
+                ("redeemed", models.IntegerField(default=0, verbose_name="redeemed points")),
+            ],
+        ),
+        migrations.RunPython(fill_balances, reverse_code=migrations.RunPython.noop),
+    ]
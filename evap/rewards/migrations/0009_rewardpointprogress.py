@@ -0,0 +1,44 @@
+# Generated by Django 6.0.5 on 2026-10-19 13:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluation", "0164_remove_questionnaire_questionnaire_visibility_choices_and_more"),
+        ("rewards", "0008_rewardpointbalance"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RewardPointProgress",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("required_evaluation_count", models.PositiveIntegerField(verbose_name="required evaluations")),
+                ("voted_evaluation_count", models.PositiveIntegerField(verbose_name="voted evaluations")),
+                ("granted_points", models.IntegerField(verbose_name="granted points")),
+                (
+                    "semester",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reward_point_progresses",
+                        to="evaluation.semester",
+                    ),
+                ),
+                (
+                    "user_profile",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reward_point_progresses",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user_profile", "semester")},
+            },
+        ),
+    ]
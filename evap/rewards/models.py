@@ -56,6 +56,44 @@ class RewardPointRedemption(models.Model):
     event = models.ForeignKey(RewardPointRedemptionEvent, models.PROTECT, related_name="reward_point_redemptions")
 
 
+class RewardPointBalance(models.Model):
+    """
+    Denormalized sums of a user's grantings and redemptions. Kept up to date by the signal handlers in
+    `rewards.tools`, the management command `verify_reward_point_balances` checks it against the raw rows.
+    """
+
+    user_profile = models.OneToOneField(
+        UserProfile, models.CASCADE, primary_key=True, related_name="reward_point_balance"
+    )
+    granted = models.IntegerField(verbose_name=_("granted points"), default=0)
+    redeemed = models.IntegerField(verbose_name=_("redeemed points"), default=0)
+
+    @property
+    def available(self) -> int:
+        return self.granted - self.redeemed
+
+
+class RewardPointProgress(models.Model):
+    """
+    Denormalized voting progress of a user in a semester, so that granting reward points after a vote does not need
+    to count evaluations. Votes and grantings update it, other changes to participations, votes, evaluations or
+    grantings delete it, and `rewards.tools.get_reward_point_progress` recalculates it when missing.
+    """
+
+    user_profile = models.ForeignKey(UserProfile, models.CASCADE, related_name="reward_point_progresses")
+    semester = models.ForeignKey(Semester, models.CASCADE, related_name="reward_point_progresses")
+    required_evaluation_count = models.PositiveIntegerField(verbose_name=_("required evaluations"))
+    voted_evaluation_count = models.PositiveIntegerField(verbose_name=_("voted evaluations"))
+    granted_points = models.IntegerField(verbose_name=_("granted points"))
+
+    class Meta:
+        unique_together = [["user_profile", "semester"]]
+
+    @property
+    def progress(self) -> float:
+        return self.voted_evaluation_count / self.required_evaluation_count
+
+
 class SemesterActivation(models.Model):
     semester = models.OneToOneField(Semester, models.CASCADE, related_name="rewards_active")
     is_active = models.BooleanField(default=False)
@@ -0,0 +1,39 @@
+from io import StringIO
+
+from django.core import management
+from django.core.management import CommandError
+from model_bakery import baker
+
+from evap.evaluation.models import UserProfile
+from evap.evaluation.tests.tools import TestCase
+from evap.rewards.models import RewardPointBalance, RewardPointGranting, RewardPointRedemption
+from evap.rewards.tools import reward_points_of_user
+
+
+class TestVerifyRewardPointBalancesCommand(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = baker.make(UserProfile)
+        baker.make(RewardPointGranting, user_profile=cls.student, value=5)
+        baker.make(RewardPointRedemption, user_profile=cls.student, value=2)
+
+    def test_consistent_balances(self):
+        output = StringIO()
+        management.call_command("verify_reward_point_balances", stdout=output)
+        self.assertIn("All reward point balances are consistent.", output.getvalue())
+
+    def test_inconsistent_balances(self):
+        RewardPointBalance.objects.filter(user_profile=self.student).update(granted=10)
+        unrelated_user = baker.make(UserProfile)
+        baker.make(RewardPointBalance, user_profile=unrelated_user, redeemed=1)
+
+        output = StringIO()
+        with self.assertRaisesMessage(CommandError, "2 reward point balances are inconsistent."):
+            management.call_command("verify_reward_point_balances", stdout=output)
+        self.assertIn(f"User {self.student.pk}: stored (granted, redeemed) (10, 2), expected (5, 2)", output.getvalue())
+        self.assertEqual(reward_points_of_user(self.student), 8)
+
+        management.call_command("verify_reward_point_balances", "--fix", stdout=output)
+        self.assertIn("Fixed 2 reward point balances.", output.getvalue())
+        self.assertEqual(reward_points_of_user(self.student), 3)
+        self.assertEqual(reward_points_of_user(unrelated_user), 0)
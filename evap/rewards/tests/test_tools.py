@@ -1,11 +1,36 @@
-from django.test import override_settings
+from unittest.mock import patch
+
+from django.test import RequestFactory, override_settings
 from django.urls import reverse
 from model_bakery import baker
 
-from evap.evaluation.models import NO_ANSWER, Course, Evaluation, Question, Questionnaire, QuestionType, UserProfile
+from evap.evaluation.models import (
+    NO_ANSWER,
+    Course,
+    Evaluation,
+    Question,
+    Questionnaire,
+    QuestionType,
+    Semester,
+    UserProfile,
+)
 from evap.evaluation.tests.tools import TestCase, WebTest
-from evap.rewards.models import RewardPointGranting, SemesterActivation
-from evap.rewards.tools import reward_points_of_user
+from evap.rewards.models import (
+    RewardPointBalance,
+    RewardPointGranting,
+    RewardPointProgress,
+    RewardPointRedemption,
+    SemesterActivation,
+)
+from evap.rewards.tools import (
+    get_reward_point_balance,
+    get_reward_point_progress,
+    grant_reward_points_for_users,
+    grant_reward_points_if_eligible,
+    recalculate_reward_point_balances,
+    redeemed_points_of_user,
+    reward_points_of_user,
+)
 
 
 @override_settings(
@@ -108,3 +133,198 @@ class TestGrantRewardPointsParticipationChange(TestCase):
     def test_evaluation_deleted(self):
         self.evaluation.delete()
         self.assertEqual(reward_points_of_user(self.student), 3)
+
+
+@override_settings(
+    REWARD_POINTS=[
+        (1 / 3, 1),
+        (2 / 3, 2),
+        (3 / 3, 3),
+    ]
+)
+class TestGrantRewardPointsForUsers(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.semester = baker.make(Semester)
+        SemesterActivation.objects.create(semester=cls.semester, is_active=True)
+        cls.evaluations = baker.make(Evaluation, course__semester=cls.semester, _quantity=3, _bulk_create=True)
+
+    def test_grants_missing_points(self):
+        half_done = baker.make(UserProfile, email="half@institution.example.com")
+        self.evaluations[0].participants.add(half_done)
+        self.evaluations[1].participants.add(half_done)
+        self.evaluations[0].voters.add(half_done)
+
+        partially_granted = baker.make(UserProfile, email="partially@institution.example.com")
+        self.evaluations[2].participants.add(partially_granted)
+        self.evaluations[2].voters.add(partially_granted)
+        baker.make(RewardPointGranting, user_profile=partially_granted, semester=self.semester, value=1)
+
+        external = baker.make(UserProfile, email="external@example.com")
+        self.evaluations[0].participants.add(external)
+        self.evaluations[0].voters.add(external)
+
+        unrewarded = baker.make(UserProfile, email="unrewarded@institution.example.com")
+        unrewarded_evaluation = baker.make(Evaluation, course__semester=self.semester, is_rewarded=False)
+        unrewarded_evaluation.participants.add(unrewarded)
+        unrewarded_evaluation.voters.add(unrewarded)
+
+        grantings = grant_reward_points_for_users(UserProfile.objects.all(), self.semester)
+
+        self.assertCountEqual(
+            [(granting.user_profile_id, granting.value) for granting in grantings],
+            [(half_done.pk, 1), (partially_granted.pk, 2)],
+        )
+        self.assertEqual(reward_points_of_user(half_done), 1)
+        self.assertEqual(reward_points_of_user(partially_granted), 3)
+        self.assertEqual(reward_points_of_user(external), 0)
+        self.assertEqual(reward_points_of_user(unrewarded), 0)
+
+    def test_semester_not_activated(self):
+        student = baker.make(UserProfile, email="student@institution.example.com")
+        self.evaluations[0].participants.add(student)
+        self.evaluations[0].voters.add(student)
+        SemesterActivation.objects.filter(semester=self.semester).update(is_active=False)
+
+        self.assertEqual(grant_reward_points_for_users([student], self.semester), [])
+
+    def test_constant_number_of_queries(self):
+        students = baker.make(
+            UserProfile,
+            email=iter(f"student{i}@institution.example.com" for i in range(20)),
+            _quantity=20,
+            _bulk_create=True,
+        )
+        for evaluation in self.evaluations:
+            evaluation.participants.set(students)
+            evaluation.voters.set(students)
+
+        # activation, progress, users, grantings, bulk_create, balance rows, balance update, progress rows
+        with self.assertNumQueries(8):
+            grantings = grant_reward_points_for_users(UserProfile.objects.all(), self.semester)
+        self.assertEqual(len(grantings), 20)
+        self.assertEqual(sum(reward_points_of_user(student) for student in students), 60)
+
+
+@override_settings(
+    REWARD_POINTS=[
+        (1 / 3, 1),
+        (2 / 3, 2),
+        (3 / 3, 3),
+    ]
+)
+class TestRewardPointProgress(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.semester = baker.make(Semester)
+        SemesterActivation.objects.create(semester=cls.semester, is_active=True)
+        cls.student = baker.make(UserProfile, email="student@institution.example.com")
+        cls.evaluations = baker.make(
+            Evaluation, course__semester=cls.semester, participants=[cls.student], _quantity=2, _bulk_create=True
+        )
+        cls.unrewarded_evaluation = baker.make(
+            Evaluation, course__semester=cls.semester, participants=[cls.student], is_rewarded=False
+        )
+
+    def assert_progress(self, required_count, voted_count, granted_points):
+        progress = RewardPointProgress.objects.get(user_profile=self.student, semester=self.semester)
+        self.assertEqual(
+            (progress.required_evaluation_count, progress.voted_evaluation_count, progress.granted_points),
+            (required_count, voted_count, granted_points),
+        )
+
+    def vote(self, evaluation):
+        Evaluation.voters.through.objects.create(userprofile=self.student, evaluation=evaluation)
+        evaluation.vote_recorded.send(
+            sender=Evaluation, user=self.student, evaluation=evaluation, semester=self.semester
+        )
+        request = RequestFactory().post("/")
+        request.user = self.student
+        with patch("evap.rewards.tools.messages"):
+            evaluation.evaluation_evaluated.send(
+                sender=Evaluation, request=request, evaluation=evaluation, semester=self.semester
+            )
+
+    def test_votes_and_grantings_update_progress(self):
+        get_reward_point_progress(self.student, self.semester)
+        self.assert_progress(2, 0, 0)
+
+        self.vote(self.evaluations[0])
+        self.assert_progress(2, 1, 1)
+        self.assertEqual(reward_points_of_user(self.student), 1)
+
+        # vote, lock, progress
+        with self.assertNumQueries(3):
+            self.vote(self.unrewarded_evaluation)
+        self.assert_progress(2, 1, 1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(grant_reward_points_if_eligible(self.student, self.semester), (None, False))
+
+        self.vote(self.evaluations[1])
+        self.assert_progress(2, 2, 3)
+        self.assertEqual(reward_points_of_user(self.student), 3)
+
+    def test_progress_is_recalculated_after_changes(self):
+        self.vote(self.evaluations[0])
+        self.assert_progress(2, 1, 1)
+
+        new_evaluation = baker.make(Evaluation, course__semester=self.semester)
+        new_evaluation.participants.add(self.student)
+        self.assertFalse(RewardPointProgress.objects.exists())
+        get_reward_point_progress(self.student, self.semester)
+        self.assert_progress(3, 1, 1)
+
+        evaluation = Evaluation.objects.get(pk=new_evaluation.pk)
+        evaluation.name_en = "renamed"
+        evaluation.save()
+        self.assertTrue(RewardPointProgress.objects.exists())
+
+        self.evaluations[0].is_rewarded = False
+        self.evaluations[0].save()
+        self.assertFalse(RewardPointProgress.objects.exists())
+        get_reward_point_progress(self.student, self.semester)
+        self.assert_progress(2, 0, 1)
+
+        self.student.evaluations_voted_for.clear()
+        self.assertFalse(RewardPointProgress.objects.exists())
+        get_reward_point_progress(self.student, self.semester)
+
+        RewardPointGranting.objects.get(user_profile=self.student).delete()
+        self.assertFalse(RewardPointProgress.objects.exists())
+        get_reward_point_progress(self.student, self.semester)
+        self.assert_progress(2, 0, 0)
+
+
+class TestRewardPointBalance(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = baker.make(UserProfile)
+
+    def test_balance_follows_grantings_and_redemptions(self):
+        self.assertEqual(reward_points_of_user(self.student), 0)
+
+        granting = baker.make(RewardPointGranting, user_profile=self.student, value=5)
+        baker.make(RewardPointGranting, user_profile=self.student, value=3)
+        baker.make(RewardPointRedemption, user_profile=self.student, value=2)
+        baker.make(RewardPointGranting, value=7)
+
+        balance = get_reward_point_balance(self.student)
+        self.assertEqual((balance.granted, balance.redeemed, balance.available), (8, 2, 6))
+        self.assertEqual(redeemed_points_of_user(self.student), 2)
+
+        granting.delete()
+        self.assertEqual(reward_points_of_user(self.student), 1)
+
+    def test_recalculate_reward_point_balances(self):
+        baker.make(RewardPointGranting, user_profile=self.student, value=5)
+        baker.make(RewardPointRedemption, user_profile=self.student, value=2)
+        other_user = baker.make(UserProfile)
+        baker.make(RewardPointBalance, user_profile=other_user, granted=4)
+        RewardPointBalance.objects.filter(user_profile=self.student).update(granted=0, redeemed=0)
+
+        with self.assertNumQueries(3):
+            recalculate_reward_point_balances([self.student.pk, other_user.pk])
+
+        self.assertEqual(reward_points_of_user(self.student), 3)
+        self.assertEqual(reward_points_of_user(other_user), 0)
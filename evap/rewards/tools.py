@@ -1,9 +1,11 @@
 import logging
+from collections import defaultdict
+from collections.abc import Collection
 
 from django.conf import settings
 from django.contrib import messages
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, QuerySet, Sum
 from django.dispatch import receiver
 from django.http import HttpRequest
 from django.utils.translation import gettext as _
@@ -11,7 +13,13 @@ from django.utils.translation import ngettext
 
 from evap.evaluation.models import Evaluation, Semester, UserProfile
 from evap.evaluation.tools import inside_transaction
-from evap.rewards.models import RewardPointGranting, RewardPointRedemption, SemesterActivation
+from evap.rewards.models import (
+    RewardPointBalance,
+    RewardPointGranting,
+    RewardPointProgress,
+    RewardPointRedemption,
+    SemesterActivation,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,18 +28,58 @@ def can_reward_points_be_used_by(user: UserProfile) -> bool:
     return not user.is_external and user.is_participant
 
 
-def reward_points_of_user(user: UserProfile) -> int:
-    count = 0
-    for granting in user.reward_point_grantings.all():
-        count += granting.value
-    for redemption in user.reward_point_redemptions.all():
-        count -= redemption.value
+def get_reward_point_balance(user: UserProfile) -> RewardPointBalance:
+    return RewardPointBalance.objects.filter(user_profile=user).first() or RewardPointBalance(user_profile=user)
+
 
-    return count
+def reward_points_of_user(user: UserProfile) -> int:
+    return get_reward_point_balance(user).available
 
 
 def redeemed_points_of_user(user: UserProfile) -> int:
-    return RewardPointRedemption.objects.filter(user_profile=user).aggregate(Sum("value"))["value__sum"] or 0
+    return get_reward_point_balance(user).redeemed
+
+
+def calculate_reward_point_balances(user_ids: Collection[int] | None = None) -> dict[int, tuple[int, int]]:
+    """Sums up the granting and redemption rows, returning (granted, redeemed) for each user that has any."""
+    grantings = RewardPointGranting.objects.all()
+    redemptions = RewardPointRedemption.objects.all()
+    if user_ids is not None:
+        grantings = grantings.filter(user_profile__in=user_ids)
+        redemptions = redemptions.filter(user_profile__in=user_ids)
+
+    granted = dict(grantings.values("user_profile").annotate(sum=Sum("value")).values_list("user_profile", "sum"))
+    redeemed = dict(redemptions.values("user_profile").annotate(sum=Sum("value")).values_list("user_profile", "sum"))
+    return {
+        user_id: (granted.get(user_id, 0), redeemed.get(user_id, 0)) for user_id in granted.keys() | redeemed.keys()
+    }
+
+
+def recalculate_reward_point_balances(user_ids: Collection[int]) -> None:
+    sums = calculate_reward_point_balances(user_ids)
+    balances = []
+    for user_id in user_ids:
+        granted, redeemed = sums.get(user_id, (0, 0))
+        balances.append(RewardPointBalance(user_profile_id=user_id, granted=granted, redeemed=redeemed))
+
+    RewardPointBalance.objects.bulk_create(
+        balances,
+        update_conflicts=True,
+        unique_fields=["user_profile"],
+        update_fields=["granted", "redeemed"],
+    )
+
+
+def add_to_reward_point_balances(field: str, values_by_user_id: dict[int, int]) -> None:
+    RewardPointBalance.objects.bulk_create(
+        [RewardPointBalance(user_profile_id=user_id) for user_id in values_by_user_id], ignore_conflicts=True
+    )
+    # there are only few distinct values, so this needs few queries while still incrementing atomically
+    user_ids_by_value = defaultdict(list)
+    for user_id, value in values_by_user_id.items():
+        user_ids_by_value[value].append(user_id)
+    for value, user_ids in user_ids_by_value.items():
+        RewardPointBalance.objects.filter(user_profile__in=user_ids).update(**{field: F(field) + value})
 
 
 def is_semester_activated(semester: Semester) -> bool:
@@ -42,38 +90,125 @@ def deactivate_semester(semester: Semester) -> None:
     SemesterActivation.objects.filter(semester=semester).update(is_active=False)
 
 
+def reward_points_for_progress(progress: float) -> int:
+    return max((points for threshold, points in settings.REWARD_POINTS if threshold <= progress), default=0)
+
+
+def evaluation_counts_by_user_id(
+    users: QuerySet[UserProfile] | Collection[UserProfile], semester: Semester
+) -> dict[int, tuple[int, int]]:
+    """Returns (required, voted) counts of rewarded evaluations in the semester for all given participants."""
+    participations = Evaluation.participants.through.objects.filter(
+        evaluation__course__semester=semester, evaluation__is_rewarded=True, userprofile__in=users
+    )
+    has_voted = Exists(
+        Evaluation.voters.through.objects.filter(evaluation=OuterRef("evaluation"), userprofile=OuterRef("userprofile"))
+    )
+    return {
+        row["userprofile"]: (row["required_count"], row["voted_count"])
+        for row in participations.values("userprofile").annotate(
+            required_count=Count("pk"), voted_count=Count("pk", filter=Q(has_voted))
+        )
+    }
+
+
+def lock_user(user_id: int) -> None:
+    # Votes lock the user as well, so they are either counted in a recalculated progress or update it afterwards
+    list(UserProfile.objects.select_for_update().filter(pk=user_id).values_list("pk"))
+
+
+def get_reward_point_progress(user: UserProfile, semester: Semester) -> RewardPointProgress:
+    progress = RewardPointProgress.objects.filter(user_profile=user, semester=semester).first()
+    if progress:
+        return progress
+
+    with transaction.atomic():
+        lock_user(user.pk)
+        required_count, voted_count = evaluation_counts_by_user_id([user], semester).get(user.pk, (0, 0))
+        granted_points = RewardPointGranting.objects.filter(user_profile=user, semester=semester).aggregate(
+            sum=Sum("value", default=0)
+        )["sum"]
+        progress, __ = RewardPointProgress.objects.get_or_create(
+            user_profile=user,
+            semester=semester,
+            defaults={
+                "required_evaluation_count": required_count,
+                "voted_evaluation_count": voted_count,
+                "granted_points": granted_points,
+            },
+        )
+    return progress
+
+
 def grant_reward_points_if_eligible(user: UserProfile, semester: Semester) -> tuple[RewardPointGranting | None, bool]:
-    if not can_reward_points_be_used_by(user):
-        return None, False
-    if not is_semester_activated(semester):
+    # users with a required evaluation are participants, so only the external check of can_reward_points_be_used_by
+    # remains to be done
+    if user.is_external:
         return None, False
+
+    progress = get_reward_point_progress(user, semester)
     # does the user have at least one required evaluation in this semester?
-    required_evaluations = Evaluation.objects.filter(participants=user, course__semester=semester, is_rewarded=True)
-    if not required_evaluations.exists():
+    if progress.required_evaluation_count == 0:
         return None, False
 
     # How many points have been granted to this user vs how many should they have (this semester)
-    granted_points = (
-        RewardPointGranting.objects.filter(user_profile=user, semester=semester).aggregate(Sum("value"))["value__sum"]
-        or 0
+    missing_points = reward_points_for_progress(progress.progress) - progress.granted_points
+    if missing_points <= 0 or not is_semester_activated(semester):
+        return None, False
+
+    granting = RewardPointGranting.objects.create(user_profile=user, semester=semester, value=missing_points)
+    return granting, progress.progress >= 1.0
+
+
+def grant_reward_points_for_users(
+    users: QuerySet[UserProfile] | Collection[UserProfile], semester: Semester
+) -> list[RewardPointGranting]:
+    """
+    Bulk version of grant_reward_points_if_eligible, using a constant number of queries. Returns the created
+    grantings.
+    """
+    if not is_semester_activated(semester):
+        return []
+
+    progress_by_user_id = {
+        user_id: voted_count / required_count
+        for user_id, (required_count, voted_count) in evaluation_counts_by_user_id(users, semester).items()
+    }
+
+    # users with a required evaluation are participants, so only the external check of can_reward_points_be_used_by
+    # remains to be done
+    eligible_user_ids = [
+        user.pk
+        for user in UserProfile.objects.filter(pk__in=progress_by_user_id).only("email", "is_proxy_user")
+        if not user.is_external
+    ]
+    granted_points_by_user_id = dict(
+        RewardPointGranting.objects.filter(user_profile__in=eligible_user_ids, semester=semester)
+        .values("user_profile")
+        .annotate(sum=Sum("value"))
+        .values_list("user_profile", "sum")
     )
-    progress = float(required_evaluations.filter(voters=user).count()) / float(required_evaluations.count())
-    target_points = max((points for threshold, points in settings.REWARD_POINTS if threshold <= progress), default=0)
-    missing_points = target_points - granted_points
 
-    if missing_points > 0:
-        granting = RewardPointGranting.objects.create(user_profile=user, semester=semester, value=missing_points)
-        return granting, progress >= 1.0
-    return None, False
+    grantings = []
+    for user_id in eligible_user_ids:
+        target_points = reward_points_for_progress(progress_by_user_id[user_id])
+        missing_points = target_points - granted_points_by_user_id.get(user_id, 0)
+        if missing_points > 0:
+            grantings.append(RewardPointGranting(user_profile_id=user_id, semester=semester, value=missing_points))
+
+    RewardPointGranting.objects.bulk_create(grantings)
+    # bulk_create does not send post_save, so the balances and progresses have to be updated here
+    add_to_reward_point_balances("granted", {granting.user_profile_id: granting.value for granting in grantings})
+    RewardPointProgress.objects.filter(
+        user_profile__in=[granting.user_profile_id for granting in grantings], semester=semester
+    ).delete()
+    return grantings
 
 
 def grant_eligible_reward_points_for_semester(request: HttpRequest, semester: Semester) -> None:
     users = UserProfile.objects.filter(evaluations_voted_for__course__semester=semester)
-    reward_point_sum = 0
-    for user in users:
-        granting, _ = grant_reward_points_if_eligible(user, semester)
-        if granting:
-            reward_point_sum += granting.value
+    grantings = grant_reward_points_for_users(users, semester)
+    reward_point_sum = sum(granting.value for granting in grantings)
     if reward_point_sum:
         message = ngettext(
             "{count} reward point was granted on already completed questionnaires.",
@@ -85,6 +220,93 @@ def grant_eligible_reward_points_for_semester(request: HttpRequest, semester: Se
 
 # Signal handlers
 
+BALANCE_FIELDS = {RewardPointGranting: "granted", RewardPointRedemption: "redeemed"}
+
+
+@receiver(models.signals.post_save, sender=RewardPointGranting)
+@receiver(models.signals.post_save, sender=RewardPointRedemption)
+def update_reward_point_balance_on_create(sender, instance, created: bool, raw: bool, **_kwargs) -> None:
+    # grantings and redemptions are never altered. Fixtures bring their own balances.
+    if not created or raw:
+        return
+
+    add_to_reward_point_balances(BALANCE_FIELDS[sender], {instance.user_profile_id: instance.value})
+
+
+@receiver(models.signals.post_delete, sender=RewardPointGranting)
+@receiver(models.signals.post_delete, sender=RewardPointRedemption)
+def update_reward_point_balance_on_delete(sender, instance, **_kwargs) -> None:
+    # no get_or_create here, the balance might have been deleted already when deleting the user
+    field = BALANCE_FIELDS[sender]
+    RewardPointBalance.objects.filter(user_profile_id=instance.user_profile_id).update(
+        **{field: F(field) - instance.value}
+    )
+
+
+@receiver(models.signals.post_save, sender=RewardPointGranting)
+def update_reward_point_progress_on_granting_create(instance: RewardPointGranting, created: bool, raw: bool, **_kwargs):
+    if not created or raw:
+        return
+
+    RewardPointProgress.objects.filter(
+        user_profile_id=instance.user_profile_id, semester_id=instance.semester_id
+    ).update(granted_points=F("granted_points") + instance.value)
+
+
+@receiver(models.signals.post_delete, sender=RewardPointGranting)
+def delete_reward_point_progress_on_granting_delete(instance: RewardPointGranting, **_kwargs) -> None:
+    RewardPointProgress.objects.filter(
+        user_profile_id=instance.user_profile_id, semester_id=instance.semester_id
+    ).delete()
+
+
+@receiver(models.signals.m2m_changed, sender=Evaluation.participants.through)
+@receiver(models.signals.m2m_changed, sender=Evaluation.voters.through)
+def delete_reward_point_progress_on_m2m_change(sender, instance, action: str, reverse: bool, pk_set, **_kwargs) -> None:
+    if action in ("post_add", "post_remove"):
+        if reverse:
+            progresses = RewardPointProgress.objects.filter(
+                user_profile=instance, semester__courses__evaluations__in=pk_set
+            )
+        else:
+            progresses = RewardPointProgress.objects.filter(
+                user_profile__in=pk_set, semester__courses=instance.course_id
+            )
+    elif action == "pre_clear":
+        if reverse:
+            progresses = RewardPointProgress.objects.filter(user_profile=instance)
+        else:
+            progresses = RewardPointProgress.objects.filter(
+                user_profile__in=sender.objects.filter(evaluation=instance).values("userprofile"),
+                semester__courses=instance.course_id,
+            )
+    else:
+        return
+    progresses.delete()
+
+
+@receiver(models.signals.pre_save, sender=Evaluation)
+def delete_reward_point_progress_on_evaluation_change(instance: Evaluation, raw: bool, **_kwargs) -> None:
+    # is_rewarded or the course, and with it the semester, might change. New evaluations have no participants yet.
+    if instance.pk is None or raw or not instance.has_unsaved_changes("is_rewarded", "course_id"):
+        return
+
+    RewardPointProgress.objects.filter(user_profile__evaluations_participating_in=instance).filter(
+        Q(semester__courses__evaluations=instance) | Q(semester__courses=instance.course_id)
+    ).delete()
+
+
+@receiver(Evaluation.vote_recorded)
+def count_vote_in_reward_point_progress(
+    user: UserProfile, evaluation: Evaluation, semester: Semester, **_kwargs
+) -> None:
+    # this is sent inside the vote transaction, so the vote and the progress are changed together
+    lock_user(user.pk)
+    if evaluation.is_rewarded:
+        RewardPointProgress.objects.filter(user_profile=user, semester=semester).update(
+            voted_evaluation_count=F("voted_evaluation_count") + 1
+        )
+
 
 @receiver(Evaluation.evaluation_evaluated)
 def grant_reward_points_after_evaluate(request: HttpRequest, semester: Semester, **_kwargs) -> None:
@@ -121,19 +343,15 @@ def grant_reward_points_on_participation_change(instance, action: str, reverse:
             # one or more evaluations got removed from a participant
             user = instance
 
-            for semester in Semester.objects.filter(courses__evaluations__pk__in=pk_set):
-                granting, __ = grant_reward_points_if_eligible(user, semester)
-                if granting:
-                    assert not grantings
-                    grantings = [granting]
+            for semester in Semester.objects.filter(courses__evaluations__pk__in=pk_set).distinct():
+                grantings += grant_reward_points_for_users([user], semester)
+            assert len(grantings) <= 1
         else:
             # one or more participants got removed from an evaluation
             evaluation = instance
-
-            for user in UserProfile.objects.filter(pk__in=pk_set):
-                granting, __ = grant_reward_points_if_eligible(user, evaluation.course.semester)
-                if granting:
-                    grantings.append(granting)
+            grantings = grant_reward_points_for_users(
+                UserProfile.objects.filter(pk__in=pk_set), evaluation.course.semester
+            )
 
         if grantings:
             RewardPointGranting.granted_by_participation_removal.send(sender=RewardPointGranting, grantings=grantings)
@@ -149,14 +367,9 @@ def grant_reward_points_on_evaluation_delete(instance: Evaluation, **_kwargs) ->
         # Currently, only staff:evaluation_delete and staff:semester_delete call .delete()
         logger.error("Called while not inside transaction")
 
-    grantings = []
-
     participants = list(instance.participants.all())
     instance.participants.clear()
-    for user in participants:
-        granting, __ = grant_reward_points_if_eligible(user, instance.course.semester)
-        if granting:
-            grantings.append(granting)
+    grantings = grant_reward_points_for_users(participants, instance.course.semester)
 
     if grantings:
         RewardPointGranting.granted_by_evaluation_deletion.send(sender=RewardPointGranting, grantings=grantings)
@@ -4,7 +4,7 @@ from datetime import date, datetime
 from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
 from django.core.exceptions import BadRequest, SuspiciousOperation
-from django.db.models import OuterRef, Subquery, Sum
+from django.db.models import F, Sum
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
@@ -14,17 +14,22 @@ from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, UpdateView
 
 from evap.evaluation.auth import manager_required, reward_user_required
-from evap.evaluation.models import Semester, UserProfile
+from evap.evaluation.models import Semester
 from evap.evaluation.tools import AttachmentResponse, get_object_from_dict_pk_entry_or_logged_40x
 from evap.rewards.exporters import RewardsExporter
 from evap.rewards.forms import RewardPointRedemptionEventForm, RewardPointRedemptionFormSet
 from evap.rewards.models import (
+    RewardPointBalance,
     RewardPointGranting,
     RewardPointRedemption,
     RewardPointRedemptionEvent,
     SemesterActivation,
 )
-from evap.rewards.tools import grant_eligible_reward_points_for_semester, redeemed_points_of_user, reward_points_of_user
+from evap.rewards.tools import (
+    get_reward_point_balance,
+    grant_eligible_reward_points_for_semester,
+    redeemed_points_of_user,
+)
 
 
 @reward_user_required
@@ -61,9 +66,9 @@ def index(request):
                 messages.success(request, _("You successfully redeemed your points."))
                 return redirect("rewards:index")
 
-    total_points_available = reward_points_of_user(request.user)
-    reward_point_grantings = RewardPointGranting.objects.filter(user_profile=request.user)
-    reward_point_redemptions = RewardPointRedemption.objects.filter(user_profile=request.user)
+    balance = get_reward_point_balance(request.user)
+    reward_point_grantings = RewardPointGranting.objects.filter(user_profile=request.user).select_related("semester")
+    reward_point_redemptions = RewardPointRedemption.objects.filter(user_profile=request.user).select_related("event")
 
     granted_point_actions = [
         (granting.granting_time, _("Reward for") + " " + granting.semester.name, granting.value, "")
@@ -80,8 +85,8 @@ def index(request):
 
     template_data = {
         "reward_point_actions": reward_point_actions,
-        "total_points_available": total_points_available,
-        "total_points_spent": sum(redemption.value for redemption in reward_point_redemptions),
+        "total_points_available": balance.available,
+        "total_points_spent": balance.redeemed,
         "events": events,
         "formset": formset,
         "forms": zip(formset, events, strict=True),
@@ -93,9 +98,10 @@ def index(request):
 def reward_point_redemption_events(request):
     upcoming_events = RewardPointRedemptionEvent.objects.filter(redeem_end_date__gte=datetime.now()).order_by("date")
     past_events = RewardPointRedemptionEvent.objects.filter(redeem_end_date__lt=datetime.now()).order_by("-date")
-    total_points_granted = RewardPointGranting.objects.aggregate(Sum("value"))["value__sum"] or 0
-    total_points_redeemed = RewardPointRedemption.objects.aggregate(Sum("value"))["value__sum"] or 0
-    total_points_available = total_points_granted - total_points_redeemed
+    totals = RewardPointBalance.objects.aggregate(
+        granted=Sum("granted", default=0), redeemed=Sum("redeemed", default=0)
+    )
+    total_points_available = totals["granted"] - totals["redeemed"]
     template_data = {
         "upcoming_events": upcoming_events,
         "past_events": past_events,
@@ -155,28 +161,15 @@ def reward_points_export(request):
     writer = csv.writer(response, delimiter=";", lineterminator="\n")
     writer.writerow([_("Email address"), _("Number of points")])
 
-    def aggregated_sum(relation: str) -> Subquery:
-        return Subquery(
-            UserProfile.objects.filter(pk=OuterRef("pk"))
-            .annotate(aggregated=Sum(f"{relation}__value", default=0))
-            .values("aggregated")
-        )
-
-    profiles_with_points = (
-        UserProfile.objects.annotate(
-            points=(aggregated_sum("reward_point_grantings") - aggregated_sum("reward_point_redemptions"))
-        )
+    balances_with_points = (
+        RewardPointBalance.objects.annotate(points=F("granted") - F("redeemed"))
         .filter(points__gt=0)
         .order_by("-points")
+        .values_list("user_profile__email", "points")
     )
 
-    for profile in profiles_with_points.all():
-        writer.writerow(
-            [
-                profile.email,
-                profile.points,
-            ]
-        )
+    for email, points in balances_with_points:
+        writer.writerow([email, points])
 
     return response
 
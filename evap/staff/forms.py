@@ -351,6 +351,7 @@ class CourseCopyForm(CourseFormMixin, forms.ModelForm):  # type: ignore[misc]
         "can_publish_text_results",
         "_participant_count",
         "_voter_count",
+        "counter",
         "voters",
         "votetimestamp",
         "cms_evaluation_links",
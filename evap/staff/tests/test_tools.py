@@ -6,14 +6,18 @@ from unittest.mock import MagicMock, patch
 from zipfile import ZipFile
 
 from django.contrib.auth.models import Group
+from django.db import connection, transaction
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils.html import escape
 from model_bakery import baker
 from openpyxl import load_workbook
 
-from evap.evaluation.models import Contribution, Course, Evaluation, UserProfile
-from evap.evaluation.tests.tools import TestCase, WebTest, assert_no_database_modifications
+from evap.evaluation.models import Contribution, Course, Evaluation, EvaluationCounter, UserProfile
+from evap.evaluation.tests.tools import TestCase, WebTest, assert_no_database_modifications, make_contributor
 from evap.rewards.models import RewardPointGranting, RewardPointRedemption
+from evap.rewards.tools import reward_points_of_user
 from evap.staff.fixtures.excel_files_test_data import (
     create_memory_csv_file,
     create_memory_excel_file,
@@ -21,6 +25,7 @@ from evap.staff.fixtures.excel_files_test_data import (
     valid_user_courses_import_users,
 )
 from evap.staff.tools import (
+    bulk_update_users,
     conditional_escape,
     merge_users,
     remove_participations_if_inactive,
@@ -119,6 +124,7 @@ class MergeUsersTest(TestCase):
             "Evaluation_voters+",  # some more intermediate models, for an explanation see above
             "Evaluation_participants+",  # intermediate model
             "startpage",  # not worth dealing with
+            "reward_point_progresses",  # deleted on participation changes and recalculated when needed
         }
         expected_attrs = set(all_attrs) - ignored_attrs
 
@@ -133,6 +139,7 @@ class MergeUsersTest(TestCase):
         additional_handled_attrs = {
             "grades_last_modified_user+",
             "Course_responsibles+",
+            "reward_point_balance",
         }
 
         actual_attrs = handled_attrs | additional_handled_attrs
@@ -170,6 +177,10 @@ class MergeUsersTest(TestCase):
         self.assertEqual(set(self.main_user.ccing_users.all()), {self.user1, self.user2})
         self.assertTrue(RewardPointGranting.objects.filter(user_profile=self.main_user).exists())
         self.assertTrue(RewardPointRedemption.objects.filter(user_profile=self.main_user).exists())
+        self.assertEqual(
+            reward_points_of_user(self.main_user),
+            self.rewardpointgranting_main.value - self.rewardpointredemption_main.value,
+        )
 
         self.assertEqual(set(self.course1.responsibles.all()), {self.main_user})
         self.assertEqual(set(self.course2.responsibles.all()), {self.main_user})
@@ -184,6 +195,136 @@ class MergeUsersTest(TestCase):
         self.assertFalse(RewardPointGranting.objects.filter(user_profile__email=self.other_user.email).exists())
         self.assertFalse(RewardPointRedemption.objects.filter(user_profile__email=self.other_user.email).exists())
 
+    def test_merge_users_logs_reassigned_relations(self):
+        self.evaluation1.participants.set([self.main_user])
+        self.contribution2.delete()
+        course3 = Course.objects.get(pk=self.course3.pk)
+        evaluation3 = Evaluation.objects.get(pk=self.evaluation3.pk)
+        expected_change = {"remove": [self.other_user.pk], "add": [self.main_user.pk]}
+        course1_logentry_count = self.course1.related_logentries().count()
+
+        merge_users(self.main_user, self.other_user)
+
+        self.assertEqual(course3.related_logentries().order_by("id").last().data, {"responsibles": expected_change})
+        self.assertEqual(evaluation3.related_logentries().order_by("id").last().data, {"participants": expected_change})
+        self.assertEqual(self.course1.related_logentries().count(), course1_logentry_count)
+
+
+class MergeUsersStartPageTest(WebTest):
+    def test_merge_users_invalidates_start_pages(self):
+        main_user = baker.make(UserProfile, email="main@institution.example.com")
+        other_user = baker.make(UserProfile, email="other@institution.example.com")
+        participated_evaluation = baker.make(
+            Evaluation, state=Evaluation.State.PREPARED, participants=[other_user], name_en="participated evaluation"
+        )
+        contributed_evaluation = baker.make(
+            Evaluation, state=Evaluation.State.PREPARED, name_en="contributed evaluation"
+        )
+        make_contributor(other_user, contributed_evaluation)
+        # gives the main user access to both start pages
+        make_contributor(main_user, baker.make(Evaluation, state=Evaluation.State.PREPARED, participants=[main_user]))
+
+        student_url, contributor_url = reverse("student:index"), reverse("contributor:index")
+        self.assertNotContains(self.app.get(student_url, user=main_user), participated_evaluation.full_name)
+        self.assertNotContains(self.app.get(contributor_url, user=main_user), contributed_evaluation.full_name)
+
+        merge_users(main_user, other_user)
+
+        self.assertContains(self.app.get(student_url, user=main_user), participated_evaluation.full_name)
+        self.assertContains(self.app.get(contributor_url, user=main_user), contributed_evaluation.full_name)
+
+
+@override_settings(
+    INSTITUTION_EMAIL_DOMAINS=["institution.example.com", "internal.example.com"],
+    PARTICIPATION_DELETION_AFTER_INACTIVE_TIME=timedelta(6 * 30),
+)
+@patch("evap.staff.tools.messages", MagicMock())
+class BulkUpdateUsersTest(TestCase):
+    @staticmethod
+    def make_users_and_file(count):
+        kept_users = baker.make(
+            UserProfile, email=iter(f"keep{i}@institution.example.com" for i in range(count)), _quantity=count
+        )
+        baker.make(UserProfile, email=iter(f"update{i}@institution.example.com" for i in range(count)), _quantity=count)
+        deletable_users = baker.make(
+            UserProfile, email=iter(f"delete{i}@institution.example.com" for i in range(count)), _quantity=count
+        )
+        for kept_user, deletable_user in zip(kept_users, deletable_users, strict=True):
+            kept_user.delegates.set([deletable_user])
+            kept_user.cc_users.set([deletable_user])
+
+        inactive_users = baker.make(
+            UserProfile, email=iter(f"inactive{i}@institution.example.com" for i in range(count)), _quantity=count
+        )
+        evaluation = baker.make(
+            Evaluation,
+            state=Evaluation.State.PUBLISHED,
+            vote_start_datetime=datetime.today() - timedelta(days=200),
+            vote_end_date=(datetime.today() - timedelta(days=180)).date(),
+            participants=inactive_users,
+        )
+        baker.make(Contribution, evaluation=evaluation, contributor=iter(inactive_users), _quantity=count)
+        evaluation.course.semester.archive()
+
+        emails = [
+            *(f"keep{i}@institution.example.com" for i in range(count)),
+            *(f"update{i}@internal.example.com" for i in range(count)),
+            *(f"new{i}@institution.example.com" for i in range(count)),
+        ]
+        return "\n".join(f"user,{email}" for email in emails).encode()
+
+    def test_bulk_update(self):
+        user_file_content = self.make_users_and_file(2)
+        inactive_users = list(UserProfile.objects.filter(email__startswith="inactive"))
+
+        self.assertTrue(bulk_update_users(None, user_file_content, test_run=False))
+
+        self.assertEqual(UserProfile.objects.filter(email__startswith="keep").count(), 2)
+        self.assertEqual(UserProfile.objects.filter(email__startswith="new").count(), 2)
+        self.assertEqual(UserProfile.objects.filter(email__endswith="@internal.example.com").count(), 2)
+        self.assertFalse(UserProfile.objects.filter(email__startswith="delete").exists())
+        self.assertFalse(UserProfile.objects.filter(email__startswith="inactive", is_active=True).exists())
+        self.assertFalse(Evaluation.objects.filter(participants__in=inactive_users).exists())
+        self.assertFalse(UserProfile.delegates.through.objects.exists())
+        self.assertFalse(UserProfile.cc_users.through.objects.exists())
+
+        evaluation = Evaluation.objects.get()
+        self.assertEqual(
+            set(evaluation.related_logentries().last().data["participants"]["remove"]),
+            {user.pk for user in inactive_users},
+        )
+
+    def test_deleted_users_are_removed_from_live_counts(self):
+        user_file_content = self.make_users_and_file(2)
+        deletable_users = list(UserProfile.objects.filter(email__startswith="delete"))
+        evaluation = baker.make(
+            Evaluation,
+            participants=[*deletable_users, UserProfile.objects.get(email="keep0@institution.example.com")],
+            voters=deletable_users[:1],
+            state=Evaluation.State.PUBLISHED,
+            _participant_count=3,
+            _voter_count=1,
+        )
+        evaluation.course.semester.archive()
+
+        self.assertTrue(bulk_update_users(None, user_file_content, test_run=False))
+
+        self.assertFalse(UserProfile.objects.filter(pk__in=[user.pk for user in deletable_users]).exists())
+        self.assertEqual(
+            EvaluationCounter.objects.values_list("participant_count", "voter_count").get(evaluation=evaluation), (1, 0)
+        )
+
+    def test_num_queries_is_constant(self):
+        def count_bulk_update_queries(user_count):
+            with transaction.atomic():
+                user_file_content = self.make_users_and_file(user_count)
+                with CaptureQueriesContext(connection) as context:
+                    self.assertTrue(bulk_update_users(None, user_file_content, test_run=False))
+                transaction.set_rollback(True)
+            return len(context.captured_queries)
+
+        self.assertEqual(count_bulk_update_queries(2), count_bulk_update_queries(20))
+
 
 class RemoveUserFromRepresentedAndCCingUsersTest(TestCase):
     def test_remove_user_from_represented_and_ccing_users(self):
@@ -243,6 +384,7 @@ class RemoveParticipationDueToInactivityTest(TestCase):
         messages = remove_participations_if_inactive(self.user)
 
         self.assertFalse(self.user.evaluations_participating_in.exists())
+        self.assertEqual(EvaluationCounter.objects.get(evaluation=self.evaluation).participant_count, 0)
         self.assertTrue(self.user.can_be_marked_inactive_by_manager)
         self.assertEqual(messages, [f"1 participation of {self.user.full_name} was removed due to inactivity."])
 
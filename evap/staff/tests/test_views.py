@@ -26,6 +26,7 @@ from evap.evaluation.models import (
     CourseType,
     EmailTemplate,
     Evaluation,
+    EvaluationCounter,
     ExamType,
     FaqQuestion,
     Infotext,
@@ -40,6 +41,7 @@ from evap.evaluation.models import (
     UserProfile,
     VoteTimestamp,
 )
+from evap.evaluation.models_logging import LOGENTRY_GROUPS_PER_PAGE
 from evap.evaluation.tests.tools import (
     FuzzyInt,
     TestCase,
@@ -60,10 +62,11 @@ from evap.staff.tests.utils import (
     helper_delete_all_import_files,
     helper_fill_infotext_formset,
     helper_set_dynamic_choices_field_value,
+    make_large_semester,
     run_in_staff_mode,
 )
 from evap.staff.tools import user_edit_link
-from evap.staff.views import get_evaluations_with_prefetched_data
+from evap.staff.views import SemesterStats, get_evaluations_with_prefetched_data, get_semester_stats
 from evap.student.models import TextAnswerWarning
 
 
@@ -345,6 +348,18 @@ class TestUserDeleteView(DeleteViewTestMixin, WebTestStaffMode):
     def get_post_params(cls):
         return {"user_id": cls.instance.pk}
 
+    def test_deletion_updates_live_counts(self):
+        evaluation = baker.make(
+            Evaluation, participants=[self.instance, baker.make(UserProfile)], voters=[self.instance]
+        )
+
+        with patch.object(*self.permission_method_to_patch, True):
+            self.app.post(self.url, user=self.user, params=self.post_params)
+
+        self.assertEqual(
+            EvaluationCounter.objects.values_list("participant_count", "voter_count").get(evaluation=evaluation), (1, 0)
+        )
+
 
 class TestUserMergeSelectionView(WebTestStaffMode):
     url = reverse("staff:user_merge_selection")
@@ -488,7 +503,7 @@ class TestUserBulkUpdateView(WebTestStaffMode):
 
     @override_settings(INSTITUTION_EMAIL_DOMAINS=["institution.example.com", "internal.example.com"])
     @override_settings(PARTICIPATION_DELETION_AFTER_INACTIVE_TIME=datetime.timedelta(6 * 30))
-    @patch("evap.staff.tools.remove_user_from_represented_and_ccing_users")
+    @patch("evap.staff.tools.remove_users_from_represented_and_ccing_users")
     def test_handles_users(self, mock_remove: MagicMock) -> None:
         mock_remove.return_value = ["This text is supposed to be visible on the website."]
         testuser1 = baker.make(UserProfile, email="testuser1@institution.example.com")
@@ -532,9 +547,12 @@ class TestUserBulkUpdateView(WebTestStaffMode):
 
         self.assertIn("testupdate@institution.example.com &gt; testupdate@internal.example.com", response)
         self.assertIn(mock_remove.return_value[0], response)
-        self.assertEqual(mock_remove.call_count, 3)
-        calls = [[call[0][0].email, call[0][2]] for call in mock_remove.call_args_list]
-        self.assertEqual(calls, [[testuser2.email, True], [contributor2.email, True], [responsible.email, True]])
+        mock_remove.assert_called_once()
+        self.assertEqual(
+            [user.email for user in mock_remove.call_args[0][0]],
+            [testuser2.email, contributor2.email, responsible.email],
+        )
+        self.assertTrue(mock_remove.call_args[0][2])
         mock_remove.reset_mock()
 
         form = response.forms["user-bulk-update-form"]
@@ -564,9 +582,12 @@ class TestUserBulkUpdateView(WebTestStaffMode):
         self.assertQuerySetEqual(UserProfile.objects.all(), expected_users, ordered=False)
 
         self.assertIn(mock_remove.return_value[0], response)
-        self.assertEqual(mock_remove.call_count, 3)
-        calls = [[call[0][0].email, call[0][2]] for call in mock_remove.call_args_list]
-        self.assertEqual(calls, [[testuser2.email, False], [contributor2.email, False], [responsible.email, False]])
+        mock_remove.assert_called_once()
+        self.assertEqual(
+            [user.email for user in mock_remove.call_args[0][0]],
+            [testuser2.email, contributor2.email, responsible.email],
+        )
+        self.assertFalse(mock_remove.call_args[0][2])
 
     @override_settings(DEBUG=False)
     def test_wrong_files_dont_crash(self) -> None:
@@ -808,6 +829,46 @@ class TestSemesterView(WebTestStaffMode):
         self.assertEqual(page.body.decode().count("textanswers_reviewed"), expected_count)
         self.assertEqual(page.body.decode().count("no_review"), 1)
 
+    def test_stats_match_evaluations(self):
+        semester = make_large_semester(num_courses=12)
+        evaluations = list(get_evaluations_with_prefetched_data(semester))
+
+        program_stats, total_stats = get_semester_stats(semester)
+
+        expected_programs = {program for evaluation in evaluations for program in evaluation.course.programs.all()}
+        self.assertEqual(list(program_stats), sorted(expected_programs, key=lambda program: program.order))
+        for program, stats in [*program_stats.items(), (None, total_stats)]:
+            with self.subTest(program=program):
+                program_evaluations = [
+                    evaluation
+                    for evaluation in evaluations
+                    if program is None or program in evaluation.course.programs.all()
+                ]
+                in_evaluation = [e for e in program_evaluations if e.state >= Evaluation.State.IN_EVALUATION]
+                not_new = [e for e in program_evaluations if e.state != Evaluation.State.NEW]
+                self.assertEqual(
+                    stats,
+                    SemesterStats(
+                        num_enrollments_in_evaluation=sum(e.num_participants for e in in_evaluation),
+                        num_votes=sum(e.num_voters for e in in_evaluation),
+                        num_evaluations_evaluated=sum(
+                            e.state >= Evaluation.State.EVALUATED for e in program_evaluations
+                        ),
+                        num_evaluations=len(not_new),
+                        num_textanswers=sum(e.num_textanswers for e in in_evaluation),
+                        num_textanswers_reviewed=sum(e.num_reviewed_textanswers for e in in_evaluation),
+                        first_start=min(e.vote_start_datetime for e in not_new),
+                        last_end=max(e.vote_end_date for e in not_new),
+                    ),
+                )
+
+    def test_stats_num_queries_is_independent_of_semester_size(self):
+        for num_courses in [3, 12]:
+            semester = make_large_semester(num_courses=num_courses)
+            # grouped aggregate, programs, total aggregate
+            with self.assertNumQueries(3):
+                get_semester_stats(semester)
+
 
 class TestGetEvaluationsWithPrefetchedData(TestCase):
     @staticmethod
@@ -2157,6 +2218,12 @@ class TestCourseEditView(WebTestStaffMode):
         self.course = Course.objects.get(pk=self.course.pk)
         self.assertEqual(self.course.name_en, "A different name")
 
+    def test_edit_course_is_logged(self):
+        self.prepare_form(name_en="A different name").submit("operation", value="save")
+        logentry = self.course.related_logentries().order_by("datetime", "id").last()
+        self.assertEqual(logentry.user, self.manager)
+        self.assertEqual(logentry.data["name_en"], {"change": ["Some name", "A different name"]})
+
     @patch("evap.staff.views.reverse")
     def test_operation_redirects(self, mock_reverse):
         mock_reverse.return_value = "/very_legit_url"
@@ -2176,6 +2243,38 @@ class TestCourseEditView(WebTestStaffMode):
         self.prepare_form(name_en="A different name").submit("operation", value="save", status=400)
 
 
+class TestCourseLogEntriesView(WebTestStaffMode):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = make_manager()
+        cls.course = baker.make(Course, name_en="Some name")
+        cls.other_course = baker.make(Course)
+        for i in range(LOGENTRY_GROUPS_PER_PAGE + 1):
+            course = Course.objects.get(pk=cls.course.pk)
+            course.name_en = f"Name {i}"
+            course.save()
+        cls.url = reverse("staff:course_logentries", args=[cls.course.pk])
+
+    def test_edit_page_shows_first_page(self):
+        latest_change = f"Name {LOGENTRY_GROUPS_PER_PAGE - 1} &#8594; Name {LOGENTRY_GROUPS_PER_PAGE}"
+        page = self.app.get(reverse("staff:course_edit", args=[self.course.pk]), user=self.manager)
+        self.assertIn(latest_change, page)
+        self.assertNotIn("Some name", page)
+
+        button = page.html.select_one(".load-older-logentries")
+        older = self.app.get(button["data-url"], user=self.manager)
+        self.assertIn("Some name", older)
+        self.assertNotIn(latest_change, older)
+        self.assertNotIn("load-older-logentries", older)
+
+    def test_invalid_before(self):
+        self.app.get(self.url, params={"before": "not a number"}, user=self.manager, status=400)
+        self.app.get(self.url, params={"before": 0}, user=self.manager, status=404)
+
+        other_logentry = self.other_course.related_logentries().first()
+        self.app.get(self.url, params={"before": other_logentry.pk}, user=self.manager, status=400)
+
+
 class TestCourseDeleteView(DeleteViewTestMixin, WebTestStaffMode):
     url = reverse("staff:course_delete")
     model_cls = Course
@@ -3895,7 +3994,8 @@ class TestEvaluationTextAnswersUpdatePublishView(WebTest):
         let_user_vote_for_evaluation(self.student2, self.evaluation, create_answers=True)
         self.evaluation.end_evaluation()
         self.evaluation.can_publish_text_results = True
-        self.evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluation.save()
         results = get_results(self.evaluation)
 
         textresult = next(
@@ -3907,7 +4007,8 @@ class TestEvaluationTextAnswersUpdatePublishView(WebTest):
         textanswer.review_decision = TextAnswer.ReviewDecision.PUBLIC
         textanswer.save()
         self.evaluation.end_review()
-        self.evaluation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluation.save()
         results = get_results(self.evaluation)
 
         textresult = next(
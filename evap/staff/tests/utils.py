@@ -1,6 +1,11 @@
 import time
 from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import cycle
 
+from model_bakery import baker
+
+from evap.evaluation.models import Course, Evaluation, Program, Semester, TextAnswer, UserProfile
 from evap.evaluation.tests.tools import WebTest, WebTestWith200Check
 from evap.staff.tools import ImportType, generate_import_path
 
@@ -63,3 +68,40 @@ def helper_fill_infotext_formset(formset, form_id, *, title_de="", title_en="",
     formset[f"form-{form_id}-title_en"] = title_en
     formset[f"form-{form_id}-content_de"] = content_de
     formset[f"form-{form_id}-content_en"] = content_en
+
+
+def make_large_semester(num_courses):
+    """
+    Creates a semester like the ones the staff works with all day: courses in several programs, with evaluations in
+    all states, participants, voters and text answers. Use it to check that views scale with the semester size.
+    """
+    semester = baker.make(Semester)
+    programs = baker.make(Program, order=iter(range(4)), _quantity=4)
+    users = baker.make(UserProfile, _quantity=10, _bulk_create=True)
+    states = cycle(Evaluation.State)
+    review_decisions = cycle(TextAnswer.ReviewDecision)
+
+    for index in range(num_courses):
+        course = baker.make(Course, semester=semester, programs=programs[index % 4 : index % 4 + 2])
+        for evaluation_index in range(2):
+            participants = users[: (index + evaluation_index) % len(users)]
+            evaluation = baker.make(
+                Evaluation,
+                course=course,
+                name_de=f"Evaluation {evaluation_index}",
+                name_en=f"Evaluation {evaluation_index}",
+                state=next(states),
+                vote_start_datetime=datetime(2000, 1, 1) + timedelta(days=index),
+                vote_end_date=date(2000, 2, 1) + timedelta(days=index),
+                can_publish_text_results=evaluation_index == 0,
+                participants=participants,
+                voters=participants[: len(participants) // 2],
+            )
+            baker.make(
+                TextAnswer,
+                contribution=evaluation.general_contribution,
+                review_decision=iter([next(review_decisions) for __ in range(3)]),
+                _quantity=3,
+                _bulk_create=True,
+            )
+    return semester
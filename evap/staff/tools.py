@@ -1,4 +1,5 @@
-from collections.abc import Iterable, Sequence
+from collections import defaultdict
+from collections.abc import Collection, Iterable, Sequence
 from datetime import date, datetime, timedelta
 from enum import Enum
 from pathlib import Path
@@ -9,7 +10,8 @@ from django.contrib import messages
 from django.contrib.auth.models import Group
 from django.core.exceptions import SuspiciousOperation
 from django.db import transaction
-from django.db.models import Count, Max, Model
+from django.db.models import Count, ManyToManyField, Max, Model, Q, QuerySet, Value
+from django.db.models.functions import Left, StrIndex
 from django.urls import reverse
 from django.utils.html import escape, format_html, format_html_join
 from django.utils.safestring import SafeString
@@ -17,10 +19,13 @@ from django.utils.translation import gettext_lazy as _
 from django.utils.translation import ngettext
 
 from evap.evaluation.models import Contribution, Course, Evaluation, TextAnswer, UserProfile
-from evap.evaluation.models_logging import LogEntry
-from evap.evaluation.tools import StrOrPromise, clean_email, is_external_email
+from evap.evaluation.models_logging import FieldActionType, LogEntry, LoggedModel
+from evap.evaluation.tools import StrOrPromise, clean_email, invalidate_start_pages, is_external_email
 from evap.grades.models import GradeDocument
-from evap.results.tools import STATES_WITH_RESULTS_CACHING, cache_results
+from evap.results.tools import STATES_WITH_RESULTS_CACHING, queue_results_cache_update
+from evap.results.views import delete_results_index_cache
+from evap.rewards.models import RewardPointProgress
+from evap.rewards.tools import recalculate_reward_point_balances
 
 if TYPE_CHECKING:
     from django.db.models.fields.related_descriptors import RelatedManager
@@ -85,61 +90,66 @@ def conditional_escape(s: str) -> SafeString:
     return escape(s)
 
 
-def find_matching_internal_user_for_email(request, email):
+def find_matching_internal_users_for_emails(emails: Iterable[str]) -> dict[str, list[UserProfile]]:
+    """Returns the internal users matching each of the emails, using a single query."""
     # for internal users only the part before the @ must be the same to match a user to an email
-    matching_users = [
-        user
-        for user in UserProfile.objects.filter(email__startswith=email.split("@")[0] + "@").order_by("id")
-        if not user.is_external
-    ]
-
-    if not matching_users:
-        return None
-
-    if len(matching_users) > 1:
-        raise UserProfile.MultipleObjectsReturned(matching_users)
-
-    return matching_users[0]
+    local_parts = {email: email.split("@")[0] + "@" for email in emails}
+    users_by_local_part: defaultdict[str, list[UserProfile]] = defaultdict(list)
+    for user in (
+        UserProfile.objects.annotate(email_local_part=Left("email", StrIndex("email", Value("@"))))
+        .filter(email_local_part__in=set(local_parts.values()))  # type: ignore[misc]  # the stubs expect a str here
+        .order_by("id")
+    ):
+        if not user.is_external:
+            users_by_local_part[user.email_local_part].append(user)
+    return {email: users_by_local_part[local_part] for email, local_part in local_parts.items()}
+
+
+def find_deletable_and_deactivatable_users(
+    users: QuerySet[UserProfile],
+) -> tuple[list[UserProfile], list[UserProfile]]:
+    """Returns the deletable users and the active users that can be marked inactive, using a single query."""
+    deletable_users: list[UserProfile] = []
+    users_to_mark_inactive: list[UserProfile] = []
+    for user in UserProfile.annotate_removability_by_manager(users):
+        if user.is_deletable_by_manager:  # type: ignore[attr-defined]  # annotated by annotate_removability_by_manager
+            deletable_users.append(user)
+        elif user.is_active and user.is_deactivatable_by_manager:  # type: ignore[attr-defined]
+            users_to_mark_inactive.append(user)
+    return deletable_users, users_to_mark_inactive
 
 
 def bulk_update_users(request, user_file_content, test_run):  # noqa: PLR0912
     # pylint: disable=too-many-locals
     # user_file must have one user per line in the format "{username},{email}"
     imported_emails = {clean_email(line.decode().split(",")[1]) for line in user_file_content.splitlines()}
+    internal_emails = {email for email in imported_emails if not is_external_email(email)}
+    skipped_external_emails_counter = len(imported_emails) - len(internal_emails)
 
     emails_of_users_to_be_created = []
     users_to_be_updated = []
-    skipped_external_emails_counter = 0
 
-    for imported_email in imported_emails:
-        if is_external_email(imported_email):
-            skipped_external_emails_counter += 1
-            continue
-        try:
-            matching_user = find_matching_internal_user_for_email(request, imported_email)
-        except UserProfile.MultipleObjectsReturned as e:
+    for imported_email, matching_users in find_matching_internal_users_for_emails(internal_emails).items():
+        if len(matching_users) > 1:
             messages.error(
                 request,
                 format_html(
                     _("Multiple users match the email {}:{}"),
                     imported_email,
-                    create_user_list_html_string_for_message(e.args[0]),
+                    create_user_list_html_string_for_message(matching_users),
                 ),
             )
             return False
 
-        if not matching_user:
+        if not matching_users:
             emails_of_users_to_be_created.append(imported_email)
-        elif matching_user.email != imported_email:
-            users_to_be_updated.append((matching_user, imported_email))
+        elif matching_users[0].email != imported_email:
+            users_to_be_updated.append((matching_users[0], imported_email))
 
     emails_of_non_obsolete_users = set(imported_emails) | {user.email for user, _ in users_to_be_updated}
-    deletable_users, users_to_mark_inactive = [], []
-    for user in UserProfile.objects.exclude(email__in=emails_of_non_obsolete_users):
-        if user.can_be_deleted_by_manager:
-            deletable_users.append(user)
-        elif user.is_active and user.can_be_marked_inactive_by_manager:
-            users_to_mark_inactive.append(user)
+    deletable_users, users_to_mark_inactive = find_deletable_and_deactivatable_users(
+        UserProfile.objects.exclude(email__in=emails_of_non_obsolete_users)
+    )
 
     messages.info(
         request,
@@ -148,7 +158,7 @@ def bulk_update_users(request, user_file_content, test_run):  # noqa: PLR0912
             "{} users are currently in the database. Of those, {} will be updated, {} will be deleted and {} will be "
             "marked inactive. {} new users will be created."
         ).format(
-            len(imported_emails) - skipped_external_emails_counter,
+            len(internal_emails),
             skipped_external_emails_counter,
             UserProfile.objects.count(),
             len(users_to_be_updated),
@@ -192,26 +202,20 @@ def bulk_update_users(request, user_file_content, test_run):  # noqa: PLR0912
         )
 
     with transaction.atomic():
-        for user in deletable_users + users_to_mark_inactive:
-            for message in remove_user_from_represented_and_ccing_users(
-                user, deletable_users + users_to_mark_inactive, test_run
-            ):
-                messages.warning(request, message)
-        for user in users_to_mark_inactive:
-            for message in remove_participations_if_inactive(user, test_run):
-                messages.warning(request, message)
+        obsolete_users = deletable_users + users_to_mark_inactive
+        for message in remove_users_from_represented_and_ccing_users(obsolete_users, obsolete_users, test_run):
+            messages.warning(request, message)
+        for message in remove_inactive_participations(users_to_mark_inactive, test_run):
+            messages.warning(request, message)
         if test_run:
             messages.info(request, _("No data was changed in this test run."))
         else:
-            for user in deletable_users:
-                user.delete()
-            for user in users_to_mark_inactive:
-                user.is_active = False
-                user.save()
+            UserProfile.objects.filter(pk__in=[user.pk for user in deletable_users]).delete()
+            UserProfile.objects.filter(pk__in=[user.pk for user in users_to_mark_inactive]).update(is_active=False)
 
             for user, email in users_to_be_updated:
                 user.email = email
-                user.save()
+            UserProfile.objects.bulk_update([user for user, __ in users_to_be_updated], ["email"])
             userprofiles_to_create = [UserProfile(email=email) for email in emails_of_users_to_be_created]
 
             UserProfile.objects.bulk_create(userprofiles_to_create)
@@ -220,6 +224,39 @@ def bulk_update_users(request, user_file_content, test_run):  # noqa: PLR0912
     return True
 
 
+# relations that merge_users moves with reassign_m2m_rows or bulk updates instead of setting them on main_user
+REASSIGNED_USER_RELATIONS = {
+    "courses_responsible_for",
+    "contributions",
+    "evaluations_participating_in",
+    "evaluations_voted_for",
+}
+
+
+def reassign_m2m_rows(model: type[LoggedModel], field_name: str, other_user, main_user) -> None:
+    """
+    Move the rows of the m2m field `field_name` of `model` from other_user to main_user with a single UPDATE and log
+    the change for the affected instances. No instance may be related to both users.
+    """
+    field = model._meta.get_field(field_name)
+    assert isinstance(field, ManyToManyField)
+    user_field_name = field.m2m_reverse_field_name()
+
+    instances = [
+        instance
+        for instance in model._default_manager.filter(**{field_name: other_user})
+        if field_name not in instance.unlogged_fields
+    ]
+    getattr(model, field_name).through.objects.filter(**{user_field_name: other_user}).update(
+        **{user_field_name: main_user}
+    )
+
+    for instance in instances:
+        instance.log_m2m_change(field_name, FieldActionType.M2M_REMOVE, [other_user.pk], store_in_db=False)
+        instance.log_m2m_change(field_name, FieldActionType.M2M_ADD, [main_user.pk], store_in_db=False)
+    LoggedModel.store_logentries(instances)
+
+
 @transaction.atomic
 def merge_users(  # noqa: PLR0915  # This is much stuff to do. However, splitting it up into subtasks doesn't make much sense.
     main_user, other_user, preview=False
@@ -245,25 +282,17 @@ def merge_users(  # noqa: PLR0915  # This is much stuff to do. However, splittin
 
     errors = []
     warnings = []
-    courses_main_user_is_responsible_for = main_user.get_sorted_courses_responsible_for()
-    if any(
-        course in courses_main_user_is_responsible_for for course in other_user.get_sorted_courses_responsible_for()
-    ):
+    if Course.objects.filter(responsibles=main_user).filter(responsibles=other_user).exists():
         errors.append("courses_responsible_for")
-    if any(
-        contribution.evaluation in [contribution.evaluation for contribution in main_user.get_sorted_contributions()]
-        for contribution in other_user.get_sorted_contributions()
+    if (
+        Evaluation.objects.filter(contributions__contributor=main_user)
+        .filter(contributions__contributor=other_user)
+        .exists()
     ):
         errors.append("contributions")
-    if any(
-        evaluation in main_user.get_sorted_evaluations_participating_in()
-        for evaluation in other_user.get_sorted_evaluations_participating_in()
-    ):
+    if Evaluation.objects.filter(participants=main_user).filter(participants=other_user).exists():
         errors.append("evaluations_participating_in")
-    if any(
-        evaluation in main_user.get_sorted_evaluations_voted_for()
-        for evaluation in other_user.get_sorted_evaluations_voted_for()
-    ):
+    if Evaluation.objects.filter(voters=main_user).filter(voters=other_user).exists():
         errors.append("evaluations_voted_for")
 
     if main_user.reward_point_grantings.all().exists() and other_user.reward_point_grantings.all().exists():
@@ -292,12 +321,11 @@ def merge_users(  # noqa: PLR0915  # This is much stuff to do. However, splittin
     if preview or errors:
         return merged_user, errors, warnings
 
-    # update responsibility
-    for course in Course.objects.filter(responsibles__in=[other_user]):
-        responsibles = list(course.responsibles.all())
-        responsibles.remove(other_user)
-        responsibles.append(main_user)
-        course.responsibles.set(responsibles)
+    # there are no conflicts, so the relations of other_user can be moved to main_user directly
+    reassign_m2m_rows(Course, "responsibles", other_user, main_user)
+    reassign_m2m_rows(Evaluation, "participants", other_user, main_user)
+    reassign_m2m_rows(Evaluation, "voters", other_user, main_user)
+    Contribution.objects.filter(contributor=other_user).update(contributor=main_user)
 
     GradeDocument.objects.filter(last_modified_user=other_user).update(last_modified_user=main_user)
 
@@ -307,6 +335,8 @@ def merge_users(  # noqa: PLR0915  # This is much stuff to do. However, splittin
 
     # update values for main user
     for key, value in merged_user.items():
+        if key in REASSIGNED_USER_RELATIONS:
+            continue
         attr = getattr(main_user, key)
         if hasattr(attr, "set"):
             attr.set(value)  # use the 'set' method for e.g. many-to-many relations
@@ -317,16 +347,30 @@ def merge_users(  # noqa: PLR0915  # This is much stuff to do. However, splittin
     # delete rewards
     other_user.reward_point_grantings.all().delete()
     other_user.reward_point_redemptions.all().delete()
+    # the reassignments above bypass the balance and progress signal handlers
+    recalculate_reward_point_balances([main_user.pk])
+    RewardPointProgress.objects.filter(user_profile=main_user).delete()
 
     # update logs
     LogEntry.objects.filter(user=other_user).update(user=main_user)
 
-    # refresh results cache
-    evaluations = Evaluation.objects.filter(
-        contributions__contributor=main_user, state__in=STATES_WITH_RESULTS_CACHING
-    ).distinct()
-    for evaluation in evaluations:
-        cache_results(evaluation)
+    # refresh results cache, this happens after the transaction commits
+    queue_results_cache_update(
+        Evaluation.objects.filter(
+            contributions__contributor=main_user, state__in=STATES_WITH_RESULTS_CACHING
+        ).distinct()
+    )
+
+    # the reassignments above bypass the signal handlers that keep the results index up to date
+    delete_results_index_cache(
+        Course.objects.filter(Q(responsibles=main_user) | Q(evaluations__contributions__contributor=main_user))
+        .values_list("semester", flat=True)
+        .distinct()
+    )
+
+    # the same goes for the start pages. Contributions and responsibilities also show up on the start pages of
+    # delegates, so all users are affected
+    invalidate_start_pages()
 
     # delete other_user
     other_user.delete()
@@ -358,56 +402,129 @@ def find_unreviewed_evaluations(semester, excluded):
 
 
 def remove_user_from_represented_and_ccing_users(user, ignored_users=None, test_run=False):
-    remove_messages = []
-    ignored_users = ignored_users or []
-    for represented_user in user.represented_users.exclude(id__in=[user.id for user in ignored_users]):
+    return remove_users_from_represented_and_ccing_users([user], ignored_users or [], test_run)
+
+
+def remove_users_from_represented_and_ccing_users(
+    users: Collection[UserProfile], ignored_users: Iterable[UserProfile] = (), test_run=False
+) -> list[StrOrPromise]:
+    remove_messages: list[StrOrPromise] = []
+    ignored_user_ids = [user.id for user in ignored_users]
+    # from_userprofile is the user whose delegates or CC users contain to_userprofile
+    delegations = (
+        UserProfile.delegates.through.objects.filter(to_userprofile__in=users)
+        .exclude(from_userprofile__in=ignored_user_ids)
+        .select_related("from_userprofile", "to_userprofile")
+        .order_by("to_userprofile", "from_userprofile")
+    )
+    cc_relations = (
+        UserProfile.cc_users.through.objects.filter(to_userprofile__in=users)
+        .exclude(from_userprofile__in=ignored_user_ids)
+        .select_related("from_userprofile", "to_userprofile")
+        .order_by("to_userprofile", "from_userprofile")
+    )
+
+    affected_user_ids = set()
+    for delegation in delegations:
+        user, represented_user = delegation.to_userprofile, delegation.from_userprofile
+        affected_user_ids |= {user.pk, represented_user.pk}
         if test_run:
             remove_messages.append(
                 _("{} will be removed from the delegates of {}.").format(user.full_name, represented_user.full_name)
             )
         else:
-            represented_user.delegates.remove(user)
             remove_messages.append(
                 _("Removed {} from the delegates of {}.").format(user.full_name, represented_user.full_name)
             )
-    for cc_user in user.ccing_users.exclude(id__in=[user.id for user in ignored_users]):
+    for cc_relation in cc_relations:
+        user, cc_user = cc_relation.to_userprofile, cc_relation.from_userprofile
         if test_run:
             remove_messages.append(
                 _("{} will be removed from the CC users of {}.").format(user.full_name, cc_user.full_name)
             )
         else:
-            cc_user.cc_users.remove(user)
             remove_messages.append(_("Removed {} from the CC users of {}.").format(user.full_name, cc_user.full_name))
+
+    if not test_run:
+        delegations.delete()
+        cc_relations.delete()
+        # deleting the through rows directly skips the m2m_changed handlers
+        invalidate_start_pages(affected_user_ids)
     return remove_messages
 
 
 def remove_participations_if_inactive(user: UserProfile, test_run=False) -> list[StrOrPromise]:
     if user.is_active and not user.can_be_marked_inactive_by_manager:
         return []
-    last_participation = user.evaluations_participating_in.aggregate(Max("vote_end_date"))["vote_end_date__max"]
-    if (
-        last_participation is None
-        or (date.today() - last_participation) < settings.PARTICIPATION_DELETION_AFTER_INACTIVE_TIME
-    ):
-        return []
+    return remove_inactive_participations([user], test_run)
+
+
+def remove_inactive_participations(users: Collection[UserProfile], test_run=False) -> list[StrOrPromise]:
+    """
+    Bulk version of remove_participations_if_inactive for users that are inactive or can be marked inactive, using a
+    constant number of queries.
+    """
+    participations = Evaluation.participants.through.objects.filter(userprofile__in=users)
+    last_allowed_participation = date.today() - settings.PARTICIPATION_DELETION_AFTER_INACTIVE_TIME
+    evaluation_counts = {
+        row["userprofile"]: row["count"]
+        for row in participations.values("userprofile").annotate(
+            last_participation=Max("evaluation__vote_end_date"), count=Count("pk")
+        )
+        if row["last_participation"] <= last_allowed_participation
+    }
+
+    remove_messages: list[StrOrPromise] = []
+    for user in users:
+        if user.pk not in evaluation_counts:
+            continue
+        evaluation_count = evaluation_counts[user.pk]
+        if test_run:
+            remove_messages.append(
+                ngettext(
+                    "{} participation of {} would be removed due to inactivity.",
+                    "{} participations of {} would be removed due to inactivity.",
+                    evaluation_count,
+                ).format(evaluation_count, user.full_name)
+            )
+        else:
+            remove_messages.append(
+                ngettext(
+                    "{} participation of {} was removed due to inactivity.",
+                    "{} participations of {} were removed due to inactivity.",
+                    evaluation_count,
+                ).format(evaluation_count, user.full_name)
+            )
 
-    evaluation_count = user.evaluations_participating_in.count()
-    if test_run:
-        return [
-            ngettext(
-                "{} participation of {} would be removed due to inactivity.",
-                "{} participations of {} would be removed due to inactivity.",
-                evaluation_count,
-            ).format(evaluation_count, user.full_name)
-        ]
-    user.evaluations_participating_in.clear()
-    return [
-        ngettext(
-            "{} participation of {} was removed due to inactivity.",
-            "{} participations of {} were removed due to inactivity.",
-            evaluation_count,
-        ).format(evaluation_count, user.full_name)
+    if test_run or not evaluation_counts:
+        return remove_messages
+
+    # deleting the through rows directly skips the m2m_changed handlers, so log and update the counts and progresses here
+    participations = participations.filter(userprofile__in=evaluation_counts)
+    removed_user_ids_by_evaluation_id = defaultdict(list)
+    for evaluation_id, user_id in participations.values_list("evaluation", "userprofile"):
+        removed_user_ids_by_evaluation_id[evaluation_id].append(user_id)
+    evaluations = [
+        evaluation
+        for evaluation in Evaluation.objects.filter(pk__in=removed_user_ids_by_evaluation_id)
+        if "participants" not in evaluation.unlogged_fields
     ]
+    for evaluation in evaluations:
+        evaluation.log_m2m_change(
+            "participants",
+            FieldActionType.M2M_REMOVE,
+            removed_user_ids_by_evaluation_id[evaluation.pk],
+            store_in_db=False,
+        )
+    LoggedModel.store_logentries(evaluations)
+    participations.delete()
+    invalidate_start_pages(evaluation_counts)
+    Evaluation.add_to_live_counts(
+        "participants",
+        {evaluation_id: -len(user_ids) for evaluation_id, user_ids in removed_user_ids_by_evaluation_id.items()},
+    )
+    RewardPointProgress.objects.filter(user_profile__in=evaluation_counts).delete()
+    return remove_messages
 
 
 def user_edit_link(user_id):
@@ -418,26 +535,6 @@ def user_edit_link(user_id):
     )
 
 
-def update_or_create_with_changes[M: Model](
-    model: type[M],
-    defaults=None,
-    **kwargs,
-) -> tuple[M, bool, dict[str, tuple[Any, Any]]]:
-    """Do update_or_create and track changed values."""
-
-    if not defaults:
-        defaults = {}
-
-    obj, created = model._default_manager.get_or_create(**kwargs, defaults=defaults)
-
-    if created:
-        return obj, True, {}
-
-    changes = update_with_changes(obj, defaults)
-
-    return obj, False, changes
-
-
 def update_with_changes(obj: Model, defaults: dict[str, Any], dry_run: bool = False) -> dict[str, tuple[Any, Any]]:
     """Update a model instance and track changed values."""
 
@@ -31,6 +31,7 @@ urlpatterns = [
     path("course/<int:course_id>/evaluation/create", views.evaluation_create_for_course, name="evaluation_create_for_course"),
     path("evaluation/delete", views.evaluation_delete, name="evaluation_delete"),
     path("evaluation/<int:evaluation_id>/edit", views.evaluation_edit, name="evaluation_edit"),
+    path("evaluation/<int:evaluation_id>/logentries", views.evaluation_logentries, name="evaluation_logentries"),
     path("evaluation/<int:evaluation_id>/copy", views.evaluation_copy, name="evaluation_copy"),
     path("evaluation/<int:evaluation_id>/email", views.evaluation_email, name="evaluation_email"),
     path("evaluation/<int:evaluation_id>/preview", views.evaluation_preview, name="evaluation_preview"),
@@ -42,6 +43,7 @@ urlpatterns = [
     path("semester/<int:semester_id>/course/create", views.course_create, name="course_create"),
     path("course/delete", views.course_delete, name="course_delete"),
     path("course/<int:course_id>/edit", views.CourseEditView.as_view(), name="course_edit"),
+    path("course/<int:course_id>/logentries", views.course_logentries, name="course_logentries"),
     path("course/<int:course_id>/copy", views.course_copy, name="course_copy"),
 
     path("evaluation/<int:evaluation_id>/textanswers", views.evaluation_textanswers, name="evaluation_textanswers"),
@@ -1,7 +1,7 @@
 import csv
 import itertools
 import logging
-from collections import OrderedDict, defaultdict, namedtuple
+from collections import defaultdict, namedtuple
 from collections.abc import Collection
 from dataclasses import dataclass
 from datetime import date, datetime
@@ -21,12 +21,15 @@ from django.db.models import (
     ExpressionWrapper,
     Func,
     IntegerField,
+    Max,
+    Min,
     OuterRef,
     Prefetch,
     Q,
     Sum,
     When,
 )
+from django.db.models.functions import Coalesce
 from django.forms import BaseForm, formset_factory
 from django.forms.models import inlineformset_factory, modelformset_factory
 from django.http import Http404, HttpRequest, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
@@ -62,12 +65,14 @@ from evap.evaluation.models import (
     UserProfile,
     VoteTimestamp,
 )
+from evap.evaluation.models_logging import LogEntry, LoggedModel
 from evap.evaluation.tools import (
     AttachmentResponse,
     FormsetView,
     HttpResponseNoContent,
     SaveValidFormMixin,
     StrOrPromise,
+    count_subquery,
     get_bool_parameter_from_url_or_session,
     get_object_from_dict_pk_entry_or_logged_40x,
     get_string_parameter_from_url_or_session,
@@ -155,20 +160,30 @@ def index(request):
 
 
 def annotate_evaluations_with_grade_document_counts(evaluations):
+    grade_documents = GradeDocument.objects.filter(course=OuterRef("course"))
     return evaluations.annotate(
-        midterm_grade_documents_count=Count(
-            "course__grade_documents",
-            filter=Q(course__grade_documents__type=GradeDocument.Type.MIDTERM_GRADES),
-            distinct=True,
+        midterm_grade_documents_count=count_subquery(
+            grade_documents.filter(type=GradeDocument.Type.MIDTERM_GRADES), "course"
         ),
-        final_grade_documents_count=Count(
-            "course__grade_documents",
-            filter=Q(course__grade_documents__type=GradeDocument.Type.FINAL_GRADES),
-            distinct=True,
+        final_grade_documents_count=count_subquery(
+            grade_documents.filter(type=GradeDocument.Type.FINAL_GRADES), "course"
         ),
     )
 
 
+def get_textanswer_counts():
+    """Subqueries counting the text answers of an evaluation, by annotation name."""
+    textanswers = TextAnswer.objects.filter(contribution__evaluation=OuterRef("pk"))
+    return {
+        "num_textanswers": count_subquery(
+            textanswers.filter(contribution__evaluation__can_publish_text_results=True), "contribution__evaluation"
+        ),
+        "num_reviewed_textanswers": count_subquery(
+            textanswers.exclude(review_decision=TextAnswer.ReviewDecision.UNDECIDED), "contribution__evaluation"
+        ),
+    }
+
+
 def get_evaluations_with_prefetched_data(semester):
     evaluations = (
         semester.evaluations.select_related("course__type")
@@ -183,24 +198,67 @@ def get_evaluations_with_prefetched_data(semester):
             "cms_evaluation_links",
         )
         .annotate(
-            num_contributors=Count("contributions", filter=~Q(contributions__contributor=None), distinct=True),
-            num_textanswers=Count(
-                "contributions__textanswer_set",
-                filter=Q(contributions__evaluation__can_publish_text_results=True),
-                distinct=True,
-            ),
-            num_reviewed_textanswers=Count(
-                "contributions__textanswer_set",
-                filter=~Q(contributions__textanswer_set__review_decision=TextAnswer.ReviewDecision.UNDECIDED),
-                distinct=True,
+            num_contributors=count_subquery(
+                Contribution.objects.filter(evaluation=OuterRef("pk")).exclude(contributor=None), "evaluation"
             ),
-            num_course_evaluations=Count("course__evaluations", distinct=True),
+            num_course_evaluations=count_subquery(Evaluation.objects.filter(course=OuterRef("course")), "course"),
+            **get_textanswer_counts(),
         )
     ).order_by("pk")
     evaluations = annotate_evaluations_with_grade_document_counts(evaluations)
     return Evaluation.annotate_with_participant_and_voter_counts(evaluations)
 
 
+@dataclass
+class SemesterStats:
+    # pylint: disable=too-many-instance-attributes
+    num_enrollments_in_evaluation: int = 0
+    num_votes: int = 0
+    num_evaluations_evaluated: int = 0
+    num_evaluations: int = 0
+    num_textanswers: int = 0
+    num_textanswers_reviewed: int = 0
+    first_start: datetime = datetime(9999, 1, 1)
+    last_end: date = date(2000, 1, 1)
+
+
+def get_semester_stats(semester) -> tuple[dict[Program, SemesterStats], SemesterStats]:
+    """Returns the statistics of the semester per program, ordered like the programs, and of the whole semester."""
+    textanswer_counts = get_textanswer_counts()
+    in_evaluation = Q(state__gte=Evaluation.State.IN_EVALUATION)
+    not_new = ~Q(state=Evaluation.State.NEW)
+    aggregates = {
+        "num_enrollments_in_evaluation": Coalesce(Sum("num_participants", filter=in_evaluation), 0),
+        "num_votes": Coalesce(Sum("num_voters", filter=in_evaluation), 0),
+        "num_evaluations_evaluated": Count("pk", filter=Q(state__gte=Evaluation.State.EVALUATED)),
+        "num_evaluations": Count("pk", filter=not_new),
+        "num_textanswers": Coalesce(Sum(textanswer_counts["num_textanswers"], filter=in_evaluation), 0),
+        "num_textanswers_reviewed": Coalesce(
+            Sum(textanswer_counts["num_reviewed_textanswers"], filter=in_evaluation), 0
+        ),
+        "first_start": Min("vote_start_datetime", filter=not_new),
+        "last_end": Max("vote_end_date", filter=not_new),
+    }
+    evaluations = Evaluation.annotate_with_participant_and_voter_counts(semester.evaluations.order_by())
+
+    def make_stats(values):
+        # first_start and last_end are None without evaluations, they keep their defaults then
+        return SemesterStats(
+            **{name: value for name, value in values.items() if name in aggregates and value is not None}
+        )
+
+    # an evaluation counts towards each program of its course
+    stats_per_program_id = {
+        values["course__programs"]: make_stats(values)
+        for values in evaluations.filter(course__programs__isnull=False)
+        .values("course__programs")
+        .annotate(**aggregates)
+    }
+    programs = Program.objects.filter(pk__in=stats_per_program_id.keys()).order_by("order")
+    program_stats = {program: stats_per_program_id[program.pk] for program in programs}
+    return program_stats, make_stats(evaluations.aggregate(**aggregates))
+
+
 @reviewer_required
 def semester_view(request, semester_id) -> HttpResponse:
     semester = get_object_or_404(Semester, id=semester_id)
@@ -210,44 +268,18 @@ def semester_view(request, semester_id) -> HttpResponse:
 
     evaluations = get_evaluations_with_prefetched_data(semester)
     evaluations = sorted(evaluations, key=lambda cr: cr.full_name)
-    courses = Course.objects.filter(semester=semester).prefetch_related(
-        "type", "programs", "responsibles", "evaluations", "ignored_evaluations", "cms_course_links"
+    courses = (
+        Course.objects.filter(semester=semester)
+        .select_related("type")
+        .prefetch_related("programs", "responsibles", "cms_course_links")
+        .annotate(
+            num_evaluations=count_subquery(Evaluation.objects.filter(course=OuterRef("pk")), "course"),
+            num_ignored_evaluations=count_subquery(IgnoredEvaluation.objects.filter(course=OuterRef("pk")), "course"),
+        )
     )
 
-    # semester statistics (per program)
-    @dataclass
-    class Stats:
-        # pylint: disable=too-many-instance-attributes
-        num_enrollments_in_evaluation: int = 0
-        num_votes: int = 0
-        num_evaluations_evaluated: int = 0
-        num_evaluations: int = 0
-        num_textanswers: int = 0
-        num_textanswers_reviewed: int = 0
-        first_start: datetime = datetime(9999, 1, 1)
-        last_end: date = date(2000, 1, 1)
-
-    program_stats: dict[Program, Stats] = defaultdict(Stats)
-    total_stats = Stats()
-    for evaluation in evaluations:
-        programs = evaluation.course.programs.all()
-        stats_objects = [program_stats[program] for program in programs]
-        stats_objects += [total_stats]
-        for stats in stats_objects:
-            if evaluation.state >= Evaluation.State.IN_EVALUATION:
-                stats.num_enrollments_in_evaluation += evaluation.num_participants
-                stats.num_votes += evaluation.num_voters
-                stats.num_textanswers += evaluation.num_textanswers
-                stats.num_textanswers_reviewed += evaluation.num_reviewed_textanswers
-            if evaluation.state >= Evaluation.State.EVALUATED:
-                stats.num_evaluations_evaluated += 1
-            if evaluation.state != Evaluation.State.NEW:
-                stats.num_evaluations += 1
-                stats.first_start = min(stats.first_start, evaluation.vote_start_datetime)
-                stats.last_end = max(stats.last_end, evaluation.vote_end_date)
-    program_stats = OrderedDict(sorted(program_stats.items(), key=lambda x: x[0].order))
-
-    program_stats_with_total = cast("dict[Program | str, Stats]", program_stats)
+    program_stats, total_stats = get_semester_stats(semester)
+    program_stats_with_total = cast("dict[Program | str, SemesterStats]", program_stats)
     program_stats_with_total["total"] = total_stats
 
     template_data = {
@@ -322,9 +354,10 @@ class ResetToNewOperation(EvaluationOperation):
         assert email_template_contributor is None
         assert email_template_participant is None
 
-        for evaluation in evaluations:
-            evaluation.reset_to_new(delete_previous_answers=bool(delete_previous_answers))
-            evaluation.save()
+        with transaction.atomic():
+            for evaluation in evaluations:
+                evaluation.reset_to_new(delete_previous_answers=bool(delete_previous_answers))
+                evaluation.save()
         messages.success(
             request,
             ngettext(
@@ -364,9 +397,10 @@ class ReadyForEditorsOperation(EvaluationOperation):
         assert email_template_participant is None
         assert delete_previous_answers is None
 
-        for evaluation in evaluations:
-            evaluation.ready_for_editors()
-            evaluation.save()
+        with transaction.atomic():
+            for evaluation in evaluations:
+                evaluation.ready_for_editors()
+                evaluation.save()
         messages.success(
             request,
             ngettext(
@@ -428,10 +462,11 @@ class BeginEvaluationOperation(EvaluationOperation):
         assert email_template_participant is None
         assert delete_previous_answers is None
 
-        for evaluation in evaluations:
-            evaluation.vote_start_datetime = datetime.now()
-            evaluation.begin_evaluation()
-            evaluation.save()
+        with transaction.atomic():
+            for evaluation in evaluations:
+                evaluation.vote_start_datetime = datetime.now()
+                evaluation.begin_evaluation()
+                evaluation.save()
         messages.success(
             request,
             ngettext(
@@ -472,9 +507,10 @@ class UnpublishOperation(EvaluationOperation):
         assert email_template_participant is None
         assert delete_previous_answers is None
 
-        for evaluation in evaluations:
-            evaluation.unpublish()
-            evaluation.save()
+        with transaction.atomic():
+            for evaluation in evaluations:
+                evaluation.unpublish()
+                evaluation.save()
         messages.success(
             request,
             ngettext(
@@ -512,9 +548,10 @@ class PublishOperation(EvaluationOperation):
         assert email_template is None
         assert delete_previous_answers is None
 
-        for evaluation in evaluations:
-            evaluation.publish()
-            evaluation.save()
+        with transaction.atomic():
+            for evaluation in evaluations:
+                evaluation.publish()
+                evaluation.save()
         messages.success(
             request,
             ngettext(
@@ -1289,6 +1326,29 @@ def evaluation_copy(request, evaluation_id):
     )
 
 
+def render_logentry_page(request, logged_object: LoggedModel, logentries_url: str) -> HttpResponse:
+    before = None
+    if "before" in request.GET:
+        before = get_object_from_dict_pk_entry_or_logged_40x(LogEntry, request.GET, "before")
+        if not logged_object.related_logentries().filter(pk=before.pk).exists():
+            raise SuspiciousOperation("Logentry does not belong to the logged object.")
+
+    page = logged_object.grouped_logentries(before)
+    return render(request, "log/logentry_groups.html", {"page": page, "logentries_url": logentries_url})
+
+
+@manager_required
+def course_logentries(request, course_id):
+    course = get_object_or_404(Course, id=course_id)
+    return render_logentry_page(request, course, reverse("staff:course_logentries", args=[course.id]))
+
+
+@manager_required
+def evaluation_logentries(request, evaluation_id):
+    evaluation = get_object_or_404(Evaluation, id=evaluation_id)
+    return render_logentry_page(request, evaluation, reverse("staff:evaluation_logentries", args=[evaluation.id]))
+
+
 @manager_required
 def evaluation_edit(request, evaluation_id):
     evaluation = get_object_or_404(Evaluation, id=evaluation_id)
@@ -1,6 +1,10 @@
+import copy
+from functools import lru_cache
+
 from django import forms
 
-from evap.evaluation.models import CHOICES, Question
+from evap.evaluation.models import CHOICES, Question, QuestionAssignment, Questionnaire
+from evap.evaluation.tools import is_prefetched
 from evap.student.tools import answer_field_id
 
 
@@ -27,6 +31,10 @@ class TextAnswerField(forms.CharField):
     def from_question(cls, question: Question):
         return cls(label=question.text)
 
+    def relate_to(self, identifier: str) -> None:
+        self.related_answer_field_id = identifier
+        self.widget.attrs["related_answer_field_id"] = identifier
+
 
 class RatingAnswerField(forms.TypedChoiceField):
     def __init__(self, widget_choices, *args, allows_textanswer=False, **kwargs):
@@ -50,6 +58,44 @@ class RatingAnswerField(forms.TypedChoiceField):
         )
 
 
+# the question data the voting form fields are built from, so any change to the questions yields a new schema
+QuestionSchemaKey = tuple[int, str, bool]
+VotingFormFieldSchema = tuple[tuple[forms.Field, TextAnswerField | None], ...]
+
+
+def question_assignments_with_questions(questionnaire: Questionnaire) -> list[QuestionAssignment]:
+    assignments = questionnaire.question_assignments.all()
+    if not is_prefetched(questionnaire, "question_assignments"):
+        assignments = assignments.select_related("question")
+    return list(assignments)
+
+
+@lru_cache(maxsize=1024)
+def voting_form_field_schema(question_keys: tuple[QuestionSchemaKey, ...]) -> VotingFormFieldSchema:
+    """
+    Builds the fields of a questionnaire's voting form once per process and questionnaire version. The fields are
+    prototypes that must be copied before use, so that forms do not share state.
+    """
+    schema: list[tuple[forms.Field, TextAnswerField | None]] = []
+    for question_type, text, allows_additional_textanswers in question_keys:
+        question = Question(type=question_type, text_en=text, text_de=text)
+        question.allows_additional_textanswers = allows_additional_textanswers
+        field: forms.Field
+        if question.is_text_question:
+            field = TextAnswerField.from_question(question)
+        elif question.is_rating_question:
+            field = RatingAnswerField.from_question(question)
+        else:
+            assert question.is_heading_question
+            field = HeadingField.from_question(question)
+
+        textanswer_field = None
+        if question.is_rating_question and question.allows_additional_textanswers:
+            textanswer_field = TextAnswerField(label=question.text)
+        schema.append((field, textanswer_field))
+    return tuple(schema)
+
+
 class QuestionnaireVotingForm(forms.Form):
     """Dynamic form class that adds required fields per question.
 
@@ -59,21 +105,19 @@ class QuestionnaireVotingForm(forms.Form):
         super().__init__(*args, **kwargs)
         self.questionnaire = questionnaire
 
-        for question in self.questionnaire.questions.all():
-            if question.is_text_question:
-                field = TextAnswerField.from_question(question)
-            elif question.is_rating_question:
-                field = RatingAnswerField.from_question(question)
-            else:
-                assert question.is_heading_question
-                field = HeadingField.from_question(question)
+        questions = [assignment.question for assignment in question_assignments_with_questions(questionnaire)]
+        schema = voting_form_field_schema(
+            tuple((question.type, question.text, question.allows_additional_textanswers) for question in questions)
+        )
 
+        for question, (field, textanswer_field) in zip(questions, schema, strict=True):
             identifier = answer_field_id(contribution, questionnaire, question)
-            self.fields[identifier] = field
+            self.fields[identifier] = copy.deepcopy(field)
 
-            if question.is_rating_question and question.allows_additional_textanswers:
-                textanswer_field = TextAnswerField(label=question.text, related_answer_field_id=identifier)
+            if textanswer_field is not None:
                 textanswer_identifier = answer_field_id(
                     contribution, questionnaire, question, additional_textanswer=True
                 )
+                textanswer_field = copy.deepcopy(textanswer_field)
+                textanswer_field.relate_to(identifier)
                 self.fields[textanswer_identifier] = textanswer_field
@@ -1,10 +1,13 @@
 import datetime
+from dataclasses import replace
 from fractions import Fraction
 from functools import partial
 from unittest.mock import patch
 
+from django.core.cache import caches
+from django.db import connection, transaction
 from django.test import RequestFactory
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from model_bakery import baker
 
@@ -12,7 +15,9 @@ from evap.evaluation.models import (
     NO_ANSWER,
     Answer,
     Contribution,
+    Course,
     Evaluation,
+    EvaluationCounter,
     QuestionAssignment,
     Questionnaire,
     QuestionType,
@@ -23,8 +28,18 @@ from evap.evaluation.models import (
     VoteTimestamp,
 )
 from evap.evaluation.tests.tools import FuzzyInt, WebTest, WebTestWith200Check
+from evap.evaluation.tools import invalidate_start_pages
+from evap.results.tools import cache_results
 from evap.student.tools import answer_field_id, parse_answer_field_id
-from evap.student.views import SUCCESS_MAGIC_STRING, get_vote_page_form_groups
+from evap.student.views import (
+    GLOBAL_EVALUATION_PROGRESS_MAX_AGE,
+    GLOBAL_EVALUATION_PROGRESS_REFRESH_LOCK_KEY,
+    GLOBAL_EVALUATION_PROGRESS_VERSION_KEY,
+    SUCCESS_MAGIC_STRING,
+    GlobalEvaluationProgress,
+    get_index_data,
+    get_vote_page_form_groups,
+)
 
 
 class TestStudentIndexView(WebTestWith200Check):
@@ -57,6 +72,70 @@ class TestStudentIndexView(WebTestWith200Check):
         with self.assertNumQueries(FuzzyInt(0, 100)):
             self.app.get(self.url, user=self.user)
 
+    def test_num_queries_is_independent_of_history(self):
+        def make_history(semester_count, courses_per_semester):
+            for semester in baker.make(Semester, _quantity=semester_count):
+                for course in baker.make(Course, semester=semester, _quantity=courses_per_semester):
+                    baker.make(
+                        Evaluation,
+                        course=course,
+                        state=Evaluation.State.PUBLISHED,
+                        participants=[self.user],
+                        voters=[self.user],
+                        _participant_count=10,
+                        _voter_count=10,
+                        name_en=iter(["first", "second"]),
+                        name_de=iter(["erste", "zweite"]),
+                        _quantity=2,
+                    )
+            for evaluation in Evaluation.objects.filter(state=Evaluation.State.PUBLISHED):
+                cache_results(evaluation)
+
+        def count_queries():
+            # measure the uncached page
+            invalidate_start_pages()
+            invalidate_start_pages([self.user.pk])
+            with CaptureQueriesContext(connection) as context:
+                self.app.get(self.url, user=self.user)
+            return len(context.captured_queries)
+
+        make_history(1, 1)
+        count_queries()  # warm up the global evaluation progress and the session
+        num_queries_before = count_queries()
+
+        make_history(5, 10)
+        self.assertEqual(count_queries(), num_queries_before)
+
+    def test_index_data_is_cached(self):
+        other_user = baker.make(UserProfile, email="other@institution.example.com")
+        self.evaluation.participants.add(other_user)
+        self.app.get(self.url, user=self.user)
+        self.app.get(self.url, user=other_user)
+
+        with patch("evap.student.views.get_index_data", wraps=get_index_data) as mock:
+            self.app.get(self.url, user=self.user)
+            mock.assert_not_called()
+
+            new_evaluation = baker.make(Evaluation, course__semester=self.semester, state=Evaluation.State.PREPARED)
+            mock.reset_mock()
+            new_evaluation.participants.add(self.user)
+            page = self.app.get(self.url, user=self.user)
+            mock.assert_called_once()
+            self.assertIn(new_evaluation.full_name, page)
+
+            # participation changes only affect the participants
+            self.app.get(self.url, user=other_user)
+            mock.reset_mock()
+            new_evaluation.participants.add(baker.make(UserProfile))
+            self.app.get(self.url, user=other_user)
+            mock.assert_not_called()
+
+            # state changes affect everyone
+            new_evaluation.reset_to_new(delete_previous_answers=False)
+            new_evaluation.save()
+            self.app.get(self.url, user=other_user)
+            mock.assert_called_once()
+
     @override_settings(
         GLOBAL_EVALUATION_PROGRESS_REWARDS=[
             (Fraction(1, 10), {"de": "a dog", "en": "a dog"}),
@@ -101,6 +180,8 @@ class TestStudentIndexView(WebTestWith200Check):
         ]
 
         baker.make(VoteTimestamp, evaluation=included_evaluations[0])
+        # bulk creation adds the participations without sending m2m_changed
+        Evaluation.recalculate_live_counts(list(Evaluation.objects.values_list("pk", flat=True)))
 
         expected_participants = sum(e.num_participants for e in included_evaluations)
         expected_voters = sum(e.num_voters for e in included_evaluations)
@@ -144,11 +225,77 @@ class TestStudentIndexView(WebTestWith200Check):
             _participant_count=97,
             state=Evaluation.State.EVALUATED,
         )
+        caches["default"].delete(GLOBAL_EVALUATION_PROGRESS_VERSION_KEY)
         page = self.app.get(self.url, user=self.user)
         self.assertIn("89 of 97 evaluations submitted (91%)", page)  # 91% is intentionally rounded down
         self.assertIn("7%", page)
         self.assertIn("a dog", page)
 
+    @override_settings(GLOBAL_EVALUATION_PROGRESS_REWARDS=[(Fraction("0.5"), {"de": "a dog", "en": "a dog"})])
+    def test_global_evaluation_progress_snapshot(self):
+        users = baker.make(UserProfile, _quantity=4, _bulk_create=True)
+        evaluation = baker.make(
+            Evaluation, course__semester=self.semester, participants=users, state=Evaluation.State.IN_EVALUATION
+        )
+        with patch.object(
+            GlobalEvaluationProgress, "create_snapshot", wraps=GlobalEvaluationProgress.create_snapshot
+        ) as create_snapshot_mock:
+            self.assertIn("0 of 4 evaluations submitted", self.app.get(self.url, user=self.user))
+            self.assertEqual(create_snapshot_mock.call_count, 1)
+
+            # the snapshot is shared until a vote or its age triggers a refresh
+            evaluation.voters.add(users[0])
+            self.assertIn("0 of 4 evaluations submitted", self.app.get(self.url, user=self.user))
+            self.assertEqual(create_snapshot_mock.call_count, 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                transaction.on_commit(partial(GlobalEvaluationProgress.refresh_after_vote, self.semester))
+            self.assertIn("1 of 4 evaluations submitted", self.app.get(self.url, user=self.user))
+            self.assertEqual(create_snapshot_mock.call_count, 2)
+
+            # votes within the refresh interval are coalesced into one more refresh after the interval
+            evaluation.voters.add(users[1])
+            GlobalEvaluationProgress.refresh_after_vote(self.semester)
+            evaluation.voters.add(users[2])
+            GlobalEvaluationProgress.refresh_after_vote(self.semester)
+            self.assertIn("1 of 4 evaluations submitted", self.app.get(self.url, user=self.user))
+            self.assertEqual(create_snapshot_mock.call_count, 2)
+            caches["default"].delete(GLOBAL_EVALUATION_PROGRESS_REFRESH_LOCK_KEY)
+            self.assertIn("3 of 4 evaluations submitted", self.app.get(self.url, user=self.user))
+            self.assertEqual(create_snapshot_mock.call_count, 3)
+            caches["default"].delete(GLOBAL_EVALUATION_PROGRESS_REFRESH_LOCK_KEY)
+            self.assertIn("3 of 4 evaluations submitted", self.app.get(self.url, user=self.user))
+            self.assertEqual(create_snapshot_mock.call_count, 3)
+
+            # outdated snapshots are refreshed
+            evaluation.voters.add(users[3])
+            version = caches["default"].get(GLOBAL_EVALUATION_PROGRESS_VERSION_KEY)
+            snapshot = caches["default"].get(GlobalEvaluationProgress.snapshot_cache_key(version))
+            outdated = snapshot.created_at - GLOBAL_EVALUATION_PROGRESS_MAX_AGE - datetime.timedelta(seconds=1)
+            caches["default"].set(
+                GlobalEvaluationProgress.snapshot_cache_key(version), replace(snapshot, created_at=outdated)
+            )
+            self.assertIn("4 of 4 evaluations submitted", self.app.get(self.url, user=self.user))
+            self.assertEqual(create_snapshot_mock.call_count, 4)
+
+    @override_settings(GLOBAL_EVALUATION_PROGRESS_REWARDS=[(Fraction("0.5"), {"de": "a dog", "en": "a dog"})])
+    def test_global_evaluation_progress_snapshot_is_not_replaced_by_older_one(self):
+        older_snapshot = GlobalEvaluationProgress.create_snapshot(self.semester)
+        baker.make(
+            Evaluation,
+            course__semester=self.semester,
+            _voter_count=1,
+            _participant_count=2,
+            state=Evaluation.State.EVALUATED,
+        )
+        newer_snapshot = GlobalEvaluationProgress.refresh_snapshot(self.semester)
+        self.assertEqual(newer_snapshot.vote_count, older_snapshot.vote_count + 1)
+
+        # a concurrent refresh that finishes later with older numbers is stored, but not served
+        with patch.object(GlobalEvaluationProgress, "create_snapshot", return_value=older_snapshot):
+            self.assertEqual(GlobalEvaluationProgress.refresh_snapshot(self.semester), newer_snapshot)
+        self.assertEqual(GlobalEvaluationProgress.get_cached_snapshot(self.semester), newer_snapshot)
+
     @override_settings(
         GLOBAL_EVALUATION_PROGRESS_REWARDS=[],
         GLOBAL_EVALUATION_PROGRESS_CAMPAIGN={
@@ -513,6 +660,29 @@ class TestVoteView(WebTest):
         time = VoteTimestamp.objects.latest("timestamp").timestamp
         self.assertTrue(time_before < time < datetime.datetime.now())
 
+    def test_vote_invalidates_start_page(self):
+        self.app.get(reverse("student:index"), user=self.voting_user1)
+        form = self.app.get(self.url, user=self.voting_user1, status=200).forms["student-vote-form"]
+        self.fill_form(form)
+
+        with patch("evap.student.views.get_index_data", wraps=get_index_data) as mock:
+            form.submit()
+            self.app.get(reverse("student:index"), user=self.voting_user1)
+        mock.assert_called_once()
+
+    def test_reward_point_failures_keep_the_vote(self):
+        form = self.app.get(self.url, user=self.voting_user1, status=200).forms["student-vote-form"]
+        self.fill_form(form)
+
+        with (
+            patch("evap.rewards.tools.grant_reward_points_if_eligible", side_effect=RuntimeError),
+            self.assertRaises(RuntimeError),
+        ):
+            form.submit()
+
+        self.assertTrue(self.evaluation.voters.filter(pk=self.voting_user1.pk).exists())
+        self.assertEqual(EvaluationCounter.objects.get(evaluation=self.evaluation).voter_count, 1)
+
     def test_user_cannot_vote_multiple_times(self):
         page = self.app.get(self.url, user=self.voting_user1, status=200)
         form = page.forms["student-vote-form"]
@@ -640,6 +810,54 @@ class TestVoteView(WebTest):
             get_vote_page_form_groups(request, self.evaluation, preview=False, dropout=False)
             self.assertEqual(mock.call_count, 0)
 
+    def test_vote_page_form_groups_num_queries(self):
+        def count_form_group_queries():
+            request = RequestFactory().get(reverse("student:vote", args=[self.evaluation.id]))
+            request.user = self.voting_user1
+            with CaptureQueriesContext(connection) as context:
+                form_groups = get_vote_page_form_groups(request, self.evaluation, preview=False, dropout=False)
+                for form_group in form_groups.values():
+                    for form in form_group:
+                        str(form)
+            return len(context.captured_queries)
+
+        query_count = count_form_group_queries()
+        baker.make(
+            Contribution,
+            evaluation=self.evaluation,
+            contributor=iter(baker.make(UserProfile, delegates=[self.voting_user2], _quantity=15)),
+            questionnaires=[self.contributor_questionnaire],
+            _quantity=15,
+        )
+        self.assertEqual(count_form_group_queries(), query_count)
+
+    def test_voting_forms_do_not_share_fields(self):
+        request = RequestFactory().get(reverse("student:vote", args=[self.evaluation.id]))
+        request.user = self.voting_user1
+        form_groups = get_vote_page_form_groups(request, self.evaluation, preview=False, dropout=False)
+        form1, form2 = form_groups[self.contribution1][0], form_groups[self.contribution2][0]
+
+        question = self.contributor_likert_assignment.question
+        field1 = form1.fields[answer_field_id(self.contribution1, self.contributor_questionnaire, question)]
+        field2 = form2.fields[answer_field_id(self.contribution2, self.contributor_questionnaire, question)]
+        self.assertIsNot(field1, field2)
+        self.assertIsNot(field1.widget, field2.widget)
+
+        textanswer_field1 = form1.fields[
+            answer_field_id(self.contribution1, self.contributor_questionnaire, question, additional_textanswer=True)
+        ]
+        textanswer_field2 = form2.fields[
+            answer_field_id(self.contribution2, self.contributor_questionnaire, question, additional_textanswer=True)
+        ]
+        self.assertEqual(
+            textanswer_field1.widget.attrs["related_answer_field_id"],
+            answer_field_id(self.contribution1, self.contributor_questionnaire, question),
+        )
+        self.assertEqual(
+            textanswer_field2.widget.attrs["related_answer_field_id"],
+            answer_field_id(self.contribution2, self.contributor_questionnaire, question),
+        )
+
 
 class TestDropoutView(WebTest):
     @classmethod
@@ -744,6 +962,7 @@ class TestDropoutView(WebTest):
         self.evaluation = Evaluation.objects.get(pk=self.evaluation.pk)
 
         self.assertEqual(self.evaluation.dropout_count, 1, "dropout count should increment with dropout")
+        self.assertEqual(EvaluationCounter.objects.get(evaluation=self.evaluation).voter_count, 1)
 
         form = self.app.get(url=reverse("student:vote", args=[self.evaluation.id]), user=self.user2, status=200).forms[
             "student-vote-form"
@@ -4,12 +4,14 @@ from collections import OrderedDict
 from collections.abc import Iterable
 from dataclasses import dataclass
 from fractions import Fraction
+from functools import partial
 
 from django.conf import settings
 from django.contrib import messages
+from django.core.cache import caches
 from django.core.exceptions import PermissionDenied, SuspiciousOperation
 from django.db import transaction
-from django.db.models import Exists, F, Max, OuterRef, Sum
+from django.db.models import Exists, F, Max, OuterRef, Prefetch, Sum
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
@@ -22,24 +24,43 @@ from evap.evaluation.models import (
     NO_ANSWER,
     Contribution,
     Evaluation,
+    EvaluationManager,
+    QuestionAssignment,
     Questionnaire,
     RatingAnswerCounter,
     Semester,
     TextAnswer,
     VoteTimestamp,
 )
-from evap.evaluation.tools import translate
+from evap.evaluation.tools import (
+    START_PAGE_CACHE_TIMEOUT,
+    get_start_page_cache_key,
+    invalidate_start_pages,
+    translate,
+)
 from evap.results.tools import (
     annotate_distributions_and_grades,
     get_evaluations_with_course_result_attributes,
+    get_results_for_average_distributions,
     textanswers_visible_to,
 )
-from evap.student.forms import QuestionnaireVotingForm
+from evap.student.forms import QuestionnaireVotingForm, question_assignments_with_questions
 from evap.student.models import TextAnswerWarning
 from evap.student.tools import answer_field_id
+from evap.tools import assert_not_none
 
 SUCCESS_MAGIC_STRING = "vote submitted successfully"
 
+GLOBAL_EVALUATION_PROGRESS_CACHE_KEY = "global_evaluation_progress"
+GLOBAL_EVALUATION_PROGRESS_VERSION_KEY = "global_evaluation_progress_version"
+GLOBAL_EVALUATION_PROGRESS_REFRESH_LOCK_KEY = "global_evaluation_progress_refresh_lock"
+GLOBAL_EVALUATION_PROGRESS_REFRESH_PENDING_KEY = "global_evaluation_progress_refresh_pending"
+GLOBAL_EVALUATION_PROGRESS_MAX_AGE = datetime.timedelta(minutes=1)
+GLOBAL_EVALUATION_PROGRESS_REFRESH_INTERVAL = datetime.timedelta(seconds=10)
+GLOBAL_EVALUATION_PROGRESS_SNAPSHOT_TIMEOUT = datetime.timedelta(days=1)
+# number of the latest snapshot versions among which the one with the most votes is served
+GLOBAL_EVALUATION_PROGRESS_KEPT_SNAPSHOTS = 5
+
 
 @dataclass
 class GlobalEvaluationProgress:
@@ -63,27 +84,35 @@ class GlobalEvaluationProgress:
         info_text_en: str
         info_text = translate(en="info_text_en", de="info_text_de")
 
+    @dataclass(frozen=True)
+    class Snapshot:
+        semester_id: int
+        vote_count: int
+        participation_count: int
+        last_vote_datetime: datetime.datetime | None
+        created_at: datetime.datetime
+
+        @property
+        def age(self) -> datetime.timedelta:
+            return datetime.datetime.now() - self.created_at
+
     vote_count: int
     participation_count: int
     max_reward_votes: int
-    bar_width_votes: int
-    last_vote_datetime: datetime.datetime
+    last_vote_datetime: datetime.datetime | None
+    snapshot_datetime: datetime.datetime
     rewards_with_progress: list[RewardProgress]
     campaign: Campaign
 
-    @staticmethod
-    def from_settings() -> "GlobalEvaluationProgress | None":
-        if not settings.GLOBAL_EVALUATION_PROGRESS_REWARDS:
-            return None
-
-        if not Semester.active_semester():
-            return None
-
-        language = get_language()
+    @property
+    def bar_width_votes(self) -> int:
+        return min(self.vote_count, self.max_reward_votes)
 
+    @staticmethod
+    def create_snapshot(semester: Semester) -> "GlobalEvaluationProgress.Snapshot":
+        created_at = datetime.datetime.now()
         evaluations = (
-            Semester.active_semester()
-            .evaluations.exclude(state__lt=Evaluation.State.APPROVED)
+            semester.evaluations.exclude(state__lt=Evaluation.State.APPROVED)
             .exclude(is_rewarded=False)
             .exclude(id__in=settings.GLOBAL_EVALUATION_PROGRESS_EXCLUDED_EVALUATION_IDS)
             .exclude(course__type__id__in=settings.GLOBAL_EVALUATION_PROGRESS_EXCLUDED_COURSE_TYPE_IDS)
@@ -96,8 +125,99 @@ class GlobalEvaluationProgress:
             .values()
         )
 
+        last_vote_datetime = VoteTimestamp.objects.filter(evaluation__in=evaluations).aggregate(Max("timestamp"))[
+            "timestamp__max"
+        ]
+
+        return GlobalEvaluationProgress.Snapshot(
+            semester_id=semester.id,
+            vote_count=vote_count,
+            participation_count=participation_count,
+            last_vote_datetime=last_vote_datetime,
+            created_at=created_at,
+        )
+
+    @staticmethod
+    def snapshot_cache_key(version: int) -> str:
+        return f"{GLOBAL_EVALUATION_PROGRESS_CACHE_KEY}_{version}"
+
+    @staticmethod
+    def get_cached_snapshot(semester: Semester) -> "GlobalEvaluationProgress.Snapshot | None":
+        """Returns the snapshot with the most votes among the latest versions, so the numbers never go back in time."""
+        latest_version = caches["default"].get(GLOBAL_EVALUATION_PROGRESS_VERSION_KEY)
+        if latest_version is None:
+            return None
+        keys = [
+            GlobalEvaluationProgress.snapshot_cache_key(version)
+            for version in range(latest_version, max(latest_version - GLOBAL_EVALUATION_PROGRESS_KEPT_SNAPSHOTS, 0), -1)
+        ]
+        snapshots = [
+            snapshot for snapshot in caches["default"].get_many(keys).values() if snapshot.semester_id == semester.id
+        ]
+        return max(snapshots, key=lambda snapshot: (snapshot.vote_count, snapshot.created_at), default=None)
+
+    @staticmethod
+    def refresh_snapshot(semester: Semester) -> "GlobalEvaluationProgress.Snapshot":
+        snapshot = GlobalEvaluationProgress.create_snapshot(semester)
+        # each refresh stores its snapshot under a new version instead of replacing a shared one, so that concurrent
+        # refreshes cannot overwrite a snapshot with an older one
+        caches["default"].add(GLOBAL_EVALUATION_PROGRESS_VERSION_KEY, 0, None)
+        version = caches["default"].incr(GLOBAL_EVALUATION_PROGRESS_VERSION_KEY)
+        caches["default"].set(
+            GlobalEvaluationProgress.snapshot_cache_key(version),
+            snapshot,
+            int(GLOBAL_EVALUATION_PROGRESS_SNAPSHOT_TIMEOUT.total_seconds()),
+        )
+        return GlobalEvaluationProgress.get_cached_snapshot(semester) or snapshot
+
+    @staticmethod
+    def get_snapshot(semester: Semester) -> "GlobalEvaluationProgress.Snapshot":
+        snapshot = GlobalEvaluationProgress.get_cached_snapshot(semester)
+        if snapshot is None:
+            return GlobalEvaluationProgress.refresh_snapshot(semester)
+        # outdated snapshots are still served while a single request refreshes them
+        if (
+            snapshot.age > GLOBAL_EVALUATION_PROGRESS_MAX_AGE
+            or caches["default"].get(GLOBAL_EVALUATION_PROGRESS_REFRESH_PENDING_KEY)
+        ) and GlobalEvaluationProgress.acquire_refresh():
+            return GlobalEvaluationProgress.refresh_snapshot(semester)
+        return snapshot
+
+    @staticmethod
+    def acquire_refresh() -> bool:
+        """Returns whether the caller should refresh the snapshot. Only one caller per refresh interval may do so."""
+        if not caches["default"].add(
+            GLOBAL_EVALUATION_PROGRESS_REFRESH_LOCK_KEY, True, GLOBAL_EVALUATION_PROGRESS_REFRESH_INTERVAL.seconds
+        ):
+            return False
+        # the refresh includes all votes made until now
+        caches["default"].delete(GLOBAL_EVALUATION_PROGRESS_REFRESH_PENDING_KEY)
+        return True
+
+    @staticmethod
+    def refresh_after_vote(semester: Semester) -> None:
+        if not settings.GLOBAL_EVALUATION_PROGRESS_REWARDS or not semester.is_active:
+            return
+        if GlobalEvaluationProgress.acquire_refresh():
+            GlobalEvaluationProgress.refresh_snapshot(semester)
+        else:
+            # votes arriving within the refresh interval are coalesced into one more refresh after the interval
+            caches["default"].set(GLOBAL_EVALUATION_PROGRESS_REFRESH_PENDING_KEY, True, None)
+
+    @staticmethod
+    def from_settings() -> "GlobalEvaluationProgress | None":
+        if not settings.GLOBAL_EVALUATION_PROGRESS_REWARDS:
+            return None
+
+        semester = Semester.active_semester()
+        if not semester:
+            return None
+
+        language = get_language()
+        snapshot = GlobalEvaluationProgress.get_snapshot(semester)
+
         max_reward_vote_ratio, __ = max(settings.GLOBAL_EVALUATION_PROGRESS_REWARDS)
-        max_reward_votes = math.ceil(max_reward_vote_ratio * participation_count)
+        max_reward_votes = math.ceil(max_reward_vote_ratio * snapshot.participation_count)
 
         rewards_with_progress = [
             GlobalEvaluationProgress.RewardProgress(
@@ -106,37 +226,32 @@ class GlobalEvaluationProgress:
             for vote_ratio, text in settings.GLOBAL_EVALUATION_PROGRESS_REWARDS
         ]
 
-        last_vote_datetime = VoteTimestamp.objects.filter(evaluation__in=evaluations).aggregate(Max("timestamp"))[
-            "timestamp__max"
-        ]
-
         return GlobalEvaluationProgress(
-            vote_count=vote_count,
-            participation_count=participation_count,
+            vote_count=snapshot.vote_count,
+            participation_count=snapshot.participation_count,
             max_reward_votes=max_reward_votes,
-            bar_width_votes=min(vote_count, max_reward_votes),
-            last_vote_datetime=last_vote_datetime,
+            last_vote_datetime=snapshot.last_vote_datetime,
+            snapshot_datetime=snapshot.created_at,
             rewards_with_progress=rewards_with_progress,
             campaign=GlobalEvaluationProgress.Campaign(**settings.GLOBAL_EVALUATION_PROGRESS_CAMPAIGN),
         )
 
 
-@participant_required
-def index(request):
+def get_index_data(user):
     query = (
-        Evaluation.objects.annotate(
+        Evaluation.objects.visible_to(user)
+        .annotate(
             participates_in=Exists(
-                Evaluation.participants.through.objects.filter(
-                    evaluation_id=OuterRef("pk"), userprofile_id=request.user.id
-                )
+                Evaluation.participants.through.objects.filter(evaluation_id=OuterRef("pk"), userprofile_id=user.id)
             )
         )
         .annotate(
             voted_for=Exists(
-                Evaluation.voters.through.objects.filter(evaluation_id=OuterRef("pk"), userprofile_id=request.user.id)
+                Evaluation.voters.through.objects.filter(evaluation_id=OuterRef("pk"), userprofile_id=user.id)
             )
         )
-        .filter(course__evaluations__participants=request.user)
+        .annotate(results_page_can_be_seen_by_user=EvaluationManager.results_page_visibility(user))
+        .filter(course__evaluations__participants=user)
         .exclude(state=Evaluation.State.NEW)
         .select_related(
             "course",
@@ -145,30 +260,29 @@ def index(request):
         )
         .prefetch_related(
             "course__grade_documents",
-            "course__evaluations",
+            Prefetch(
+                "course__evaluations",
+                queryset=Evaluation.annotate_with_participant_and_voter_counts(Evaluation.objects.all()),
+            ),
             "course__responsibles",
             "course__programs",
         )
         .distinct()
     )
-    query = Evaluation.annotate_with_participant_and_voter_counts(query)
-    evaluations = [evaluation for evaluation in query if evaluation.can_be_seen_by(request.user)]
-
-    inner_evaluation_ids = [
-        inner_evaluation.id for evaluation in evaluations for inner_evaluation in evaluation.course.evaluations.all()
-    ]
-    inner_evaluation_query = Evaluation.objects.filter(pk__in=inner_evaluation_ids)
-    inner_evaluation_query = Evaluation.annotate_with_participant_and_voter_counts(inner_evaluation_query)
-
-    evaluations_by_id = {evaluation["id"]: evaluation for evaluation in inner_evaluation_query.values()}
-
-    for evaluation in evaluations:
-        for inner_evaluation in evaluation.course.evaluations.all():
-            inner_evaluation.num_voters = evaluations_by_id[inner_evaluation.id]["num_voters"]
-            inner_evaluation.num_participants = evaluations_by_id[inner_evaluation.id]["num_participants"]
-
-    annotate_distributions_and_grades(e for e in evaluations if e.state == Evaluation.State.PUBLISHED)
-    evaluations = get_evaluations_with_course_result_attributes(evaluations)
+    evaluations = list(Evaluation.annotate_with_participant_and_voter_counts(query))
+
+    # the shown evaluations are among their courses' evaluations, so this fetches all needed results at once
+    results_by_evaluation_id = get_results_for_average_distributions(
+        course_evaluation
+        for evaluation in evaluations
+        for course_evaluation in evaluation.course.evaluations.all()
+        if course_evaluation.state == Evaluation.State.PUBLISHED
+    )
+    annotate_distributions_and_grades(
+        (evaluation for evaluation in evaluations if evaluation.state == Evaluation.State.PUBLISHED),
+        results_by_evaluation_id,
+    )
+    evaluations = get_evaluations_with_course_result_attributes(evaluations, results_by_evaluation_id)
 
     # evaluations must be sorted for regrouping them in the template
     evaluations.sort(key=lambda evaluation: (evaluation.course.name, evaluation.name))
@@ -187,7 +301,7 @@ def index(request):
 
     unfinished_evaluations_query = (
         Evaluation.objects.filter(
-            participants=request.user,
+            participants=user,
             state__in=[
                 Evaluation.State.PREPARED,
                 Evaluation.State.EDITOR_APPROVED,
@@ -195,7 +309,7 @@ def index(request):
                 Evaluation.State.IN_EVALUATION,
             ],
         )
-        .exclude(voters=request.user)
+        .exclude(voters=user)
         .prefetch_related("course__responsibles", "course__type", "course__semester")
     )
 
@@ -213,10 +327,24 @@ def index(request):
 
     unfinished_evaluations.sort(key=sorter)
 
-    template_data = {
+    return {
         "semester_list": semester_list,
-        "can_download_grades": request.user.can_download_grades,
         "unfinished_evaluations": unfinished_evaluations,
+    }
+
+
+@participant_required
+def index(request):
+    # the sorting of the evaluations depends on the language
+    cache_key = get_start_page_cache_key("student", request.user.id, get_language())
+    index_data = caches["default"].get(cache_key)
+    if index_data is None:
+        index_data = get_index_data(request.user)
+        caches["default"].set(cache_key, index_data, START_PAGE_CACHE_TIMEOUT.total_seconds())
+
+    template_data = {
+        **index_data,
+        "can_download_grades": request.user.can_download_grades,
         "evaluation_end_warning_period": settings.EVALUATION_END_WARNING_PERIOD,
         "global_evaluation_progress": GlobalEvaluationProgress.from_settings(),
     }
@@ -231,7 +359,11 @@ def create_voting_form(
 
     if preselect_no_answer:
         initial = dict.fromkeys(
-            [answer_field_id(contribution, questionnaire, question) for question in questionnaire.rating_questions],
+            [
+                answer_field_id(contribution, questionnaire, assignment.question)
+                for assignment in question_assignments_with_questions(questionnaire)
+                if assignment.question.is_rating_question
+            ],
             str(NO_ANSWER),
         )
 
@@ -263,7 +395,12 @@ def create_voting_forms(
 def get_vote_page_form_groups(
     request, evaluation: Evaluation, *, preview: bool, dropout: bool
 ) -> OrderedDict[Contribution, list[QuestionnaireVotingForm]]:
-    contributions_to_vote_on = evaluation.contributions.all()
+    contributions_to_vote_on = evaluation.contributions.select_related("contributor").prefetch_related(
+        "contributor__delegates",
+        Prefetch(
+            "questionnaires__question_assignments", queryset=QuestionAssignment.objects.select_related("question")
+        ),
+    )
     # prevent a user from voting on themselves
     if not preview:
         contributions_to_vote_on = contributions_to_vote_on.exclude(contributor=request.user)
@@ -271,7 +408,7 @@ def get_vote_page_form_groups(
     form_groups = OrderedDict()
     for contribution in contributions_to_vote_on:
         questionnaires = contribution.questionnaires.all()
-        if not questionnaires.exists():
+        if not questionnaires:
             continue
         form_groups[contribution] = create_voting_forms(request, contribution, questionnaires, dropout=dropout)
 
@@ -370,6 +507,8 @@ def vote(request: HttpRequest, evaluation_id: int, dropout: bool = False) -> Htt
         # add user to evaluation.voters
         # not using evaluation.voters.add(request.user) since that fails silently when done twice.
         evaluation.voters.through.objects.create(userprofile_id=request.user.pk, evaluation_id=evaluation.pk)
+        # creating the row directly does not send m2m_changed, so the live count is updated here
+        Evaluation.add_to_live_counts("voters", {evaluation.pk: 1})
 
         if dropout:
             Evaluation.objects.filter(pk=evaluation.pk).update(dropout_count=F("dropout_count") + 1)
@@ -377,7 +516,7 @@ def vote(request: HttpRequest, evaluation_id: int, dropout: bool = False) -> Htt
         for contribution, form_group in form_groups.items():
             for questionnaire_form in form_group:
                 questionnaire = questionnaire_form.questionnaire
-                for assignment in questionnaire.question_assignments.all().prefetch_related("question"):
+                for assignment in question_assignments_with_questions(questionnaire):
                     question = assignment.question
                     if question.is_heading_question:
                         continue
@@ -413,6 +552,14 @@ def vote(request: HttpRequest, evaluation_id: int, dropout: bool = False) -> Htt
         RatingAnswerCounter.objects.filter(contribution__evaluation=evaluation).update(id=F("id"))
         TextAnswer.objects.filter(contribution__evaluation=evaluation).update(id=F("id"))
 
+        # receivers can keep data consistent with the vote, e.g. the reward point progress
+        evaluation.vote_recorded.send(
+            sender=Evaluation, user=request.user, evaluation=evaluation, semester=evaluation.course.semester
+        )
+
+        transaction.on_commit(partial(GlobalEvaluationProgress.refresh_after_vote, evaluation.course.semester))
+        invalidate_start_pages([assert_not_none(request.user.pk)])
+
     if not evaluation.can_publish_text_results:
         # enable text result publishing if first user confirmed that publishing is okay or second user voted
         if (
@@ -422,7 +569,10 @@ def vote(request: HttpRequest, evaluation_id: int, dropout: bool = False) -> Htt
         ):
             Evaluation.objects.filter(pk=evaluation.pk).update(can_publish_text_results=True)
 
-    evaluation.evaluation_evaluated.send(sender=Evaluation, request=request, semester=evaluation.course.semester)
+    # failures of the receivers, e.g. while granting reward points, do not affect the committed vote
+    evaluation.evaluation_evaluated.send(
+        sender=Evaluation, request=request, evaluation=evaluation, semester=evaluation.course.semester
+    )
 
     messages.success(request, _("Your vote was recorded."))
     return HttpResponse(SUCCESS_MAGIC_STRING)